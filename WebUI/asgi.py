@@ -3,15 +3,22 @@ import django
 from django.core.asgi import get_asgi_application
 from channels.routing import ProtocolTypeRouter, URLRouter
 from channels.auth import AuthMiddlewareStack
-import core.routing
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'WebUI.settings')
 
 # Initialize Django ASAP
 django.setup()
 
+# Project modules import models, so they load after the app registry
+import core.routing  # noqa: E402
+from core.quota import QuotaMiddleware  # noqa: E402
+from core.container_stats import stats_engine  # noqa: E402
+
+# Container history is kept by the web process, whether or not anyone watches
+stats_engine.start()
+
 application = ProtocolTypeRouter({
-    "http": get_asgi_application(),
+    "http": QuotaMiddleware(get_asgi_application()),
     "websocket": AuthMiddlewareStack(
         URLRouter(
             core.routing.websocket_urlpatterns
@@ -73,7 +73,9 @@ ASGI_APPLICATION = 'WebUI.asgi.application'
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        # The web app and the run_jobs worker must open the same file (docker-compose.yml)
+        'NAME': os.environ.get('DATABASE_PATH', BASE_DIR / 'db.sqlite3'),
+        'OPTIONS': {'timeout': 20},  # seconds to wait on the other process's write lock
     }
 }
 
@@ -107,6 +109,12 @@ STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]
 # Media files (user uploads)
 MEDIA_URL = '/user-files/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'user_data')
+STORAGES = {
+    'default': {'BACKEND': 'core.storage.DedupStorage'},  # content-addressed, see core/storage.py
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+# Hand downloads to nginx's internal MEDIA_URL location, only set behind nginx
+USE_X_ACCEL_REDIRECT = os.environ.get('USE_X_ACCEL_REDIRECT', '') == '1'
 
 # Custom user model
 AUTH_USER_MODEL = 'users.CustomUser'
@@ -129,10 +137,118 @@ CHANNEL_LAYERS = {
     },
 }
 
+# Monitoring
+MONITORING_SAMPLE_INTERVAL = 2  # seconds between shared system stats samples
+SYSTEM_STATS_REFRESH_INTERVAL = 2  # seconds between background snapshot refreshes
+SYSTEM_STATS_MAX_AGE = 10  # seconds before a reader refreshes a stale snapshot inline
+METRICS_RETENTION_TIERS = [  # (resolution, retention) in seconds
+    (1, 3600),         # 1s for 1 hour
+    (10, 86400),       # 10s for 1 day
+    (60, 30 * 86400),  # 1min for 30 days
+]
+METRICS_BACKFILL_SECONDS = 300  # history sent to a newly connected monitoring socket
+CONTAINER_SAMPLE_INTERVAL = 10  # seconds between samples of running containers nobody is watching
+CONTAINER_STATS_POOL_SIZE = 32  # Docker connections per node for container stats, one per watched container
+
+# GPU inventory (nvidia-smi) and device assignment
+NVIDIA_SMI_PATH = os.environ.get('NVIDIA_SMI_PATH', 'nvidia-smi')  # any binary printing the same CSV, e.g. a fake for tests
+GPU_SAMPLE_INTERVAL = 5  # seconds between nvidia-smi samples
+GPU_SAMPLE_TIMEOUT = 10  # seconds before a hung nvidia-smi call is abandoned
+GPU_CONTAINER_MEMORY = 4096  # MB of GPU memory reserved per container when choosing a device
+
+# Docker Engine API (async orchestration client)
+DOCKER_HOST_URL = os.environ.get('DOCKER_HOST', 'unix:///var/run/docker.sock')
+DOCKER_API_VERSION = None  # None uses the daemon's current API version
+DOCKER_API_POOL_SIZE = 10  # keep-alive connections per client
+DOCKER_API_TIMEOUT = 30  # seconds for non-streaming requests
+
+# Scheduling across registered DockerNodes (a single DOCKER_HOST_URL daemon when none are registered)
+SCHEDULER_POLICY = 'spread'  # 'spread' balances load, 'binpack' fills nodes one by one
+NODE_CPU_OVERCOMMIT = 1.0  # reservable cores per physical core
+NODE_MEMORY_OVERCOMMIT = 1.0  # reservable bytes per byte of RAM
+NODE_REFRESH_INTERVAL = 30  # seconds between node capacity refreshes
+
+# Reverse proxy routes to user containers at /u/<username>/<app|jupyter>/ (host ports when unset)
+PROXY_ROUTES_DIR = os.environ.get('PROXY_ROUTES_DIR', '')  # directory of nginx location files, one per container
+PROXY_CONTAINER = os.environ.get('PROXY_CONTAINER', '')  # nginx container sent SIGHUP after routes change
+CONTAINER_NETWORK = os.environ.get('CONTAINER_NETWORK', '')  # Docker network shared by nginx and user containers
+
+# Idle routed containers are suspended and resumed on their next request
+IDLE_SUSPEND_AFTER = 1800  # seconds without activity before suspending, 0 disables
+# 'pause' frees CPU and resumes in milliseconds, but the memory stays resident and reserved on the node;
+# 'checkpoint' writes the container to disk and frees its memory and reservation (CRIU, experimental daemon)
+IDLE_SUSPEND_MODE = 'pause'
+IDLE_CHECK_INTERVAL = 60  # seconds between activity checks
+IDLE_CPU_PERCENT = 1.0  # share of host CPU above which a container counts as active
+IDLE_NETWORK_BYTES = 64 * 1024  # traffic between two checks above which a container counts as active
+IDLE_RESUME_TIMEOUT = 60  # seconds a request waits for its container to resume
+
+# Background jobs (manage.py run_jobs)
+JOB_CONCURRENCY = {  # concurrent jobs per kind and worker
+    'pull': 2,
+    'lifecycle': 8,
+    'model': 1,
+    'bulk': 16,  # fleet-wide operations, kept apart so they cannot starve users' own jobs
+}
+JOB_POLL_INTERVAL = 1  # seconds between queue polls
+JOB_HEARTBEAT_INTERVAL = 10  # seconds between heartbeats of running jobs
+JOB_STALE_AFTER = 60  # seconds without heartbeat before another worker requeues a job
+CONTAINER_EVENT_FLUSH_INTERVAL = 1  # seconds between bulk writes of container events
+CONTAINER_RESYNC_INTERVAL = 300  # seconds between full reconciles of container status
+
+# Local image index
+IMAGE_CACHE_TTL = 86400  # seconds before a pulled tag is pulled again
+IMAGE_SYNC_INTERVAL = 300  # seconds between index syncs with the daemon
+IMAGE_PREWARM = [  # pulled when the job worker starts
+    'jupyter/tensorflow-notebook:latest',
+]
+
+# Warm pool of pre-created Jupyter containers
+JUPYTER_POOL_MIN = 2  # idle containers kept even without demand
+JUPYTER_POOL_MAX = 10  # upper bound on idle containers, 0 disables the pool
+JUPYTER_POOL_DEMAND_WINDOW = 900  # seconds of claims used to size the pool
+JUPYTER_POOL_REFILL_INTERVAL = 60  # seconds between periodic refills
+
 # File upload settings
 FILE_UPLOAD_MAX_MEMORY_SIZE = 10485760  # 10MB
 DATA_UPLOAD_MAX_MEMORY_SIZE = 10485760  # 10MB
 FILE_UPLOAD_PERMISSIONS = 0o644
+FILE_UPLOAD_HANDLERS = [
+    'core.quota.QuotaUploadHandler',  # rejects over-quota uploads before they are read
+    'core.storage.HashingMemoryFileUploadHandler',
+    'core.storage.HashingTemporaryFileUploadHandler',
+]
+STORAGE_RECONCILE_INTERVAL = 3600  # seconds between storage ledger scans
+BLOB_GC_INTERVAL = 300  # seconds between indexing new files and dropping links of removed ones
+
+# Workspace index, kept in sync with files written from containers
+WORKSPACE_SYNC_DEBOUNCE = 2  # seconds of quiet before changed paths are written
+WORKSPACE_SYNC_MAX_DELAY = 10  # seconds a change may wait during a long burst
+WORKSPACE_SYNC_BATCH = 500  # rows per bulk write
+WORKSPACE_DISCOVERY_INTERVAL = 30  # seconds between checks for new workspaces
+WORKSPACE_SCAN_INTERVAL = 3600  # seconds between full reconcile scans
+
+# Resumable chunked uploads
+UPLOAD_CHUNK_SIZE = 8388608  # 8MB, default chunk size offered to clients
+UPLOAD_CHUNK_SIZE_MAX = 67108864  # 64MB, largest chunk size a client may pick
+UPLOAD_SESSION_EXPIRY = 86400  # seconds without a chunk before a session is dropped
+
+# Model validation and conversion jobs
+MODEL_VALIDATION_TIMEOUT = 300  # seconds to load a newly uploaded model and run a sample batch
+MODEL_VARIANT_KINDS = ['onnx', 'int8', 'fp16']  # variants built by the conversion job
+MODEL_AUTO_CONVERT = False  # convert every model once it passes validation
+MODEL_CONVERSION_TIMEOUT = 1800  # seconds for exporting, quantizing and benchmarking one model
+MODEL_BENCHMARK_RUNS = 20  # timed forward passes per artifact, the median is kept
+# Largest output deviation from the source, relative to the source's largest output, a variant may show
+MODEL_VARIANT_TOLERANCE = {'onnx': 1e-4, 'fp16': 1e-2, 'int8': 5e-2}
+
+# Model serving
+SERVING_MAX_BATCH_SIZE = 32  # rows gathered into one forward pass
+SERVING_MAX_BATCH_WAIT = 0.005  # seconds the first request of a batch waits for company
+SERVING_WORKER_THREADS = 1  # intra-op threads per model worker process
+SERVING_LOAD_TIMEOUT = 120  # seconds a worker may take to load its model
+SERVING_REQUEST_TIMEOUT = 60  # seconds before a queued prediction is abandoned
+SERVING_MEMORY_BUDGET = 8589934592  # 8GB, resident memory shared by all loaded models; each user is also held to ram_limit
 
 # Custom storage paths
 def get_user_dir(user):
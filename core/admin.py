@@ -1,12 +1,55 @@
-from django.contrib import admin
-from .models import DockerContainer, UserFile
+from django.contrib import admin, messages
+from django.urls import reverse
+from .bulk import BulkError, batch_progress, start_batch
+from .models import APIToken, DockerContainer, DockerNode, UserFile, Job
+
+@admin.register(DockerNode)
+class DockerNodeAdmin(admin.ModelAdmin):
+    list_display = ('name', 'url', 'enabled', 'cpu_total', 'memory_total', 'last_seen')
+    list_filter = ('enabled',)
+
+def bulk_action(action, description):
+    """Admin action queueing `action` for every selected container as one JobBatch"""
+    def run(modeladmin, request, queryset):
+        try:
+            batch = start_batch(action, queryset.select_related('user'), request.user, selection={'admin': True})
+        except BulkError as e:
+            modeladmin.message_user(request, str(e), messages.ERROR)
+            return
+        modeladmin.message_user(
+            request, f"Queued {batch_progress(batch)['total']} jobs, progress at {reverse('bulk-status', args=[batch.pk])}"
+        )
+    run.__name__ = f"bulk_{action}"
+    run.short_description = description
+    return run
+
 
 @admin.register(DockerContainer)
 class DockerContainerAdmin(admin.ModelAdmin):
-    list_display = ('user', 'image_name', 'status', 'created_at')
-    list_filter = ('status',)
+    list_display = ('user', 'image_name', 'node', 'status', 'gpu_devices', 'created_at')
+    list_filter = ('status', 'node')
+    actions = [
+        bulk_action('start', "Start selected containers"),
+        bulk_action('stop', "Stop selected containers"),
+        bulk_action('restart', "Restart selected containers"),
+        bulk_action('suspend', "Suspend selected containers"),
+        bulk_action('recreate', "Recreate selected containers from their image"),
+    ]
 
 @admin.register(UserFile)
 class UserFileAdmin(admin.ModelAdmin):
     list_display = ('user', 'filename', 'uploaded_at')
-    list_filter = ('user',)
\ No newline at end of file
+    list_filter = ('user',)
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('action', 'kind', 'user', 'status', 'created_at', 'finished_at')
+    list_filter = ('status', 'kind')
+
+@admin.register(APIToken)
+class APITokenAdmin(admin.ModelAdmin):
+    list_display = ('user', 'name', 'created_at', 'last_used_at')
+    exclude = ('key_hash',)
+
+    def has_add_permission(self, request):
+        return False  # keys are issued to their user once, from the api-tokens view
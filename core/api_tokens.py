@@ -0,0 +1,29 @@
+import hashlib
+import secrets
+from django.utils import timezone
+from .models import APIToken
+
+SCHEME = 'Bearer'
+
+
+def token_hash(key):
+    return hashlib.sha256(key.encode()).hexdigest()
+
+def issue_token(user, name):
+    """Creates a token; the key is only returned here, the table keeps its hash"""
+    key = secrets.token_urlsafe(32)
+    token = APIToken.objects.create(user=user, name=name, key_hash=token_hash(key))
+    return token, key
+
+def token_user(request):
+    """Active user of the request's `Authorization: Bearer <key>` header, or None"""
+    scheme, _, key = request.headers.get('Authorization', '').partition(' ')
+    if scheme != SCHEME or not key.strip():
+        return None
+    token = APIToken.objects.select_related('user').filter(
+        key_hash=token_hash(key.strip()), user__is_active=True
+    ).first()
+    if token is None:
+        return None
+    APIToken.objects.filter(pk=token.pk).update(last_used_at=timezone.now())
+    return token.user
@@ -0,0 +1,151 @@
+import os
+import stat
+import tarfile
+import time
+import zipfile
+import zlib
+
+READ_SIZE = 1024 * 1024
+FLUSH_SIZE = 1024 * 1024  # bytes gathered before a chunk is handed to the response
+# Formats that gain nothing from another deflate pass
+COMPRESSED_EXTENSIONS = {
+    '.zip', '.gz', '.tgz', '.bz2', '.xz', '.zst', '.7z', '.rar',
+    '.jpg', '.jpeg', '.png', '.gif', '.webp', '.mp3', '.mp4', '.mkv', '.mov', '.avi', '.ogg',
+    '.h5', '.pt', '.pth', '.safetensors', '.onnx', '.pb', '.tflite', '.npz', '.parquet',
+}
+ZIP_EPOCH = 315532800  # 1980-01-01, the earliest date a zip entry can hold
+FORMATS = {
+    'zip': ('application/zip', 'zip'),
+    'tar': ('application/x-tar', 'tar'),
+    'tar.gz': ('application/gzip', 'tar.gz'),
+}
+
+
+class StreamBuffer:
+    """Write-only, unseekable file object collecting archive bytes until drained"""
+
+    def __init__(self):
+        self.chunks = []
+        self.size = 0
+        self.position = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.size += len(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        self.size = 0
+        return data
+
+
+def lstat(path):
+    """lstat, or None for a file deleted since it was listed"""
+    try:
+        return os.lstat(path)
+    except FileNotFoundError:
+        return None
+
+def expand(entries):
+    """
+    Resolves (archive name, path) pairs, walking directories. Symlinks are
+    skipped so an archive cannot reach outside the selected trees, and so
+    are files deleted while the archive is being made.
+    """
+    for arcname, path in entries:
+        st = lstat(path)
+        if st is None:
+            continue
+        if stat.S_ISREG(st.st_mode):
+            yield arcname, path, st
+        elif stat.S_ISDIR(st.st_mode):
+            for dirpath, dirnames, filenames in os.walk(path):
+                dirnames.sort()
+                for filename in sorted(filenames):
+                    full = os.path.join(dirpath, filename)
+                    st = lstat(full)
+                    if st is not None and stat.S_ISREG(st.st_mode):
+                        yield os.path.join(arcname, os.path.relpath(full, path)), full, st
+
+def open_members(entries):
+    """
+    expand() with each file opened before its header is written: a file
+    deleted afterwards stays readable, so the archive is never cut short.
+    """
+    for arcname, path, st in expand(entries):
+        try:
+            f = open(path, 'rb')
+        except FileNotFoundError:
+            continue
+        with f:
+            yield arcname, f, st
+
+def read_chunks(f):
+    while chunk := f.read(READ_SIZE):
+        yield chunk
+
+def stream_zip(entries, compress=True):
+    """Yields a zip archive of `entries`; entries are stored when already compressed"""
+    buffer = StreamBuffer()
+    with zipfile.ZipFile(buffer, 'w', allowZip64=True) as archive:
+        for arcname, f, st in open_members(entries):
+            info = zipfile.ZipInfo(arcname, time.localtime(max(st.st_mtime, ZIP_EPOCH))[:6])
+            info.file_size = st.st_size
+            store = not compress or os.path.splitext(arcname)[1].lower() in COMPRESSED_EXTENSIONS
+            info.compress_type = zipfile.ZIP_STORED if store else zipfile.ZIP_DEFLATED
+            with archive.open(info, 'w') as member:
+                for chunk in read_chunks(f):
+                    member.write(chunk)
+                    if buffer.size >= FLUSH_SIZE:
+                        yield buffer.drain()
+            yield buffer.drain()
+    yield buffer.drain()
+
+def stream_tar(entries, compress=True):
+    """Yields a tar (optionally gzipped) archive of `entries`, written block by block"""
+    gzip = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+
+    def out(data):
+        return gzip.compress(data) if gzip else data
+
+    written = 0
+    for arcname, f, st in open_members(entries):
+        info = tarfile.TarInfo(arcname)
+        info.size = st.st_size
+        info.mtime = st.st_mtime
+        info.mode = st.st_mode & 0o777
+        header = info.tobuf(format=tarfile.PAX_FORMAT)
+        pending = [out(header)]
+        written += len(header)
+        copied = 0
+        for chunk in read_chunks(f):
+            chunk = chunk[:info.size - copied]  # the file may grow while it is read
+            copied += len(chunk)
+            pending.append(out(chunk))
+            yield b''.join(pending)
+            pending = []
+        if copied < info.size:
+            raise OSError(f"{f.name} shrank while being archived")
+        padding = -info.size % tarfile.BLOCKSIZE
+        written += info.size + padding
+        yield b''.join(pending) + out(b'\0' * padding)
+    end = tarfile.BLOCKSIZE * 2
+    end += -(written + end) % tarfile.RECORDSIZE
+    yield out(b'\0' * end) + (gzip.flush() if gzip else b'')
+
+def stream_archive(entries, fmt='zip', compress=True):
+    """Yields the non-empty chunks of an archive in one of FORMATS"""
+    if fmt == 'zip':
+        chunks = stream_zip(entries, compress)
+    else:
+        chunks = stream_tar(entries, compress=(fmt == 'tar.gz'))
+    return (chunk for chunk in chunks if chunk)
@@ -0,0 +1,109 @@
+from collections import Counter
+from django.db import transaction
+from django.utils import timezone
+from . import proxy
+from .image_cache import needs_pull
+from .jobs import enqueue, enqueue_pull
+from .models import DockerContainer, JobBatch
+
+ACTIONS = ('start', 'stop', 'restart', 'delete', 'suspend', 'recreate')
+
+
+class BulkError(Exception):
+    pass
+
+
+def select_containers(container_type=None, usernames=None, node=None, status=None):
+    """Containers a bulk operation applies to; `node` is a DockerNode name, '' for the default daemon"""
+    containers = DockerContainer.objects.select_related('user', 'node').exclude(status='removed')
+    if container_type:
+        containers = containers.filter(container_type=container_type)
+    if usernames:
+        containers = containers.filter(user__username__in=usernames)
+    if node is not None:
+        containers = containers.filter(node__isnull=True) if node == '' else containers.filter(node__name=node)
+    if status:
+        containers = containers.filter(status=status)
+    return containers
+
+def container_jobs(batch, action, container, image_name=None):
+    """
+    Queues the jobs of one container's share of a bulk operation; returns them.
+    Steps are chained with depends_on, so a failed step fails the rest. Keys
+    are scoped to the batch: a job queued earlier runs first (see claim_next),
+    so reusing it could put a restart's start before its stop.
+    """
+    user, container_type = container.user, container.container_type
+
+    def step(name, depends_on=None, **params):
+        return enqueue(
+            name, user=user,
+            dedup_key=f"{name}:{user.id}:{container_type}:{batch.pk}",
+            depends_on=depends_on,
+            kind='bulk',
+            container_type=container_type, **params
+        )
+
+    if action == 'restart':
+        stop = step('stop')
+        return [stop, step('start', depends_on=stop)]
+    if action == 'recreate':
+        image_name = image_name or container.image_name
+        # One pull per image, shared by every container of the batch
+        pull = enqueue_pull(image_name) if needs_pull(image_name) else None
+        jobs = [pull] if pull else []
+        if container_type == 'jupyter':
+            return jobs + [step('jupyter_start', depends_on=pull, image_name=image_name)]
+        create = step('create', depends_on=pull, image_name=image_name)
+        jobs.append(create)
+        if container.status == 'running' or container.suspended_at:
+            jobs.append(step('start', depends_on=create))
+        return jobs
+    return [step(action)]
+
+def start_batch(action, containers, user=None, image_name=None, selection=None):
+    """
+    Fans `action` out over `containers` as one JobBatch. The jobs run on
+    run_jobs workers, at most JOB_CONCURRENCY['bulk'] at a time per worker.
+    """
+    if action not in ACTIONS:
+        raise BulkError(f"Unknown action {action}, expected one of {', '.join(ACTIONS)}")
+    if image_name and action != 'recreate':
+        raise BulkError("An image can only be given to recreate")
+    if action == 'suspend' and not proxy.enabled():
+        raise BulkError("Suspending needs the proxy (PROXY_ROUTES_DIR and CONTAINER_NETWORK), nothing would resume the containers")
+    with transaction.atomic():
+        batch = JobBatch.objects.create(user=user, action=action, params={
+            'image_name': image_name, 'selection': selection or {}
+        })
+        for container in containers:
+            batch.jobs.add(*container_jobs(batch, action, container, image_name))
+    return batch
+
+def batch_progress(batch):
+    """Job counts by status, elapsed time and the error of every failed job"""
+    jobs = batch.jobs.select_related('user')
+    counts = Counter(jobs.values_list('status', flat=True))
+    active = counts['queued'] + counts['running']
+    finished = jobs.order_by('-finished_at').values_list('finished_at', flat=True).first() if not active else None
+    return {
+        'id': str(batch.pk),
+        'action': batch.action,
+        'params': batch.params,
+        'total': sum(counts.values()),
+        'queued': counts['queued'],
+        'running': counts['running'],
+        'done': counts['done'],
+        'failed': counts['failed'],
+        'finished': not active,
+        'elapsed': ((finished or timezone.now()) - batch.created_at).total_seconds(),
+        'errors': [
+            {
+                'user': job.user.username if job.user else None,
+                'container_type': job.params.get('container_type'),
+                'action': job.action,
+                'message': job.message,
+            }
+            for job in jobs.filter(status='failed')
+        ],
+    }
@@ -1,58 +1,69 @@
 import json
-import psutil
-from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncWebsocketConsumer
+from .sampler import sampler
+from .container_stats import stats_engine
+from .metrics_store import metrics_store, host_key, container_key
 from .models import DockerContainer
-import docker
-import asyncio
+from .orchestrator import operations_group
 
 class MonitoringConsumer(AsyncWebsocketConsumer):
     async def connect(self):
+        await self.channel_layer.group_add(sampler.group, self.channel_name)
         await self.accept()
-        while True:
-            data = await self.get_system_stats()
-            await self.send(text_data=json.dumps(data))
-            await asyncio.sleep(2)  # Update every 2 seconds
-
-    @database_sync_to_async
-    def get_system_stats(self):
-        client = docker.from_env()
-        stats = {
-            'cpu': psutil.cpu_percent(),
-            'memory': psutil.virtual_memory().percent,
-            'containers': len(client.containers.list()),
-            'active_users': DockerContainer.objects.filter(status='running').count()
-        }
-        return stats
+        sampler.subscribe()
+        await self.send(text_data=json.dumps(
+            dict(metrics_store.query(host_key()), type='history')
+        ))
+        if sampler.latest:
+            await self.send(text_data=json.dumps(sampler.latest))
+
+    async def disconnect(self, close_code):
+        sampler.unsubscribe()
+        await self.channel_layer.group_discard(sampler.group, self.channel_name)
+
+    async def monitoring_stats(self, event):
+        await self.send(text_data=json.dumps(event['stats']))
+
+@database_sync_to_async
+def owns_container(user, container_id):
+    return DockerContainer.objects.filter(user=user, container_id=container_id).exists()
 
 class ContainerConsumer(AsyncWebsocketConsumer):
     async def connect(self):
         self.container_id = self.scope['url_route']['kwargs']['container_id']
+        user = self.scope['user']
+        # Stats and history of a container are for its owner only, as in metrics_history
+        if not user.is_authenticated or not await owns_container(user, self.container_id):
+            await self.close()
+            return
+        await self.accept()
+        await self.send(text_data=json.dumps(
+            dict(metrics_store.query(container_key(self.container_id)), type='history')
+        ))
+        latest = stats_engine.subscribe(self.container_id, self.send_stats)
+        if latest:
+            await self.send_stats(latest)
+
+    async def disconnect(self, close_code):
+        stats_engine.unsubscribe(self.container_id, self.send_stats)
+
+    async def send_stats(self, data):
+        await self.send(text_data=json.dumps(data))
+
+class OperationConsumer(AsyncWebsocketConsumer):
+    async def connect(self):
+        user = self.scope['user']
+        if not user.is_authenticated:
+            await self.close()
+            return
+        self.group_name = operations_group(user.id)
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
         await self.accept()
-        
-        while True:
-            data = await self.get_container_stats()
-            if data:
-                await self.send(text_data=json.dumps(data))
-            await asyncio.sleep(1)  # Update every second
-
-    @database_sync_to_async
-    def get_container_stats(self):
-        try:
-            client = docker.from_env()
-            container = client.containers.get(self.container_id)
-            stats = container.stats(stream=False)
-            
-            # CPU calculation
-            cpu_stats = stats['cpu_stats']
-            cpu_delta = cpu_stats['cpu_usage']['total_usage'] - stats['precpu_stats']['cpu_usage']['total_usage']
-            system_delta = cpu_stats['system_cpu_usage'] - stats['precpu_stats']['system_cpu_usage']
-            cpu_percent = (cpu_delta / system_delta) * 100 if system_delta > 0 else 0
-            
-            return {
-                'cpu': round(cpu_percent, 2),
-                'memory': stats['memory_stats']['usage'] / (1024 * 1024),  # MB
-                'network': stats['networks']['eth0']['rx_bytes'] / (1024 * 1024)  # MB
-            }
-        except:
-            return None
\ No newline at end of file
+
+    async def disconnect(self, close_code):
+        if hasattr(self, 'group_name'):
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+
+    async def operation_progress(self, event):
+        await self.send(text_data=json.dumps(event))
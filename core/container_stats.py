@@ -0,0 +1,179 @@
+import asyncio
+import functools
+import logging
+import threading
+from channels.db import database_sync_to_async
+from django.conf import settings
+from .docker_api import DockerAPI
+from .docker_utils import calculate_container_stats
+from .metrics_store import metrics_store, container_key
+from .models import DockerContainer
+
+logger = logging.getLogger(__name__)
+
+RETRY_DELAY = 2  # seconds before reopening a stream that ended while still watched
+
+
+def container_node(container_id):
+    """DockerNode holding a container, None for the default daemon"""
+    row = DockerContainer.objects.select_related('node').filter(container_id=container_id).first()
+    return row.node if row else None
+
+def container_rows():
+    """(running containers, ids of every container that still exists)"""
+    rows = DockerContainer.objects.select_related('node').exclude(status='removed')
+    running = [row for row in rows if row.status == 'running' and row.suspended_at is None]
+    return running, {row.container_id for row in rows}
+
+
+class ContainerStatsStream:
+    """
+    Keeps one streaming stats request open for a container, on whichever
+    node holds it, and fans every decoded sample out to the subscribed sockets.
+    """
+
+    def __init__(self, engine, container_id):
+        self.engine = engine
+        self.container_id = container_id
+        self.callbacks = {}  # async callback -> event loop of its socket
+        self.task = None
+
+    async def run(self):
+        while True:
+            try:
+                node = await database_sync_to_async(container_node)(self.container_id)
+                api = self.engine.orchestrator.node_api(node)
+                async for raw in api.container_stats_stream(self.container_id):
+                    self.publish(self.engine.record(self.container_id, raw))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Stats stream for {self.container_id} failed: {e}")
+            await asyncio.sleep(RETRY_DELAY)
+
+    def publish(self, sample):
+        for callback, loop in list(self.callbacks.items()):
+            asyncio.run_coroutine_threadsafe(self.deliver(callback, sample), loop)
+
+    async def deliver(self, callback, sample):
+        try:
+            await callback(sample)
+        except Exception as e:
+            logger.error(f"Stats delivery failed: {e}")
+
+
+class ContainerStatsEngine:
+    """
+    Process-wide registry of container stats streams, one per watched container.
+
+    Streams run on a background thread with its own event loop and talk to
+    the daemons through an Orchestrator's clients, so containers scheduled
+    on any DockerNode are covered and socket handlers never wait on Docker.
+    Every CONTAINER_SAMPLE_INTERVAL the running containers nobody watches
+    are sampled once, so their history exists too, and the series of
+    containers that were deleted are dropped.
+    """
+
+    def __init__(self):
+        self.streams = {}
+        self.samples = {}  # container id -> latest sample
+        self.loop = None
+        self.orchestrator = None
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self.loop = asyncio.new_event_loop()
+            self._thread = threading.Thread(target=self._run, name='container-stats', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        from .orchestrator import Orchestrator
+        asyncio.set_event_loop(self.loop)
+        # A client pool of its own: every open stream holds a connection
+        self.orchestrator = Orchestrator(
+            api_factory=functools.partial(DockerAPI, pool_size=settings.CONTAINER_STATS_POOL_SIZE)
+        )
+        self.loop.create_task(self.sample_loop())
+        self.loop.run_forever()
+
+    async def sample_loop(self):
+        while True:
+            try:
+                await self.sample()
+            except Exception as e:
+                logger.error(f"Container stats sampling failed: {e}")
+            await asyncio.sleep(settings.CONTAINER_SAMPLE_INTERVAL)
+
+    async def sample(self):
+        running, existing = await database_sync_to_async(container_rows)()
+        prefix = container_key('')
+        for key in metrics_store.keys():
+            if key.startswith(prefix) and key[len(prefix):] not in existing:
+                metrics_store.drop(key)
+        with self._lock:
+            watched = set(self.streams)
+        ids = {row.container_id for row in running}
+        for container_id in set(self.samples) - ids - watched:
+            del self.samples[container_id]
+        rows = [row for row in running if row.container_id not in watched]
+        # Each call takes a second or two at the daemon; the client pool bounds how many run at once
+        results = await asyncio.gather(
+            *(self.orchestrator.node_api(row.node).container_stats(row.container_id) for row in rows),
+            return_exceptions=True
+        )
+        for row, raw in zip(rows, results):
+            if isinstance(raw, Exception):
+                logger.error(f"Stats of {row.container_id[:12]} failed: {raw}")
+            elif row.container_id not in self.streams:
+                self.record(row.container_id, raw)
+
+    def record(self, container_id, raw):
+        sample = calculate_container_stats(raw)
+        sample['status'] = 'running'
+        self.samples[container_id] = sample
+        metrics_store.record(container_key(container_id), {
+            'cpu': sample['cpu'],
+            'memory_percent': sample['memory_percent'],
+            'network_rx': sample['network_rx'],
+            'network_tx': sample['network_tx']
+        })
+        return sample
+
+    def subscribe(self, container_id, callback):
+        """Registers an async callback and opens the stream on first subscriber"""
+        self.start()
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            stream = self.streams.get(container_id)
+            if stream is None:
+                stream = self.streams[container_id] = ContainerStatsStream(self, container_id)
+                self.loop.call_soon_threadsafe(self._open, stream)
+            stream.callbacks[callback] = loop
+        return self.samples.get(container_id)
+
+    def unsubscribe(self, container_id, callback):
+        with self._lock:
+            stream = self.streams.get(container_id)
+            if stream is None:
+                return
+            stream.callbacks.pop(callback, None)
+            if not stream.callbacks:
+                del self.streams[container_id]
+                self.loop.call_soon_threadsafe(self._close, stream)
+
+    def _open(self, stream):
+        stream.task = self.loop.create_task(stream.run())
+
+    def _close(self, stream):
+        if stream.task:
+            stream.task.cancel()
+
+    def latest(self, container_id):
+        return self.samples.get(container_id)
+
+
+stats_engine = ContainerStatsEngine()
@@ -0,0 +1,282 @@
+import asyncio
+import json
+import logging
+from urllib.parse import urlencode, urlparse, quote
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+READ_SIZE = 65536
+
+
+class DockerAPIError(Exception):
+    def __init__(self, status, message):
+        super().__init__(f"{status}: {message}")
+        self.status = status
+        self.message = message
+
+
+class DockerAPI:
+    """
+    Minimal asyncio client for the Docker Engine API.
+
+    Speaks HTTP/1.1 over the daemon's Unix socket (or tcp://) and keeps a
+    small pool of keep-alive connections, so concurrent operations never
+    tie up a thread. An instance belongs to the event loop that first uses it.
+    """
+
+    def __init__(self, base_url=None, pool_size=None, api_version=None):
+        self.base_url = base_url or settings.DOCKER_HOST_URL
+        self.api_version = api_version or settings.DOCKER_API_VERSION
+        self.pool_size = pool_size or settings.DOCKER_API_POOL_SIZE
+        self._idle = []
+        self._slots = asyncio.Semaphore(self.pool_size)
+
+    # Connection pool
+
+    async def _connect(self):
+        url = urlparse(self.base_url)
+        if url.scheme == 'unix':
+            return await asyncio.open_unix_connection(url.path)
+        return await asyncio.open_connection(url.hostname, url.port or 2375)
+
+    async def _acquire(self):
+        await self._slots.acquire()
+        while self._idle:
+            reader, writer = self._idle.pop()
+            if not writer.is_closing() and not reader.at_eof():
+                return reader, writer, True
+            writer.close()
+        try:
+            return (*await self._connect(), False)
+        except Exception:
+            self._slots.release()
+            raise
+
+    def _release(self, conn, reusable):
+        reader, writer = conn
+        if reusable and not writer.is_closing():
+            self._idle.append((reader, writer))
+        else:
+            writer.close()
+        self._slots.release()
+
+    async def close(self):
+        while self._idle:
+            self._idle.pop()[1].close()
+
+    # HTTP
+
+    def _request_head(self, method, path, params, data, content_type):
+        prefix = f"/v{self.api_version}" if self.api_version else ''
+        if params:
+            query = {k: v for k, v in params.items() if v is not None}
+            path = f"{path}?{urlencode(query, doseq=True)}"
+        lines = [
+            f"{method} {prefix}{path} HTTP/1.1",
+            "Host: docker",
+            "User-Agent: webui",
+            f"Content-Length: {len(data)}",
+        ]
+        if data:
+            lines.append(f"Content-Type: {content_type}")
+        return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+
+    async def _send(self, method, path, params=None, body=None):
+        """Sends a request and returns (conn, status, headers) once the head is read"""
+        data = json.dumps(body).encode() if body is not None else b''
+        head = self._request_head(method, path, params, data, 'application/json')
+
+        for attempt in range(2):
+            reader, writer, reused = await self._acquire()
+            try:
+                writer.write(head + data)
+                await writer.drain()
+                status_line = await reader.readline()
+                if not status_line:
+                    raise ConnectionResetError('Connection closed by daemon')
+                status = int(status_line.split(b' ', 2)[1])
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    key, _, value = line.decode('latin-1').partition(':')
+                    headers[key.strip().lower()] = value.strip()
+                return (reader, writer), status, headers
+            except (ConnectionError, asyncio.IncompleteReadError):
+                self._release((reader, writer), False)
+                # A pooled keep-alive connection may have been closed by the daemon
+                if not reused or attempt:
+                    raise
+            except BaseException:
+                self._release((reader, writer), False)
+                raise
+
+    async def _iter_body(self, reader, status, headers):
+        if status in (204, 304):
+            return
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            while True:
+                size = int((await reader.readline()).split(b';')[0].strip() or b'0', 16)
+                if size == 0:
+                    while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                        pass
+                    return
+                yield await reader.readexactly(size)
+                await reader.readexactly(2)
+        elif 'content-length' in headers:
+            remaining = int(headers['content-length'])
+            while remaining:
+                chunk = await reader.read(min(READ_SIZE, remaining))
+                if not chunk:
+                    raise asyncio.IncompleteReadError(b'', remaining)
+                remaining -= len(chunk)
+                yield chunk
+        else:
+            while True:
+                chunk = await reader.read(READ_SIZE)
+                if not chunk:
+                    return
+                yield chunk
+
+    def _reusable(self, status, headers):
+        framed = (status in (204, 304) or 'content-length' in headers
+                  or 'chunked' in headers.get('transfer-encoding', '').lower())
+        return framed and headers.get('connection', '').lower() != 'close'
+
+    async def request(self, method, path, params=None, body=None, timeout=None):
+        """Performs a request and returns the decoded JSON body (or None)"""
+        async def _do():
+            conn, status, headers = await self._send(method, path, params, body)
+            reusable = False
+            try:
+                payload = b''.join([chunk async for chunk in self._iter_body(conn[0], status, headers)])
+                reusable = self._reusable(status, headers)
+            finally:
+                self._release(conn, reusable)
+            if status >= 400:
+                raise api_error(status, payload)
+            if payload and headers.get('content-type', '').startswith('application/json'):
+                return json.loads(payload)
+            return payload or None
+
+        return await asyncio.wait_for(_do(), timeout or settings.DOCKER_API_TIMEOUT)
+
+    async def stream(self, method, path, params=None, body=None):
+        """Yields each JSON object of a streaming response (pulls, events, stats)"""
+        conn, status, headers = await self._send(method, path, params, body)
+        reusable = False
+        try:
+            if status >= 400:
+                payload = b''.join([chunk async for chunk in self._iter_body(conn[0], status, headers)])
+                raise api_error(status, payload)
+            buffer = b''
+            async for chunk in self._iter_body(conn[0], status, headers):
+                buffer += chunk
+                *lines, buffer = buffer.split(b'\n')
+                for line in lines:
+                    if line.strip():
+                        yield json.loads(line)
+            if buffer.strip():
+                yield json.loads(buffer)
+            reusable = self._reusable(status, headers)
+        finally:
+            self._release(conn, reusable)
+
+    # Engine endpoints
+
+    async def ping(self):
+        return await self.request('GET', '/_ping')
+
+    async def info(self):
+        return await self.request('GET', '/info')
+
+    async def images_list(self):
+        return await self.request('GET', '/images/json')
+
+    async def image_inspect(self, name):
+        return await self.request('GET', f"/images/{quote(name, safe='/:@')}/json")
+
+    def image_pull(self, name):
+        image, tag = split_image(name)
+        return self.stream('POST', '/images/create', params={'fromImage': image, 'tag': tag})
+
+    async def containers_list(self, all=False, filters=None):
+        return await self.request('GET', '/containers/json', params={
+            'all': int(all),
+            'filters': json.dumps(filters) if filters else None
+        })
+
+    async def container_create(self, name, config):
+        return await self.request('POST', '/containers/create', params={'name': name}, body=config)
+
+    async def container_inspect(self, container):
+        return await self.request('GET', f"/containers/{container}/json")
+
+    async def container_start(self, container, checkpoint=None):
+        return await self.request('POST', f"/containers/{container}/start", params={'checkpoint': checkpoint})
+
+    async def container_stop(self, container, timeout=10):
+        # The daemon only answers after the grace period, so wait a bit longer than it
+        return await self.request('POST', f"/containers/{container}/stop", params={'t': timeout},
+                                  timeout=timeout + settings.DOCKER_API_TIMEOUT)
+
+    async def container_update(self, container, resources):
+        return await self.request('POST', f"/containers/{container}/update", body=resources)
+
+    async def container_rename(self, container, name):
+        return await self.request('POST', f"/containers/{container}/rename", params={'name': name})
+
+    async def container_pause(self, container):
+        return await self.request('POST', f"/containers/{container}/pause")
+
+    async def container_unpause(self, container):
+        return await self.request('POST', f"/containers/{container}/unpause")
+
+    async def container_stats(self, container):
+        # Not one-shot: the daemon takes two readings, so precpu_stats gives a CPU delta
+        return await self.request('GET', f"/containers/{container}/stats", params={'stream': 0})
+
+    def container_stats_stream(self, container):
+        # One sample per second until the container stops; holds a pooled connection while open
+        return self.stream('GET', f"/containers/{container}/stats", params={'stream': 1})
+
+    async def checkpoint_create(self, container, name, exit=True):
+        # CRIU checkpoints need a daemon with experimental features enabled
+        return await self.request('POST', f"/containers/{container}/checkpoints", body={
+            'CheckpointID': name, 'Exit': exit
+        })
+
+    async def checkpoint_delete(self, container, name):
+        return await self.request('DELETE', f"/containers/{container}/checkpoints/{name}")
+
+    async def container_kill(self, container, signal='KILL'):
+        return await self.request('POST', f"/containers/{container}/kill", params={'signal': signal})
+
+    async def container_remove(self, container, force=False):
+        return await self.request('DELETE', f"/containers/{container}", params={'force': int(force)})
+
+    def events(self, filters=None, since=None):
+        return self.stream('GET', '/events', params={
+            'filters': json.dumps(filters) if filters else None,
+            'since': since
+        })
+
+
+def api_error(status, payload):
+    try:
+        message = json.loads(payload).get('message', '')
+    except ValueError:
+        message = payload.decode(errors='replace')
+    return DockerAPIError(status, message)
+
+
+def split_image(name):
+    """Splits `repo[:tag]` / `repo@digest` into the (fromImage, tag) pull parameters"""
+    if '@' in name:
+        return name, None
+    repo, _, tag = name.rpartition(':')
+    if not repo or '/' in tag:
+        return name, 'latest'
+    return repo, tag
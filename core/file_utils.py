@@ -1,15 +1,52 @@
+import mimetypes
 import os
 import shutil
+from urllib.parse import quote
 from django.conf import settings
+from django.http import FileResponse, HttpResponse
 from users.models import CustomUser
 
+# Content types of the files mimetypes reports as an encoding of another type
+ENCODING_CONTENT_TYPES = {
+    'br': 'application/x-brotli',
+    'bzip2': 'application/x-bzip2',
+    'compress': 'application/x-compress',
+    'gzip': 'application/gzip',
+    'xz': 'application/x-xz',
+}
+
+
 def get_user_workspace(user):
-    """Returns the absolute path to user's workspace in format User_<ID>_(<USERNAME>)"""
-    return os.path.join(settings.MEDIA_ROOT, f'User_{user.id}_({user.username})')
+    """
+    Returns the absolute path to user's workspace in format user_<ID>_(<USERNAME>),
+    the directory mounted at /workspace in the user's containers
+    """
+    return os.path.join(settings.MEDIA_ROOT, f'user_{user.id}_({user.username})')
 
 def ensure_workspace_exists(user):
     """Creates user workspace if it doesn't exist with the new naming format"""
     workspace = get_user_workspace(user)
     if not os.path.exists(workspace):
         os.makedirs(workspace)
-    return workspace
\ No newline at end of file
+    return workspace
+
+def serve_file(file_field, filename):
+    """
+    Download response for a stored file.
+
+    With USE_X_ACCEL_REDIRECT Django only authorizes the request and nginx
+    sends the file from its internal MEDIA_URL location, handling Range
+    requests and sendfile; otherwise the file is streamed by Django.
+    """
+    if not settings.USE_X_ACCEL_REDIRECT:
+        return FileResponse(file_field.open('rb'), as_attachment=True, filename=filename)
+
+    content_type, encoding = mimetypes.guess_type(filename)
+    # Like FileResponse: a .gz download is the compressed file itself, which
+    # browsers would silently decompress if it were sent as Content-Encoding
+    if encoding:
+        content_type = ENCODING_CONTENT_TYPES.get(encoding, 'application/octet-stream')
+    response = HttpResponse(content_type=content_type or 'application/octet-stream')
+    response['Content-Disposition'] = f"attachment; filename*=UTF-8''{quote(filename)}"
+    response['X-Accel-Redirect'] = quote(settings.MEDIA_URL + file_field.name)
+    return response
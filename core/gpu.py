@@ -0,0 +1,167 @@
+import logging
+import subprocess
+import threading
+import time
+from collections import Counter
+from django.conf import settings
+from django.db import transaction
+from .models import DockerContainer
+
+logger = logging.getLogger(__name__)
+
+# Container statuses whose processes can hold GPU memory; stopped containers hold none
+HOLDING_STATUSES = ('created', 'running', 'paused')
+# The name goes last: it is the only field that could contain a comma
+QUERY_FIELDS = (
+    'index', 'uuid', 'utilization.gpu', 'memory.total', 'memory.used', 'memory.free', 'temperature.gpu', 'name'
+)
+
+
+def number(value):
+    """nvidia-smi reports fields a device does not support as [N/A]"""
+    try:
+        return float(value) if '.' in value else int(value)
+    except ValueError:
+        return None
+
+def parse_devices(output):
+    """Devices from `nvidia-smi --query-gpu=QUERY_FIELDS --format=csv,noheader,nounits`, one line per GPU"""
+    devices = []
+    for line in output.splitlines():
+        fields = [field.strip() for field in line.split(',', len(QUERY_FIELDS) - 1)]
+        if len(fields) != len(QUERY_FIELDS):
+            continue
+        index, uuid, utilization, total, used, free, temperature, name = fields
+        devices.append({
+            'index': int(index),
+            'uuid': uuid,
+            'name': name,
+            'utilization': number(utilization),
+            'memory_total': number(total) or 0,  # MB
+            'memory_used': number(used) or 0,
+            'memory_free': number(free) or 0,
+            'temperature': number(temperature),
+        })
+    return devices
+
+def sample_devices():
+    result = subprocess.run([
+        settings.NVIDIA_SMI_PATH,
+        f"--query-gpu={','.join(QUERY_FIELDS)}",
+        '--format=csv,noheader,nounits'
+    ], capture_output=True, text=True, timeout=settings.GPU_SAMPLE_TIMEOUT, check=True)
+    return parse_devices(result.stdout)
+
+
+class GPUInventory:
+    """
+    Every GPU of the host, sampled with one nvidia-smi call per
+    GPU_SAMPLE_INTERVAL in a background thread; readers get the cached list.
+    When nvidia-smi is missing the host has no GPUs and sampling stops.
+    """
+
+    def __init__(self):
+        self.available = True
+        self._devices = None
+        self._sampled_at = 0
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name='gpu-inventory', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while self.available:
+            time.sleep(settings.GPU_SAMPLE_INTERVAL)
+            self.refresh()
+
+    def refresh(self):
+        try:
+            devices = sample_devices()
+        except FileNotFoundError:
+            logger.info(f"{settings.NVIDIA_SMI_PATH} not found, no GPUs to schedule")
+            self.available = False
+            self._devices = []
+            return
+        except (subprocess.SubprocessError, OSError) as e:
+            logger.error(f"GPU sampling failed: {e}")
+            return
+        self._devices, self._sampled_at = devices, time.time()
+
+    def snapshot(self, max_age=None):
+        """Cached devices, refreshed inline when older than `max_age` (two sample intervals by default)"""
+        if not self.available:
+            return []
+        self.start()
+        if self._devices is None or time.time() - self._sampled_at > (max_age or 2 * settings.GPU_SAMPLE_INTERVAL):
+            self.refresh()
+        return self._devices or []
+
+gpu_inventory = GPUInventory()
+
+
+def device_reservations(exclude=None):
+    """
+    Containers holding each device UUID: those that are or are about to be
+    running. Unlike CPU and memory, a stopped container gives its share back;
+    it keeps its device, which may be crowded when it starts again.
+    """
+    assigned = DockerContainer.objects.filter(status__in=HOLDING_STATUSES).exclude(suspend_mode='checkpoint')
+    if exclude is not None:
+        assigned = assigned.exclude(pk=exclude)
+    counts = Counter()
+    for devices in assigned.values_list('gpu_devices', flat=True):
+        counts.update(devices or [])
+    return counts
+
+def choose_device(devices, reservations, needed):
+    """
+    Device for a container reserving `needed` MB, or None when none has room.
+    Headroom is the lower of the measured free memory and what the slices
+    already handed out leave, so containers that have not allocated yet
+    still count and new ones spread across cards instead of piling up.
+    """
+    best = best_key = None
+    for device in devices:
+        held = reservations[device['uuid']]
+        headroom = min(device['memory_free'], device['memory_total'] - held * needed)
+        if headroom < needed:
+            continue
+        key = (headroom, -held, -(device['utilization'] or 0), -device['index'])
+        if best_key is None or key > best_key:
+            best, best_key = device, key
+    return best
+
+def least_loaded(devices, reservations):
+    """Device with the fewest containers, then the most free memory"""
+    return max(devices, key=lambda device: (-reservations[device['uuid']], device['memory_free'], -device['index']))
+
+def assign_gpu(user, container_type):
+    """
+    Chooses a GPU for the user's container and records it on the
+    DockerContainer row; returns the assigned UUIDs. Returns [] when no GPUs
+    were found, leaving the device choice to the nvidia runtime. When no card
+    has GPU_CONTAINER_MEMORY unreserved the least loaded one is shared, as
+    every card was before GPUs were assigned.
+    """
+    devices = gpu_inventory.snapshot()
+    if not devices:
+        return []
+    with transaction.atomic():
+        row = DockerContainer.objects.select_for_update().filter(user=user, container_type=container_type).first()
+        reservations = device_reservations(exclude=row.pk if row else None)
+        device = choose_device(devices, reservations, settings.GPU_CONTAINER_MEMORY)
+        if device is None:
+            device = least_loaded(devices, reservations)
+            logger.warning(
+                f"No GPU has {settings.GPU_CONTAINER_MEMORY}MB unreserved, "
+                f"{user.username}'s {container_type} container shares GPU {device['index']}"
+            )
+        DockerContainer.objects.update_or_create(
+            user=user, container_type=container_type, defaults={'gpu_devices': [device['uuid']]}
+        )
+    return [device['uuid']]
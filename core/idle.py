@@ -0,0 +1,89 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone as dt_timezone
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.utils import timezone
+from . import proxy
+from .docker_utils import calculate_container_stats
+from .jobs import enqueue_lifecycle
+from .models import DockerContainer
+from .reconciler import UNSET_CONTAINER_ID
+
+logger = logging.getLogger(__name__)
+
+
+def watched_containers():
+    return list(DockerContainer.objects.select_related('user', 'node').filter(
+        status='running', suspended_at__isnull=True, container_type__in=proxy.ROUTED_PORTS
+    ).exclude(container_id=UNSET_CONTAINER_ID))
+
+def record_activity(seen):
+    """Writes {container pk: last active time}; update() leaves updated_at to the reconciler"""
+    for pk, when in seen.items():
+        DockerContainer.objects.filter(pk=pk).update(last_active_at=when)
+
+def suspend_idle(rows):
+    for row in rows:
+        enqueue_lifecycle('suspend', row.user, container_type=row.container_type)
+
+
+class IdleMonitor:
+    """
+    Suspends routed containers that showed no activity for IDLE_SUSPEND_AFTER.
+
+    Every IDLE_CHECK_INTERVAL each running container is sampled: CPU use above
+    IDLE_CPU_PERCENT, more than IDLE_NETWORK_BYTES of traffic since the
+    previous check, or a request in its proxy access log counts as activity.
+    Suspended containers are resumed by the web app on their next request,
+    so this only runs behind the proxy.
+    """
+
+    def __init__(self, orchestrator):
+        self.orchestrator = orchestrator
+        self.traffic = {}  # container id -> rx + tx bytes at the previous check
+
+    async def last_activity(self, row, now):
+        """When the container was last seen active, or None when it was idle since the previous check"""
+        requested = await asyncio.to_thread(proxy.last_request, row.user, row.container_type)
+        api = self.orchestrator.node_api(row.node)
+        stats = calculate_container_stats(await api.container_stats(row.container_id))
+        traffic = (stats['network_rx'] + stats['network_tx']) * 1024 * 1024
+        previous = self.traffic.get(row.container_id)
+        self.traffic[row.container_id] = traffic
+        if requested:
+            return datetime.fromtimestamp(requested, tz=dt_timezone.utc)
+        if previous is None or stats['cpu'] >= settings.IDLE_CPU_PERCENT:
+            return now
+        return now if traffic - previous >= settings.IDLE_NETWORK_BYTES else None
+
+    async def check(self):
+        rows = await database_sync_to_async(watched_containers)()
+        now = timezone.now()
+        # Stats calls take about a second each; the client pool bounds how many run at once
+        results = await asyncio.gather(*(self.last_activity(row, now) for row in rows), return_exceptions=True)
+        seen, idle = {}, []
+        for row, result in zip(rows, results):
+            if isinstance(result, Exception):
+                logger.error(f"Idle check of {row.container_id[:12]} failed: {result}")
+            elif result is not None:
+                seen[row.pk] = result
+            elif row.last_active_at is None:
+                seen[row.pk] = now
+            elif now - row.last_active_at >= timedelta(seconds=settings.IDLE_SUSPEND_AFTER):
+                idle.append(row)
+        self.traffic = {row.container_id: self.traffic[row.container_id] for row in rows if row.container_id in self.traffic}
+        await database_sync_to_async(record_activity)(seen)
+        if idle:
+            logger.info(f"Suspending {len(idle)} idle containers")
+            await database_sync_to_async(suspend_idle)(idle)
+
+    async def run(self):
+        if not proxy.enabled() or settings.IDLE_SUSPEND_AFTER <= 0:
+            return
+        while True:
+            await asyncio.sleep(settings.IDLE_CHECK_INTERVAL)
+            try:
+                await self.check()
+            except Exception as e:
+                logger.error(f"Idle check failed: {e}")
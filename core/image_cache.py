@@ -0,0 +1,76 @@
+import asyncio
+import logging
+from datetime import timedelta
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.utils import timezone
+from .docker_api import split_image
+from .models import DockerImage
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_tag(image_name):
+    """`nginx` -> `nginx:latest`, matching the RepoTags the daemon reports"""
+    image, tag = split_image(image_name)
+    return f"{image}:{tag}" if tag else image
+
+def needs_pull(image_name):
+    """True when the tag is not on the host or was last pulled longer than IMAGE_CACHE_TTL ago"""
+    image = DockerImage.objects.filter(tag=normalize_tag(image_name)).first()
+    if image is None:
+        return True
+    if image.last_pulled_at is None:
+        # Present locally but never pulled by us, e.g. built or loaded on the host
+        return False
+    return timezone.now() - image.last_pulled_at > timedelta(seconds=settings.IMAGE_CACHE_TTL)
+
+def record_pull(image_name, digest, size):
+    DockerImage.objects.update_or_create(tag=normalize_tag(image_name), defaults={
+        'digest': digest,
+        'size': size,
+        'last_pulled_at': timezone.now()
+    })
+
+def record_images(images):
+    """Replaces the index with the daemon's `/images/json` listing, keeping pull times"""
+    seen = set()
+    for image in images:
+        digest = (image.get('RepoDigests') or [image['Id']])[0]
+        for tag in image.get('RepoTags') or []:
+            if tag == '<none>:<none>':
+                continue
+            seen.add(tag)
+            DockerImage.objects.update_or_create(tag=tag, defaults={
+                'digest': digest,
+                'size': image.get('Size', 0)
+            })
+    DockerImage.objects.exclude(tag__in=seen).delete()
+
+
+async def sync_images(api):
+    images = await api.images_list()
+    await database_sync_to_async(record_images)(images)
+
+async def prewarm_images():
+    """Queues pulls for IMAGE_PREWARM so the first launch does not pay for them"""
+    from .jobs import enqueue_pull
+
+    def _enqueue():
+        for image_name in settings.IMAGE_PREWARM:
+            if needs_pull(image_name):
+                enqueue_pull(image_name)
+    await database_sync_to_async(_enqueue)()
+
+async def image_sync_loop(api):
+    """Keeps the index in step with the daemon, prewarming once the first sync ran"""
+    prewarmed = False
+    while True:
+        try:
+            await sync_images(api)
+            if not prewarmed:
+                await prewarm_images()
+                prewarmed = True
+        except Exception as e:
+            logger.error(f"Image index sync failed: {e}")
+        await asyncio.sleep(settings.IMAGE_SYNC_INTERVAL)
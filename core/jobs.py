@@ -0,0 +1,186 @@
+import asyncio
+import logging
+import os
+import socket
+from datetime import timedelta
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+from .models import Job
+from .image_cache import needs_pull
+
+logger = logging.getLogger(__name__)
+
+
+ACTION_KINDS = {  # actions that do not run under the 'lifecycle' limit
+    'pull': 'pull',
+    'validate_model': 'model',
+    'convert_model': 'model',
+}
+
+
+def job_kind(action):
+    return ACTION_KINDS.get(action, 'lifecycle')
+
+def enqueue(action, user=None, dedup_key='', depends_on=None, kind=None, **params):
+    """
+    Queues a job; returns the already active job instead when `dedup_key`
+    matches one. `kind` overrides the action's concurrency class. Jobs with
+    a `container_type` param run after every earlier job of that container.
+    """
+    if dedup_key:
+        existing = Job.objects.filter(dedup_key=dedup_key, status__in=Job.ACTIVE_STATUSES).first()
+        if existing:
+            return existing
+    try:
+        with transaction.atomic():
+            return Job.objects.create(
+                user=user,
+                kind=kind or job_kind(action),
+                action=action,
+                params=params,
+                dedup_key=dedup_key,
+                container=f"{user.id}:{params['container_type']}" if user and 'container_type' in params else '',
+                depends_on=depends_on
+            )
+    except IntegrityError:
+        # Another request queued the same key between our check and insert
+        return Job.objects.get(dedup_key=dedup_key, status__in=Job.ACTIVE_STATUSES)
+
+def enqueue_pull(image_name, user=None):
+    return enqueue('pull', user=user, dedup_key=f"pull:{image_name}", image_name=image_name)
+
+def enqueue_lifecycle(action, user, container_type='regular', **params):
+    return enqueue(
+        action, user=user,
+        dedup_key=f"{action}:{user.id}:{container_type}",
+        container_type=container_type, **params
+    )
+
+def enqueue_with_image(action, user, image_name, container_type='regular', **params):
+    """Queues `action` behind a (shared) pull of `image_name` unless the image is cached"""
+    pull = enqueue_pull(image_name, user) if needs_pull(image_name) else None
+    return enqueue(
+        action, user=user,
+        dedup_key=f"{action}:{user.id}:{container_type}",
+        depends_on=pull,
+        image_name=image_name,
+        container_type=container_type, **params
+    )
+
+def enqueue_model_validation(model):
+    return enqueue(
+        'validate_model', user=model.user,
+        dedup_key=f"validate_model:{model.pk}",
+        model_id=model.pk
+    )
+
+def enqueue_model_conversion(model, kinds):
+    return enqueue(
+        'convert_model', user=model.user,
+        dedup_key=f"convert_model:{model.pk}",
+        model_id=model.pk,
+        kinds=kinds
+    )
+
+def enqueue_pool_refill():
+    return enqueue('pool_refill', dedup_key='pool_refill')
+
+def job_audience(job_id):
+    """User ids to notify about a job: its owner and the owners of jobs waiting on it"""
+    owners = Job.objects.filter(Q(pk=job_id) | Q(depends_on_id=job_id)).values_list('user_id', flat=True)
+    return {user_id for user_id in owners if user_id}
+
+def update_job(job_id, status, message='', result=None):
+    fields = {'message': message}
+    if status != 'progress':
+        fields['status'] = status
+    if status in ('done', 'failed'):
+        fields['finished_at'] = timezone.now()
+        fields['result'] = result
+    Job.objects.filter(pk=job_id).update(**fields)
+
+def claim_next(kind, worker):
+    """
+    Atomically moves the oldest runnable queued job of `kind` to running. A
+    container's job waits while another of its jobs runs or was queued
+    earlier, so a start never overtakes the create still waiting on its pull.
+    """
+    ready = Q(depends_on__isnull=True) | Q(depends_on__status='done')
+    blocked = Job.objects.filter(container=OuterRef('container'), status__in=Job.ACTIVE_STATUSES).filter(
+        Q(status='running') | Q(created_at__lt=OuterRef('created_at'))
+    )
+    candidates = Job.objects.filter(status='queued', kind=kind).filter(ready).filter(
+        Q(container='') | ~Exists(blocked)
+    ).order_by('created_at')
+    for job_id in candidates.values_list('pk', flat=True)[:10]:
+        now = timezone.now()
+        if Job.objects.filter(pk=job_id, status='queued').update(
+            status='running', worker=worker, started_at=now, heartbeat_at=now
+        ):
+            return Job.objects.select_related('user').get(pk=job_id)
+    return None
+
+def maintain(worker, running_ids):
+    """
+    Heartbeats our jobs, requeues jobs nobody heartbeats any more and fails
+    orphaned dependents. Staleness goes by heartbeat age alone: a restarted
+    worker also picks up the jobs its previous run left behind.
+    """
+    now = timezone.now()
+    Job.objects.filter(pk__in=running_ids).update(heartbeat_at=now)
+    Job.objects.filter(
+        status='running', heartbeat_at__lt=now - timedelta(seconds=settings.JOB_STALE_AFTER)
+    ).exclude(pk__in=running_ids).update(status='queued', worker='')
+    Job.objects.filter(status='queued', depends_on__status='failed').update(
+        status='failed', message='Dependency failed', finished_at=now
+    )
+
+
+class JobWorker:
+    """
+    Claims queued jobs and runs them on the orchestrator.
+
+    Each job kind has its own concurrency limit (JOB_CONCURRENCY), so a few
+    multi-GB pulls cannot starve quick start/stop operations.
+    """
+
+    def __init__(self, orchestrator, concurrency=None):
+        self.orchestrator = orchestrator
+        self.concurrency = concurrency or settings.JOB_CONCURRENCY
+        self.name = f"{socket.gethostname()}:{os.getpid()}"
+        self.active = {kind: 0 for kind in self.concurrency}
+        self.running = set()
+
+    async def run(self):
+        logger.info(f"Job worker {self.name} started with {self.concurrency}")
+        last_maintenance = 0
+        loop = asyncio.get_running_loop()
+        while True:
+            if loop.time() - last_maintenance >= settings.JOB_HEARTBEAT_INTERVAL:
+                last_maintenance = loop.time()
+                try:
+                    await database_sync_to_async(maintain)(self.name, list(self.running))
+                except Exception as e:
+                    logger.error(f"Job maintenance failed: {e}")
+
+            for kind, limit in self.concurrency.items():
+                while self.active[kind] < limit:
+                    job = await database_sync_to_async(claim_next)(kind, self.name)
+                    if job is None:
+                        break
+                    self.active[kind] += 1
+                    self.running.add(job.pk)
+                    asyncio.ensure_future(self._execute(job))
+
+            await asyncio.sleep(settings.JOB_POLL_INTERVAL)
+
+    async def _execute(self, job):
+        from .orchestrator import Operation
+        try:
+            await self.orchestrator.run(Operation(job.pk, job.user, job.action, job.params))
+        finally:
+            self.active[job.kind] -= 1
+            self.running.discard(job.pk)
@@ -0,0 +1,132 @@
+import asyncio
+import json
+import logging
+import os
+import shutil
+import uuid
+from datetime import timedelta
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.utils import timezone
+from .models import WarmContainer
+
+logger = logging.getLogger(__name__)
+
+POOL_DIR = '.jupyter_pool'
+CONFIG_MOUNT = '/usr/local/etc/jupyter/jupyter_server_config.d'
+# Slot link -> workspace subdirectory, container path and mode
+SLOT_MOUNTS = {
+    'work': ('jupyter', '/home/jovyan/work', 'rw'),
+    'models': ('models', '/home/jovyan/models', 'ro'),
+    'data': ('data', '/home/jovyan/data', 'ro'),
+}
+
+
+def slot_path(slot):
+    return os.path.join(settings.MEDIA_ROOT, POOL_DIR, slot)
+
+def slot_binds(slot):
+    """
+    Bind mounts of a pool container.
+
+    The workspace mounts point at relative symlinks inside the slot directory;
+    Docker resolves them when the container starts, so a claim can repoint
+    them at the user's workspace after the container was created.
+    """
+    path = slot_path(slot)
+    binds = {
+        os.path.join(path, link): {'bind': bind, 'mode': mode}
+        for link, (_, bind, mode) in SLOT_MOUNTS.items()
+    }
+    binds[os.path.join(path, 'config')] = {'bind': CONFIG_MOUNT, 'mode': 'ro'}
+    return binds
+
+def create_slot(image_name):
+    slot = uuid.uuid4().hex
+    path = slot_path(slot)
+    os.makedirs(os.path.join(path, 'empty'))
+    os.makedirs(os.path.join(path, 'config'))
+    for link in SLOT_MOUNTS:
+        os.symlink('empty', os.path.join(path, link))
+    WarmContainer.objects.create(slot=slot, image_name=image_name)
+    return slot
+
+def mark_ready(slot, container_id):
+    WarmContainer.objects.filter(slot=slot).update(container_id=container_id, status='ready')
+
+def discard_slot(slot):
+    WarmContainer.objects.filter(slot=slot).delete()
+    shutil.rmtree(slot_path(slot), ignore_errors=True)
+
+def attach_workspace(slot, user_dir, token, base_url=None):
+    """Points a claimed slot at the user's workspace and sets the notebook token and URL prefix"""
+    path = slot_path(slot)
+    for link, (subdir, _, _) in SLOT_MOUNTS.items():
+        tmp = os.path.join(path, f".{link}.tmp")
+        if os.path.lexists(tmp):
+            os.remove(tmp)
+        os.symlink(os.path.relpath(os.path.join(user_dir, subdir), path), tmp)
+        os.replace(tmp, os.path.join(path, link))
+    server = {'token': token}
+    if base_url:
+        server['base_url'] = base_url
+    with open(os.path.join(path, 'config', 'webui.json'), 'w') as f:
+        json.dump({'IdentityProvider': {'token': token}, 'ServerApp': server}, f)
+
+def claim_slot(user, image_name):
+    """
+    Atomically claims the oldest ready pool container, or returns None and
+    records the miss, so an empty pool still sees the demand it could not serve
+    """
+    ready = WarmContainer.objects.filter(status='ready', image_name=image_name)
+    for pk in ready.values_list('pk', flat=True)[:5]:
+        if WarmContainer.objects.filter(pk=pk, status='ready').update(
+            status='claimed', user=user, claimed_at=timezone.now()
+        ):
+            return WarmContainer.objects.get(pk=pk)
+    WarmContainer.objects.create(
+        slot=uuid.uuid4().hex, image_name=image_name, status='missed', user=user, claimed_at=timezone.now()
+    )
+    return None
+
+def release_user_slots(user):
+    """
+    Releases slots the user claimed earlier, returning their container ids
+    for removal. The rows stay until their claim leaves the demand window.
+    """
+    claimed = list(WarmContainer.objects.filter(status='claimed', user=user))
+    for warm in claimed:
+        shutil.rmtree(slot_path(warm.slot), ignore_errors=True)
+    WarmContainer.objects.filter(pk__in=[warm.pk for warm in claimed]).update(status='released')
+    return [warm.container_id for warm in claimed]
+
+def demand_since():
+    return timezone.now() - timedelta(seconds=settings.JUPYTER_POOL_DEMAND_WINDOW)
+
+def target_size():
+    """Pool size for the next window: the launches seen in the last one, claimed or missed, within bounds"""
+    demand = WarmContainer.objects.filter(claimed_at__gte=demand_since()).count()
+    return max(settings.JUPYTER_POOL_MIN, min(settings.JUPYTER_POOL_MAX, demand))
+
+def pool_plan(image_name):
+    """Returns (containers to create, ready slots to drop) to reach the target size"""
+    WarmContainer.objects.filter(status__in=('released', 'missed'), claimed_at__lt=demand_since()).delete()
+    pooled = WarmContainer.objects.filter(status__in=('warming', 'ready'), image_name=image_name)
+    missing = target_size() - pooled.count()
+    if missing >= 0:
+        return missing, []
+    surplus = pooled.filter(status='ready').order_by('created_at')[:-missing]
+    return 0, list(surplus.values_list('slot', 'container_id'))
+
+
+async def pool_refill_loop():
+    """Periodically queues a refill so the pool follows demand even without claims"""
+    from .jobs import enqueue_pool_refill
+    if settings.JUPYTER_POOL_MAX <= 0:
+        return
+    while True:
+        try:
+            await database_sync_to_async(enqueue_pool_refill)()
+        except Exception as e:
+            logger.error(f"Queueing pool refill failed: {e}")
+        await asyncio.sleep(settings.JUPYTER_POOL_REFILL_INTERVAL)
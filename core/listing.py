@@ -0,0 +1,72 @@
+import base64
+import json
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+class ListingError(Exception):
+    pass
+
+
+def encode_cursor(value, pk):
+    if hasattr(value, 'isoformat'):
+        value = value.isoformat()
+    return base64.urlsafe_b64encode(json.dumps([value, pk]).encode()).decode()
+
+def decode_cursor(cursor, field):
+    """(sort value, pk) of a cursor; anything a client crafted that is not one raises ListingError"""
+    try:
+        value, pk = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if field.get_internal_type() == 'DateTimeField':
+            # parse_datetime raises TypeError on non-strings and returns None on other formats
+            value = parse_datetime(value) if isinstance(value, str) else None
+        else:
+            value = field.to_python(value)
+        pk = field.model._meta.pk.to_python(pk)
+    except (ValueError, TypeError, ValidationError):
+        raise ListingError("Invalid cursor")
+    if value is None or pk is None:
+        raise ListingError("Invalid cursor")
+    return value, pk
+
+def paginate(queryset, sort, descending=False, cursor=None, limit=PAGE_SIZE):
+    """
+    Keyset pagination on (sort, pk): each page is an index range scan that
+    starts after the cursor, however deep the user has scrolled.
+    Returns (rows, next cursor or None).
+    """
+    field = queryset.model._meta.get_field(sort)
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    if cursor:
+        value, pk = decode_cursor(cursor, field)
+        op = 'lt' if descending else 'gt'
+        queryset = queryset.filter(
+            Q(**{f"{sort}__{op}": value}) | Q(**{sort: value, f"pk__{op}": pk})
+        )
+    prefix = '-' if descending else ''
+    rows = list(queryset.order_by(f"{prefix}{sort}", f"{prefix}pk")[:limit + 1])
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor(getattr(last, sort), last.pk)
+
+def listing_params(request, sorts):
+    """Reads sort, order, prefix search, cursor and limit from the query string"""
+    sort = request.GET.get('sort', 'date')
+    if sort not in sorts:
+        raise ListingError(f"sort must be one of {', '.join(sorts)}")
+    try:
+        limit = int(request.GET.get('limit', PAGE_SIZE))
+    except ValueError:
+        raise ListingError("limit must be a number")
+    return {
+        'sort': sorts[sort],
+        'descending': request.GET.get('order', 'desc' if sort == 'date' else 'asc') == 'desc',
+        'cursor': request.GET.get('cursor'),
+        'limit': limit,
+    }, request.GET.get('q', '')
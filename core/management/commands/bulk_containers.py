@@ -0,0 +1,52 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from core.bulk import ACTIONS, BulkError, batch_progress, select_containers, start_batch
+from core.models import DockerContainer
+
+POLL_INTERVAL = 2  # seconds between progress lines with --wait
+
+
+class Command(BaseCommand):
+    help = 'Queues a start, stop, restart, delete, suspend or recreate for many users\' containers at once'
+
+    def add_arguments(self, parser):
+        parser.add_argument('action', choices=ACTIONS)
+        parser.add_argument('--type', dest='container_type', choices=[t for t, _ in DockerContainer.CONTAINER_TYPES])
+        parser.add_argument('--user', dest='usernames', action='append', help='Only this user, repeatable')
+        parser.add_argument('--node', help="Only containers on this DockerNode, '' for the default daemon")
+        parser.add_argument('--status', help='Only containers in this status, e.g. running')
+        parser.add_argument('--image', dest='image_name', help='Image to recreate containers from, their own by default')
+        parser.add_argument('--dry-run', action='store_true', help='List the selected containers only')
+        parser.add_argument('--wait', action='store_true', help='Report progress until every job finished')
+
+    def handle(self, *args, **options):
+        selection = {
+            key: options[key] for key in ('container_type', 'usernames', 'node', 'status') if options[key] is not None
+        }
+        containers = select_containers(**selection)
+        if options['dry_run']:
+            for container in containers:
+                self.stdout.write(f"{container.user.username} {container.container_type} {container.status} {container.node or 'default'}")
+            self.stdout.write(f"{containers.count()} containers selected")
+            return
+        try:
+            batch = start_batch(options['action'], containers, image_name=options['image_name'], selection=selection)
+        except BulkError as e:
+            raise CommandError(str(e))
+        progress = batch_progress(batch)
+        self.stdout.write(f"Batch {batch.pk}: {progress['total']} jobs queued")
+        if not options['wait']:
+            return
+        while True:
+            progress = batch_progress(batch)
+            self.stdout.write(
+                f"{progress['done']}/{progress['total']} done, {progress['running']} running, "
+                f"{progress['queued']} queued, {progress['failed']} failed ({progress['elapsed']:.0f}s)"
+            )
+            if progress['finished']:
+                break
+            time.sleep(POLL_INTERVAL)
+        for error in progress['errors']:
+            self.stderr.write(f"{error['user']} {error['container_type']} {error['action']}: {error['message']}")
+        if progress['failed']:
+            raise CommandError(f"{progress['failed']} jobs failed")
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from core.quota import reconcile_user
+from users.models import CustomUser
+
+
+class Command(BaseCommand):
+    help = 'Corrects the per-user storage ledger from a filesystem scan'
+
+    def add_arguments(self, parser):
+        parser.add_argument('usernames', nargs='*', help='Users to scan, all users by default')
+
+    def handle(self, *args, **options):
+        users = CustomUser.objects.all()
+        if options['usernames']:
+            users = users.filter(username__in=options['usernames'])
+        for user in users:
+            drift = reconcile_user(user)
+            self.stdout.write(f"{user.username}: corrected by {drift} bytes")
@@ -0,0 +1,37 @@
+import asyncio
+from django.core.management.base import BaseCommand
+from core.idle import IdleMonitor
+from core.image_cache import image_sync_loop
+from core.jobs import JobWorker
+from core.jupyter_pool import pool_refill_loop
+from core.orchestrator import Orchestrator
+from core.quota import storage_reconcile_loop
+from core.reconciler import ContainerReconciler
+from core.scheduler import node_refresh_loop
+from core.storage import blob_gc_loop
+from core.workspace_sync import WorkspaceSync
+
+
+class Command(BaseCommand):
+    help = 'Runs queued image pulls and container lifecycle jobs'
+
+    def handle(self, *args, **options):
+        async def main():
+            orchestrator = Orchestrator()
+            await orchestrator.sync_routes()
+            await asyncio.gather(
+                JobWorker(orchestrator).run(),
+                ContainerReconciler(orchestrator.api).run(),
+                node_refresh_loop(orchestrator),
+                IdleMonitor(orchestrator).run(),
+                image_sync_loop(orchestrator.api),
+                pool_refill_loop(),
+                storage_reconcile_loop(),
+                blob_gc_loop(),
+                WorkspaceSync().run()
+            )
+
+        try:
+            asyncio.run(main())
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from core.workspace_sync import scan_workspace, workspace_roots
+import os
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the workspace index with a full scan of every workspace'
+
+    def handle(self, *args, **options):
+        for user_id, root in workspace_roots().items():
+            if os.path.isdir(root):
+                written, removed = scan_workspace(user_id, root)
+                self.stdout.write(f"user {user_id}: {written} written, {removed} removed")
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from core.jobs import enqueue_model_validation
+from core.models import AIModel
+
+
+class Command(BaseCommand):
+    help = 'Queues validation for models that have not passed it, e.g. uploads made before validation existed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Revalidate ready models as well')
+
+    def handle(self, *args, **options):
+        models = AIModel.objects.select_related('user')
+        if not options['all']:
+            models = models.exclude(status='ready')
+        count = 0
+        for model in models:
+            enqueue_model_validation(model)
+            count += 1
+        self.stdout.write(f"Queued validation for {count} models")
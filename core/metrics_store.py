@@ -0,0 +1,150 @@
+import threading
+import time
+from array import array
+from django.conf import settings
+
+
+class Tier:
+    """
+    Fixed-capacity ring of time buckets at one resolution.
+
+    Buckets are appended in time order and overwritten oldest-first once the
+    ring is full; values are kept as float32 sums so a bucket is the mean of
+    every sample that fell into it.
+    """
+
+    def __init__(self, resolution, retention, metrics):
+        self.resolution = resolution
+        self.retention = retention
+        self.capacity = max(1, int(retention // resolution))
+        self.buckets = array('q')
+        self.counts = array('I')
+        self.sums = {name: array('f') for name in metrics}
+        self.head = 0  # index of the oldest bucket once the ring is full
+
+    def __len__(self):
+        return len(self.buckets)
+
+    def _last_index(self):
+        return (self.head - 1) % len(self.buckets)
+
+    def add(self, ts, values):
+        bucket = int(ts // self.resolution)
+        if self.buckets and self.buckets[self._last_index()] == bucket:
+            i = self._last_index()
+            self.counts[i] += 1
+            for name, total in self.sums.items():
+                total[i] += values.get(name, 0)
+            return
+        if self.buckets and bucket < self.buckets[self._last_index()]:
+            return  # late sample for a bucket that was already closed
+
+        if len(self.buckets) < self.capacity:
+            self.buckets.append(bucket)
+            self.counts.append(1)
+            for name, total in self.sums.items():
+                total.append(values.get(name, 0))
+            self.head = len(self.buckets) % self.capacity
+        else:
+            i = self.head
+            self.buckets[i] = bucket
+            self.counts[i] = 1
+            for name, total in self.sums.items():
+                total[i] = values.get(name, 0)
+            self.head = (self.head + 1) % self.capacity
+
+    def points(self, start, end):
+        """Yields (timestamp, {metric: mean}) in time order within [start, end]"""
+        size = len(self.buckets)
+        offset = self.head if size == self.capacity else 0
+        for n in range(size):
+            i = (offset + n) % size
+            ts = self.buckets[i] * self.resolution
+            if ts < start:
+                continue
+            if ts > end:
+                break
+            count = self.counts[i]
+            yield ts, {name: total[i] / count for name, total in self.sums.items()}
+
+
+class Series:
+    def __init__(self, metrics, tiers):
+        self.metrics = tuple(metrics)
+        self.tiers = [Tier(resolution, retention, self.metrics) for resolution, retention in tiers]
+        self.lock = threading.Lock()
+
+    def add(self, ts, values):
+        with self.lock:
+            for tier in self.tiers:
+                tier.add(ts, values)
+
+    def query(self, start, end, resolution):
+        now = time.time()
+        # Finest tier that is at least as coarse as asked for and still covers `start`
+        tier = self.tiers[-1]
+        for candidate in self.tiers:
+            if candidate.resolution >= resolution and now - candidate.retention <= start:
+                tier = candidate
+                break
+        step = max(resolution, tier.resolution)
+
+        with self.lock:
+            points = list(tier.points(start, end))
+        if step == tier.resolution:
+            return step, [[ts, values] for ts, values in points]
+
+        # Further downsample into `step` sized buckets
+        merged = []
+        for ts, values in points:
+            bucket = ts - ts % step
+            if merged and merged[-1][0] == bucket:
+                merged[-1][2] += 1
+                for name, value in values.items():
+                    merged[-1][1][name] += value
+            else:
+                merged.append([bucket, dict(values), 1])
+        return step, [[ts, {name: value / count for name, value in values.items()}]
+                      for ts, values, count in merged]
+
+
+class MetricsStore:
+    """Per-process store of host and container series with retention tiers"""
+
+    def __init__(self, tiers=None):
+        self.tiers = sorted(tiers or settings.METRICS_RETENTION_TIERS)
+        self.series = {}
+        self._lock = threading.Lock()
+
+    def record(self, key, values, ts=None):
+        series = self.series.get(key)
+        if series is None:
+            with self._lock:
+                series = self.series.setdefault(key, Series(values.keys(), self.tiers))
+        series.add(ts or time.time(), values)
+
+    def query(self, key, start=None, end=None, resolution=None):
+        """Returns {'resolution', 'points'} for `key` between `start` and `end`"""
+        end = end or time.time()
+        start = start if start is not None else end - settings.METRICS_BACKFILL_SECONDS
+        series = self.series.get(key)
+        if series is None:
+            return {'resolution': resolution or self.tiers[0][0], 'points': []}
+        step, points = series.query(start, end, resolution or self.tiers[0][0])
+        return {'resolution': step, 'points': points}
+
+    def keys(self):
+        return list(self.series)
+
+    def drop(self, key):
+        self.series.pop(key, None)
+
+
+def host_key():
+    return 'host'
+
+def container_key(container_id):
+    return f'container:{container_id}'
+
+
+metrics_store = MetricsStore()
@@ -0,0 +1,51 @@
+# Generated by Django 5.2.1 on 2026-10-18 19:40
+
+import core.models
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_alter_aimodel_options_alter_dockercontainer_options_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dockercontainer',
+            name='access_url',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='dockercontainer',
+            name='container_type',
+            field=models.CharField(choices=[('regular', 'Regular Container'), ('jupyter', 'Jupyter Notebook'), ('ai', 'AI Model Service')], default='regular', max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='aimodel',
+            name='framework',
+            field=models.CharField(choices=[('tensorflow', 'TensorFlow'), ('pytorch', 'PyTorch'), ('onnx', 'ONNX'), ('keras', 'Keras')], max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='aimodel',
+            name='model_file',
+            field=models.FileField(upload_to=core.models.user_file_path),
+        ),
+        migrations.AlterField(
+            model_name='dockercontainer',
+            name='container_id',
+            field=models.CharField(default='default_container_id', max_length=64),
+        ),
+        migrations.AlterField(
+            model_name='dockercontainer',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterUniqueTogether(
+            name='dockercontainer',
+            unique_together={('user', 'container_type')},
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.1 on 2026-10-18 19:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DockerImage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tag', models.CharField(max_length=255, unique=True)),
+                ('digest', models.CharField(blank=True, max_length=255)),
+                ('size', models.BigIntegerField(default=0)),
+                ('last_pulled_at', models.DateTimeField(blank=True, null=True)),
+                ('synced_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['tag'],
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.1 on 2026-10-18 19:44
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_dockerimage'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WarmContainer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('slot', models.CharField(max_length=32, unique=True)),
+                ('container_id', models.CharField(blank=True, max_length=64)),
+                ('image_name', models.CharField(max_length=255)),
+                ('status', models.CharField(choices=[('warming', 'Warming'), ('ready', 'Ready'), ('claimed', 'Claimed')], default='warming', max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('claimed_at', models.DateTimeField(blank=True, null=True)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['created_at'],
+            },
+        ),
+    ]
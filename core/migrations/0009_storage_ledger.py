@@ -0,0 +1,23 @@
+# Generated by Django 5.2.1 on 2026-10-18 19:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_uploadsession'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='aimodel',
+            name='size',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='userfile',
+            name='size',
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.1 on 2026-10-18 19:52
+
+import os
+from django.conf import settings
+from django.db import migrations, models
+
+
+def fill_names(apps, schema_editor):
+    UserFile = apps.get_model('core', 'UserFile')
+    for user_file in UserFile.objects.all().iterator():
+        user_file.name = os.path.basename(user_file.file.name)
+        user_file.save(update_fields=['name'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_blob'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userfile',
+            name='name',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.RunPython(fill_names, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='aimodel',
+            index=models.Index(fields=['user', 'created_at'], name='core_aimode_user_id_3a9741_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='aimodel',
+            index=models.Index(fields=['user', 'size'], name='core_aimode_user_id_0f3228_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userfile',
+            index=models.Index(fields=['user', 'uploaded_at'], name='core_userfi_user_id_e00e96_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userfile',
+            index=models.Index(fields=['user', 'name'], name='core_userfi_user_id_fcfe76_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userfile',
+            index=models.Index(fields=['user', 'size'], name='core_userfi_user_id_ce1b1d_idx'),
+        ),
+    ]
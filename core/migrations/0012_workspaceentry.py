@@ -0,0 +1,32 @@
+# Generated by Django 5.2.1 on 2026-10-18 19:54
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_listing_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WorkspaceEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('parent', models.CharField(blank=True, max_length=1024)),
+                ('name', models.CharField(max_length=255)),
+                ('is_dir', models.BooleanField(default=False)),
+                ('size', models.BigIntegerField(default=0)),
+                ('mtime', models.FloatField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='workspace_entries', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'parent', 'size'], name='core_worksp_user_id_aa3626_idx'), models.Index(fields=['user', 'parent', 'mtime'], name='core_worksp_user_id_2a4db8_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'parent', 'name'), name='unique_workspace_entry')],
+            },
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.1 on 2026-10-18 20:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_workspaceentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='aimodel',
+            name='inputs',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AddField(
+            model_name='aimodel',
+            name='outputs',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AddField(
+            model_name='aimodel',
+            name='parameter_count',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='aimodel',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('validating', 'Validating'), ('ready', 'Ready'), ('failed', 'Failed')], default='pending', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='aimodel',
+            name='status_message',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='aimodel',
+            name='validated_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='job',
+            name='kind',
+            field=models.CharField(choices=[('pull', 'Image Pull'), ('lifecycle', 'Container Lifecycle'), ('model', 'Model Processing')], max_length=20),
+        ),
+    ]
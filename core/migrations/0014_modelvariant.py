@@ -0,0 +1,40 @@
+# Generated by Django 5.2.1 on 2026-10-18 20:05
+
+import core.models
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_aimodel_validation'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='aimodel',
+            name='latency_ms',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='ModelVariant',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('onnx', 'ONNX Export'), ('int8', 'Dynamic int8 Quantization'), ('fp16', 'Float16 Weights')], max_length=10)),
+                ('model_file', models.FileField(blank=True, upload_to=core.models.user_file_path)),
+                ('size', models.BigIntegerField(default=0)),
+                ('latency_ms', models.FloatField(blank=True, null=True)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('ready', 'Ready'), ('failed', 'Failed')], default='pending', max_length=20)),
+                ('status_message', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('source', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='variants', to='core.aimodel')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='model_variants', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('source', 'kind')},
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.1 on 2026-10-18 20:13
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_modelvariant'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DockerNode',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('url', models.CharField(max_length=255)),
+                ('public_host', models.CharField(default='localhost', max_length=255)),
+                ('enabled', models.BooleanField(default=True)),
+                ('cpu_total', models.FloatField(default=0)),
+                ('memory_total', models.BigIntegerField(default=0)),
+                ('last_seen', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['name'],
+            },
+        ),
+        migrations.AddField(
+            model_name='dockercontainer',
+            name='node',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='containers', to='core.dockernode'),
+        ),
+    ]
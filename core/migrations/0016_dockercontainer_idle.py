@@ -0,0 +1,28 @@
+# Generated by Django 5.2.1 on 2026-10-18 20:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_dockernode'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dockercontainer',
+            name='last_active_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='dockercontainer',
+            name='resume_seconds',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='dockercontainer',
+            name='suspended_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
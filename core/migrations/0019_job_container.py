@@ -0,0 +1,24 @@
+# Generated by Django 5.2.1 on 2026-10-18 20:40
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_dockercontainer_gpu_devices'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='container',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddIndex(
+            model_name='job',
+            index=models.Index(fields=['container', 'status'], name='core_job_contain_5229fe_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-18 20:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0019_job_container'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dockercontainer',
+            name='suspend_mode',
+            field=models.CharField(blank=True, max_length=20),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-18 20:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0020_dockercontainer_suspend_mode'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='warmcontainer',
+            name='status',
+            field=models.CharField(choices=[('warming', 'Warming'), ('ready', 'Ready'), ('claimed', 'Claimed'), ('released', 'Released'), ('missed', 'Missed')], default='warming', max_length=20),
+        ),
+    ]
@@ -0,0 +1,354 @@
+"""
+Framework loaders and converters for uploaded models.
+
+Kept free of Django imports: this module is the entry point of serving and
+conversion worker processes, which are spawned rather than forked from the
+web server.
+"""
+import multiprocessing
+import os
+import statistics
+import time
+import numpy as np
+
+
+class ModelRuntimeError(Exception):
+    pass
+
+
+ONNX_DTYPES = {
+    'tensor(float)': 'float32',
+    'tensor(float16)': 'float16',
+    'tensor(double)': 'float64',
+    'tensor(int8)': 'int8',
+    'tensor(uint8)': 'uint8',
+    'tensor(int32)': 'int32',
+    'tensor(int64)': 'int64',
+    'tensor(bool)': 'bool',
+}
+
+
+def tensor_spec(name, shape, dtype):
+    """Signature entry; unknown dimensions are None"""
+    return {
+        'name': name,
+        'shape': [dim if isinstance(dim, int) and dim >= 0 else None for dim in shape],
+        'dtype': dtype,
+    }
+
+
+class OnnxRunner:
+    def __init__(self, path, threads=1):
+        try:
+            import onnxruntime
+        except ImportError:
+            raise ModelRuntimeError("onnxruntime is not installed")
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        self.path = path
+        self.session = onnxruntime.InferenceSession(path, options, providers=['CPUExecutionProvider'])
+        self.inputs = [
+            tensor_spec(i.name, i.shape, ONNX_DTYPES.get(i.type, 'float32')) for i in self.session.get_inputs()
+        ]
+        self.outputs = [
+            tensor_spec(o.name, o.shape, ONNX_DTYPES.get(o.type, 'float32')) for o in self.session.get_outputs()
+        ]
+
+    def run(self, feed):
+        names = [o['name'] for o in self.outputs]
+        return dict(zip(names, self.session.run(names, feed)))
+
+    def parameter_count(self):
+        # onnxruntime does not expose initializers; dims are read without loading external data
+        try:
+            import onnx
+        except ImportError:
+            return None
+        graph = onnx.load(self.path, load_external_data=False).graph
+        return sum(int(np.prod(tensor.dims)) for tensor in graph.initializer)
+
+
+class KerasRunner:
+    """TensorFlow and Keras models saved as .keras / .h5 files or SavedModel directories"""
+
+    def __init__(self, path, threads=1):
+        try:
+            import tensorflow as tf
+        except ImportError:
+            raise ModelRuntimeError("tensorflow is not installed")
+        tf.config.threading.set_intra_op_parallelism_threads(threads)
+        tf.config.threading.set_inter_op_parallelism_threads(1)
+        self.model = tf.keras.models.load_model(path, compile=False)
+        self.inputs = [
+            tensor_spec(t.name.split(':')[0], t.shape, t.dtype.name) for t in self.model.inputs
+        ]
+        self.outputs = [
+            tensor_spec(f"output_{i}", t.shape, t.dtype.name) for i, t in enumerate(self.model.outputs)
+        ]
+
+    def run(self, feed):
+        result = self.model([feed[i['name']] for i in self.inputs], training=False)
+        if not isinstance(result, (list, tuple)):
+            result = [result]
+        return {f"output_{i}": np.asarray(r) for i, r in enumerate(result)}
+
+    def parameter_count(self):
+        return int(self.model.count_params())
+
+
+class TorchRunner:
+    """TorchScript archives; plain pickled state dicts carry no architecture to run"""
+
+    def __init__(self, path, threads=1):
+        try:
+            import torch
+        except ImportError:
+            raise ModelRuntimeError("torch is not installed")
+        torch.set_num_threads(threads)
+        self.torch = torch
+        try:
+            self.model = torch.jit.load(path, map_location='cpu').eval()
+        except RuntimeError as e:
+            raise ModelRuntimeError(f"Not a TorchScript model: {e}")
+        arguments = self.model.forward.schema.arguments[1:]
+        self.inputs = [tensor_spec(a.name, [], 'float32') for a in arguments]
+        self.outputs = []
+
+    def run(self, feed):
+        with self.torch.inference_mode():
+            result = self.model(*[self.torch.from_numpy(feed[i['name']]) for i in self.inputs])
+        if not isinstance(result, (list, tuple)):
+            result = [result]
+        return {f"output_{i}": r.numpy() for i, r in enumerate(result)}
+
+    def parameter_count(self):
+        return sum(p.numel() for p in self.model.parameters())
+
+
+RUNNERS = {
+    'onnx': OnnxRunner,
+    'tensorflow': KerasRunner,
+    'keras': KerasRunner,
+    'pytorch': TorchRunner,
+}
+
+
+def sample_feed(inputs):
+    """Zero-filled batch of one for every input, or None when an input's rank is unknown"""
+    feed = {}
+    for spec in inputs:
+        if not spec['shape']:
+            return None
+        feed[spec['name']] = np.zeros([dim or 1 for dim in spec['shape']], dtype=spec['dtype'])
+    return feed
+
+def check_feed(inputs, seed=0):
+    """
+    Seeded random batch of two for comparing a variant with its source;
+    zeros would hide most quantization error. Integer inputs, often indices,
+    stay zero. None when an input's rank is unknown.
+    """
+    rng = np.random.default_rng(seed)
+    feed = {}
+    for spec in inputs:
+        if not spec['shape']:
+            return None
+        shape = [spec['shape'][0] or 2, *[dim or 1 for dim in spec['shape'][1:]]]
+        if np.issubdtype(np.dtype(spec['dtype']), np.floating):
+            feed[spec['name']] = rng.standard_normal(shape).astype(spec['dtype'])
+        else:
+            feed[spec['name']] = np.zeros(shape, dtype=spec['dtype'])
+    return feed
+
+def output_error(expected, actual):
+    """Largest absolute difference over all outputs, relative to the largest expected magnitude"""
+    if list(expected) != list(actual):
+        raise ModelRuntimeError(f"Outputs {sorted(actual)} do not match the source's {sorted(expected)}")
+    error = scale = 0.0
+    for name, reference in expected.items():
+        reference = np.asarray(reference, dtype=np.float64)
+        value = np.asarray(actual[name], dtype=np.float64)
+        if reference.shape != value.shape:
+            raise ModelRuntimeError(f"Output {name} has shape {value.shape}, the source {reference.shape}")
+        if reference.size:
+            error = max(error, float(np.max(np.abs(value - reference))))
+            scale = max(scale, float(np.max(np.abs(reference))))
+    return error / max(scale, 1e-6)
+
+def load_model(path, framework, threads=1):
+    if framework not in RUNNERS:
+        raise ModelRuntimeError(f"Unsupported framework: {framework}")
+    if not os.path.exists(path):
+        raise ModelRuntimeError(f"Model file missing: {path}")
+    return RUNNERS[framework](path, threads)
+
+
+def worker_main(conn, path, framework, threads):
+    """
+    Serving worker process: loads one model, then answers batches sent over
+    `conn` until it receives None or the pipe closes.
+    """
+    try:
+        runner = load_model(path, framework, threads)
+    except Exception as e:
+        conn.send(('error', f"{type(e).__name__}: {e}"))
+        return
+    conn.send(('ready', {
+        'inputs': runner.inputs,
+        'outputs': runner.outputs,
+        'parameters': runner.parameter_count(),
+    }))
+    while True:
+        try:
+            feed = conn.recv()
+        except EOFError:
+            return
+        if feed is None:
+            return
+        try:
+            conn.send(('ok', runner.run(feed)))
+        except Exception as e:
+            conn.send(('error', f"{type(e).__name__}: {e}"))
+
+def start_worker(path, framework, threads=1):
+    """Spawns a worker process for one model; returns (process, connection)"""
+    context = multiprocessing.get_context('spawn')
+    conn, child = context.Pipe()
+    process = context.Process(target=worker_main, args=(child, path, framework, threads), daemon=True)
+    process.start()
+    child.close()
+    return process, conn
+
+def export_onnx(path, framework, target):
+    """Converts a Keras/TensorFlow model to ONNX with a dynamic batch dimension"""
+    if framework not in ('keras', 'tensorflow'):
+        # TorchScript archives record no input shapes to trace an export with
+        raise ModelRuntimeError(f"ONNX export is not supported for {framework} models")
+    try:
+        import tensorflow as tf
+        import tf2onnx
+    except ImportError:
+        raise ModelRuntimeError("tensorflow and tf2onnx are needed for ONNX export")
+    model = tf.keras.models.load_model(path, compile=False)
+    signature = [
+        tf.TensorSpec([None, *t.shape[1:]], t.dtype, name=t.name.split(':')[0]) for t in model.inputs
+    ]
+    tf2onnx.convert.from_keras(model, input_signature=signature, output_path=target)
+
+def rename_outputs(path, names):
+    """
+    Renames an ONNX model's outputs, in order, through Identity nodes, so a
+    variant answers with the source's output names rather than the layer
+    names the exporter picked.
+    """
+    import onnx
+    model = onnx.load(path)
+    graph = model.graph
+    if [o.name for o in graph.output] == list(names):
+        return
+    if len(graph.output) != len(names):
+        raise ModelRuntimeError(f"Export has {len(graph.output)} outputs, the source {len(names)}")
+    for output, name in zip(graph.output, names):
+        graph.node.append(onnx.helper.make_node('Identity', [output.name], [name]))
+        output.name = name
+    onnx.save(model, path)
+
+def quantize_int8(source, target):
+    """Dynamic int8 quantization: weights stored as int8, activations quantized per batch"""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    quantize_dynamic(source, target, weight_type=QuantType.QInt8)
+
+def convert_fp16(source, target):
+    """Halves float weights; inputs and outputs stay float32 so callers see the same signature"""
+    import onnx
+    from onnxruntime.transformers.float16 import convert_float_to_float16
+    onnx.save(convert_float_to_float16(onnx.load(source), keep_io_types=True), target)
+
+def benchmark(path, framework, threads=1, runs=20):
+    """Median latency in milliseconds of a batch of one, or None when inputs have unknown rank"""
+    runner = load_model(path, framework, threads)
+    feed = sample_feed(runner.inputs)
+    if feed is None:
+        return None
+    runner.run(feed)  # warm-up: allocations and lazy kernel selection
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        runner.run(feed)
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+def convert_model(path, framework, kinds, workdir, threads=1, runs=20, tolerances=None):
+    """
+    Builds the requested variants of a model in `workdir` and benchmarks them
+    against the source. Returns {'latency', 'variants': {kind: {path, latency,
+    error} or {error}}}; int8 and fp16 are derived from the ONNX export when
+    the source is not ONNX already.
+
+    Variants answer with the source's output names, and one whose outputs on
+    check_feed() deviate from the source's by more than `tolerances[kind]`
+    (relative, see output_error) fails instead of being served.
+    """
+    tolerances = tolerances or {}
+    source = load_model(path, framework, threads)
+    feed = check_feed(source.inputs)
+    expected = source.run(feed) if feed is not None else None
+    names = [o['name'] for o in source.outputs] or list(expected or {})
+    del source
+    result = {'latency': benchmark(path, framework, threads, runs), 'variants': {}}
+    onnx_path = path if framework == 'onnx' else None
+    steps = {'int8': quantize_int8, 'fp16': convert_fp16}
+    for kind in kinds:
+        target = os.path.join(workdir, f"{kind}.onnx")
+        try:
+            if kind == 'onnx':
+                export_onnx(path, framework, target)
+                rename_outputs(target, names)
+                onnx_path = target
+            elif onnx_path is None:
+                raise ModelRuntimeError("Needs an ONNX export first")
+            else:
+                steps[kind](onnx_path, target)
+            if expected is None:
+                raise ModelRuntimeError("Inputs of unknown rank, outputs cannot be compared with the source")
+            error = output_error(expected, load_model(target, 'onnx', threads).run(feed))
+            if error > tolerances.get(kind, 0):
+                raise ModelRuntimeError(
+                    f"Outputs deviate from the source by {error:.2e}, more than {tolerances.get(kind, 0):g}"
+                )
+            latency = benchmark(target, 'onnx', threads, runs)
+        except Exception as e:
+            result['variants'][kind] = {'error': f"{type(e).__name__}: {e}"}
+            continue
+        result['variants'][kind] = {'path': target, 'latency': latency, 'error': error}
+    return result
+
+def isolated_main(conn, target, args):
+    try:
+        conn.send(('ok', target(*args)))
+    except Exception as e:
+        conn.send(('error', f"{type(e).__name__}: {e}"))
+
+def run_isolated(target, args, timeout):
+    """Runs `target(*args)` in a spawned process, so a crashing framework cannot take the caller down"""
+    context = multiprocessing.get_context('spawn')
+    conn, child = context.Pipe()
+    process = context.Process(target=isolated_main, args=(child, target, args), daemon=True)
+    process.start()
+    child.close()
+    try:
+        if not conn.poll(timeout):
+            raise ModelRuntimeError(f"Timed out after {timeout}s")
+        try:
+            status, payload = conn.recv()
+        except EOFError:
+            process.join(timeout=1)
+            raise ModelRuntimeError(f"Worker crashed (exit code {process.exitcode})")
+        if status != 'ok':
+            raise ModelRuntimeError(payload)
+        return payload
+    finally:
+        conn.close()
+        process.terminate()
+        process.join(timeout=5)
@@ -0,0 +1,59 @@
+from django.utils import timezone
+from .models import AIModel
+from .model_runtime import ModelRuntimeError, sample_feed, start_worker
+
+
+def receive(conn, process, timeout, stage):
+    if not conn.poll(timeout):
+        raise ModelRuntimeError(f"Timed out {stage}")
+    try:
+        return conn.recv()
+    except EOFError:
+        raise ModelRuntimeError(f"Worker crashed {stage} (exit code {process.exitcode})")
+
+def inspect_model(path, framework, timeout):
+    """
+    Loads a model in a throwaway worker process and runs one sample batch.
+    Returns its signature and parameter count; raises ModelRuntimeError when
+    the file does not load or run as `framework`.
+    """
+    process, conn = start_worker(path, framework)
+    try:
+        status, info = receive(conn, process, timeout, 'loading the model')
+        if status != 'ready':
+            raise ModelRuntimeError(info)
+        feed = sample_feed(info['inputs'])
+        if feed is not None:
+            conn.send(feed)
+            status, detail = receive(conn, process, timeout, 'running a sample batch')
+            if status != 'ok':
+                raise ModelRuntimeError(f"Sample batch failed: {detail}")
+        return info
+    finally:
+        conn.close()
+        process.terminate()
+        process.join(timeout=5)
+
+def begin_validation(model_id):
+    """Marks a model as validating; returns (path, framework) or None when it is gone"""
+    model = AIModel.objects.filter(pk=model_id).first()
+    if model is None:
+        return None
+    AIModel.objects.filter(pk=model_id).update(status='validating', status_message='')
+    return model.model_file.path, model.framework
+
+def record_validation(model_id, info=None, error=''):
+    # update() keeps the save signals (storage ledger, validation enqueue) out of it
+    if error:
+        AIModel.objects.filter(pk=model_id).update(
+            status='failed', status_message=error, validated_at=timezone.now()
+        )
+        return
+    AIModel.objects.filter(pk=model_id).update(
+        status='ready',
+        status_message='',
+        inputs=info['inputs'],
+        outputs=info['outputs'],
+        parameter_count=info['parameters'],
+        validated_at=timezone.now()
+    )
@@ -0,0 +1,58 @@
+import os
+import tempfile
+from django.conf import settings
+from .models import AIModel, ModelVariant, user_file_path
+from .quota import QuotaExceeded, check_quota
+from .uploads import store_file
+
+
+def conversion_kinds(model):
+    """Variant kinds to build for a model; ONNX sources need no export"""
+    return [kind for kind in settings.MODEL_VARIANT_KINDS if not (kind == 'onnx' and model.framework == 'onnx')]
+
+def begin_conversion(model_id, kinds):
+    """Resets the variant rows; returns (path, framework, scratch directory) or None when the model is gone"""
+    model = AIModel.objects.select_related('user').filter(pk=model_id).first()
+    if model is None:
+        return None
+    for kind in kinds:
+        ModelVariant.objects.update_or_create(
+            source=model, kind=kind,
+            defaults={'user': model.user, 'status': 'pending', 'status_message': ''}
+        )
+    path = model.model_file.path
+    # Scratch space on the same filesystem, so results move into storage without a copy
+    workdir = tempfile.mkdtemp(prefix='.convert-', dir=os.path.dirname(path))
+    return path, model.framework, workdir
+
+def store_variant(model, variant, path):
+    variant.model_file.delete(save=False)
+    model.user.refresh_from_db(fields=['storage_used'])
+    check_quota(model.user, os.path.getsize(path))
+    stem = os.path.splitext(os.path.basename(model.model_file.name))[0]
+    variant.model_file.name = store_file(path, user_file_path(variant, f"{stem}.{variant.kind}.onnx"))
+
+def record_conversion(model_id, result):
+    """Stores the benchmark of the source and every produced variant"""
+    model = AIModel.objects.select_related('user').filter(pk=model_id).first()
+    if model is None:
+        return
+    AIModel.objects.filter(pk=model_id).update(latency_ms=result['latency'])
+    for kind, outcome in result['variants'].items():
+        variant = ModelVariant.objects.get(source=model, kind=kind)
+        variant.status, variant.status_message = 'failed', outcome.get('error', '')
+        if 'path' in outcome:
+            try:
+                store_variant(model, variant, outcome['path'])
+                variant.status, variant.latency_ms = 'ready', outcome['latency']
+            except QuotaExceeded as e:
+                variant.status_message = str(e)
+        if variant.status == 'failed':
+            variant.model_file.delete(save=False)
+            variant.size, variant.latency_ms = 0, None
+        variant.save()
+
+def fail_conversion(model_id, kinds, error):
+    ModelVariant.objects.filter(source_id=model_id, kind__in=kinds, status='pending').update(
+        status='failed', status_message=error
+    )
@@ -1,4 +1,5 @@
 import os
+import uuid
 from django.db import models
 from users.models import CustomUser
 
@@ -13,6 +14,24 @@ def user_file_path(instance, filename):
     return f"user_{instance.user.id}_({instance.user.username})/{instance.file_type}/{filename}"
 
 
+class DockerNode(models.Model):
+    """A Docker Engine that user containers can be scheduled on"""
+    name = models.CharField(max_length=100, unique=True)
+    url = models.CharField(max_length=255)  # unix:///var/run/docker.sock or tcp://host:2375
+    public_host = models.CharField(max_length=255, default='localhost')  # host name in container access URLs
+    enabled = models.BooleanField(default=True)  # disabled nodes keep their containers but get no new ones
+    cpu_total = models.FloatField(default=0)  # cores, refreshed from the daemon's /info
+    memory_total = models.BigIntegerField(default=0)  # bytes, refreshed from the daemon's /info
+    last_seen = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['name']
+
+    def __str__(self):
+        return f"{self.name} ({self.url})"
+
+
 class DockerContainer(models.Model):
     CONTAINER_TYPES = [
         ('regular', 'Regular Container'),
@@ -21,11 +40,18 @@ class DockerContainer(models.Model):
     ]
 
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
+    node = models.ForeignKey(DockerNode, on_delete=models.PROTECT, null=True, blank=True, related_name='containers')  # None: DOCKER_HOST_URL
     container_id = models.CharField(max_length=64, default='default_container_id')
     container_type = models.CharField(max_length=20, choices=CONTAINER_TYPES, default='regular')
     image_name = models.CharField(max_length=255)
     status = models.CharField(max_length=20, default='stopped')
     port_bindings = models.JSONField(default=dict)
+    access_url = models.CharField(max_length=255, blank=True)
+    last_active_at = models.DateTimeField(null=True, blank=True)  # last CPU, network or proxied request activity
+    suspended_at = models.DateTimeField(null=True, blank=True)  # set while paused or checkpointed for being idle
+    suspend_mode = models.CharField(max_length=20, blank=True)  # IDLE_SUSPEND_MODE while suspended; checkpoints hold no reservation
+    resume_seconds = models.FloatField(null=True, blank=True)  # latency of the last resume
+    gpu_devices = models.JSONField(default=list, blank=True)  # UUIDs of the GPUs assigned to the container
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -40,11 +66,27 @@ class DockerContainer(models.Model):
 class UserFile(models.Model):
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
     file = models.FileField(upload_to=user_directory_path)
+    name = models.CharField(max_length=255, blank=True)  # basename of `file`, for sorting and search
+    size = models.BigIntegerField(default=0)  # bytes, charged to the storage ledger
     uploaded_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'uploaded_at']),
+            models.Index(fields=['user', 'name']),
+            models.Index(fields=['user', 'size']),
+        ]
+
     def filename(self):
         return os.path.basename(self.file.name)
 
+    def save(self, *args, **kwargs):
+        # Commit the upload first so the final storage name is known
+        if self.file and not self.file._committed:
+            self.file.save(self.file.name, self.file.file, save=False)
+        self.name = self.filename()
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return self.filename()
 
@@ -56,21 +98,284 @@ class AIModel(models.Model):
         ('onnx', 'ONNX'),
         ('keras', 'Keras')
     ]
+    STATUSES = [
+        ('pending', 'Pending'),
+        ('validating', 'Validating'),
+        ('ready', 'Ready'),
+        ('failed', 'Failed')
+    ]
 
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='ai_models')
     name = models.CharField(max_length=100)
     framework = models.CharField(max_length=20, choices=FRAMEWORKS)
     model_file = models.FileField(upload_to=user_file_path)
+    size = models.BigIntegerField(default=0)  # bytes, charged to the storage ledger
     created_at = models.DateTimeField(auto_now_add=True)
+    # Filled in by the validation job (core.model_validation)
+    status = models.CharField(max_length=20, choices=STATUSES, default='pending')
+    status_message = models.TextField(blank=True)
+    inputs = models.JSONField(default=list, blank=True)  # [{name, shape, dtype}], None for dynamic dims
+    outputs = models.JSONField(default=list, blank=True)
+    parameter_count = models.BigIntegerField(null=True, blank=True)
+    validated_at = models.DateTimeField(null=True, blank=True)
+    latency_ms = models.FloatField(null=True, blank=True)  # median of a batch of one, measured on conversion
     file_type = 'models'  # Used in upload path
 
     class Meta:
         ordering = ['-created_at']
         unique_together = ['user', 'name']
+        indexes = [
+            models.Index(fields=['user', 'created_at']),
+            models.Index(fields=['user', 'size']),
+        ]
 
     def __str__(self):
         return f"{self.name} ({self.get_framework_display()})"
 
     def delete(self, *args, **kwargs):
+        for variant in self.variants.all():
+            variant.delete()
         self.model_file.delete(save=False)
         super().delete(*args, **kwargs)
+
+
+class ModelVariant(models.Model):
+    """A derived artifact of an AIModel (ONNX export, quantized copy), produced by the conversion job"""
+    KINDS = [
+        ('onnx', 'ONNX Export'),
+        ('int8', 'Dynamic int8 Quantization'),
+        ('fp16', 'Float16 Weights')
+    ]
+    STATUSES = [
+        ('pending', 'Pending'),
+        ('ready', 'Ready'),
+        ('failed', 'Failed')
+    ]
+
+    source = models.ForeignKey(AIModel, on_delete=models.CASCADE, related_name='variants')
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='model_variants')
+    kind = models.CharField(max_length=10, choices=KINDS)
+    model_file = models.FileField(upload_to=user_file_path, blank=True)
+    size = models.BigIntegerField(default=0)  # bytes, charged to the storage ledger
+    latency_ms = models.FloatField(null=True, blank=True)
+    status = models.CharField(max_length=20, choices=STATUSES, default='pending')
+    status_message = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    file_type = 'models/variants'  # Used in upload path
+    framework = 'onnx'  # every variant is served by onnxruntime
+
+    class Meta:
+        unique_together = ['source', 'kind']
+
+    def __str__(self):
+        return f"{self.source.name} ({self.get_kind_display()})"
+
+    def delete(self, *args, **kwargs):
+        if self.model_file:
+            self.model_file.delete(save=False)
+        super().delete(*args, **kwargs)
+
+
+class APIToken(models.Model):
+    """Bearer token of a non-browser client, e.g. for model inference; only its SHA-256 is stored"""
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='api_tokens')
+    name = models.CharField(max_length=100)
+    key_hash = models.CharField(max_length=64, unique=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.user.username}: {self.name}"
+
+
+class UploadSession(models.Model):
+    """A resumable chunked upload, finalized into a UserFile or AIModel"""
+    KINDS = [
+        ('file', 'User File'),
+        ('model', 'AI Model')
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='uploads')
+    kind = models.CharField(max_length=10, choices=KINDS)
+    filename = models.CharField(max_length=255)
+    size = models.BigIntegerField()
+    chunk_size = models.PositiveIntegerField()
+    name = models.CharField(max_length=100, blank=True)  # AIModel name
+    framework = models.CharField(max_length=20, blank=True)  # AIModel framework
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    @property
+    def chunk_count(self):
+        return max(1, -(-self.size // self.chunk_size))
+
+    def __str__(self):
+        return f"{self.filename} ({self.chunks.count()}/{self.chunk_count})"
+
+
+class UploadChunk(models.Model):
+    session = models.ForeignKey(UploadSession, on_delete=models.CASCADE, related_name='chunks')
+    index = models.PositiveIntegerField()
+    sha256 = models.CharField(max_length=64, blank=True)
+
+    class Meta:
+        unique_together = ('session', 'index')
+
+
+class Blob(models.Model):
+    """Content of files stored by DedupStorage; kept as a file under .blobs where the filesystem can reflink"""
+    sha256 = models.CharField(max_length=64, primary_key=True)
+    size = models.BigIntegerField()
+    refcount = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.sha256[:12]} ({self.refcount} refs)"
+
+
+class BlobLink(models.Model):
+    """A storage name backed by a blob"""
+    name = models.CharField(max_length=255, unique=True)
+    blob = models.ForeignKey(Blob, on_delete=models.PROTECT, related_name='links')
+
+
+class WorkspaceEntry(models.Model):
+    """Index of a file or directory in a user's workspace, kept in sync by core.workspace_sync"""
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='workspace_entries')
+    parent = models.CharField(max_length=1024, blank=True)  # directory relative to the workspace root
+    name = models.CharField(max_length=255)
+    is_dir = models.BooleanField(default=False)
+    size = models.BigIntegerField(default=0)
+    mtime = models.FloatField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'parent', 'name'], name='unique_workspace_entry'),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'parent', 'size']),
+            models.Index(fields=['user', 'parent', 'mtime']),
+        ]
+
+    @property
+    def path(self):
+        return f"{self.parent}/{self.name}" if self.parent else self.name
+
+    def __str__(self):
+        return self.path
+
+
+class DockerImage(models.Model):
+    """Index of images present on the Docker host, used to skip redundant pulls"""
+    tag = models.CharField(max_length=255, unique=True)
+    digest = models.CharField(max_length=255, blank=True)
+    size = models.BigIntegerField(default=0)
+    last_pulled_at = models.DateTimeField(null=True, blank=True)
+    synced_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['tag']
+
+    def __str__(self):
+        return self.tag
+
+
+class WarmContainer(models.Model):
+    """
+    A pre-created Jupyter container waiting in the warm pool, or claimed from it.
+    Released and missed claims are kept for the demand window that sizes the pool.
+    """
+    STATUSES = [
+        ('warming', 'Warming'),
+        ('ready', 'Ready'),
+        ('claimed', 'Claimed'),
+        ('released', 'Released'),  # claimed, then replaced by the user's next launch
+        ('missed', 'Missed')  # a launch that found the pool empty
+    ]
+
+    slot = models.CharField(max_length=32, unique=True)
+    container_id = models.CharField(max_length=64, blank=True)
+    image_name = models.CharField(max_length=255)
+    status = models.CharField(max_length=20, choices=STATUSES, default='warming')
+    user = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['created_at']
+
+    def __str__(self):
+        return f"{self.slot} ({self.status})"
+
+
+class Job(models.Model):
+    """A queued image pull, container lifecycle or model processing operation, run by `manage.py run_jobs`"""
+    KINDS = [
+        ('pull', 'Image Pull'),
+        ('lifecycle', 'Container Lifecycle'),
+        ('model', 'Model Processing'),
+        ('bulk', 'Bulk Operation')
+    ]
+    STATUSES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed')
+    ]
+    ACTIVE_STATUSES = ('queued', 'running')
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, null=True, blank=True, related_name='jobs')
+    kind = models.CharField(max_length=20, choices=KINDS)
+    action = models.CharField(max_length=50)
+    params = models.JSONField(default=dict)
+    dedup_key = models.CharField(max_length=255, blank=True)
+    # '<user id>:<container type>' of the container the job acts on; such jobs run one at a time, in queue order
+    container = models.CharField(max_length=64, blank=True)
+    depends_on = models.ForeignKey('self', on_delete=models.SET_NULL, null=True, blank=True, related_name='dependents')
+    status = models.CharField(max_length=20, choices=STATUSES, default='queued')
+    message = models.TextField(blank=True)
+    result = models.JSONField(null=True, blank=True)
+    worker = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'kind', 'created_at']),
+            models.Index(fields=['container', 'status']),
+        ]
+        constraints = [
+            # At most one active job per dedup key, e.g. one pull per image
+            models.UniqueConstraint(
+                fields=['dedup_key'],
+                condition=models.Q(status__in=['queued', 'running']) & ~models.Q(dedup_key=''),
+                name='unique_active_job_dedup_key'
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.action} ({self.status})"
+
+
+class JobBatch(models.Model):
+    """Jobs fanned out by one bulk operation over many users' containers"""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, null=True, blank=True, related_name='job_batches')  # who launched it
+    action = models.CharField(max_length=50)
+    params = models.JSONField(default=dict)  # container selection and action arguments
+    jobs = models.ManyToManyField(Job, related_name='batches')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.action} batch of {self.created_at:%Y-%m-%d %H:%M}"
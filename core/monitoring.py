@@ -1,19 +1,41 @@
 import psutil
 import docker
 from docker.errors import DockerException
-import subprocess
 import json
+from collections import Counter
+import logging
+import threading
+import time
 from humanize import naturalsize
+from django.conf import settings
+from .container_stats import stats_engine
+from .gpu import gpu_inventory
 from .models import DockerContainer
+from .metrics_store import metrics_store, host_key
+
+logger = logging.getLogger(__name__)
 
 try:
     docker_client = docker.from_env()
 except DockerException:
     docker_client = None
 
-def get_system_stats():
-    """Get system-wide hardware statistics"""
-    cpu_percent = psutil.cpu_percent(interval=1)
+def has_nvidia_runtime():
+    """Checks the Docker daemon for the nvidia runtime once per process"""
+    global _nvidia_runtime
+    if _nvidia_runtime is None:
+        try:
+            _nvidia_runtime = bool(docker_client and docker_client.info().get('Runtimes', {}).get('nvidia'))
+        except Exception:
+            _nvidia_runtime = False
+    return _nvidia_runtime
+
+_nvidia_runtime = None
+
+def collect_system_stats():
+    """Collect system-wide hardware statistics without blocking"""
+    # interval=None compares against the previous call, the collector calls it every tick
+    cpu_percent = psutil.cpu_percent(interval=None)
     memory = psutil.virtual_memory()
     disk = psutil.disk_usage('/')
     
@@ -35,60 +57,98 @@ def get_system_stats():
             'free': disk.free,
             'percent': disk.percent
         },
-        'gpu': get_gpu_stats() if docker_client and docker_client.info().get('Runtimes', {}).get('nvidia') else None
+        'gpu': get_gpu_stats() if has_nvidia_runtime() else None
     }
     
     return stats
 
+class SystemStatsCollector:
+    """
+    Refreshes a system stats snapshot in a background thread.
+
+    Readers get the cached snapshot; it is only refreshed inline when it is
+    older than the staleness bound, e.g. before the thread's first tick.
+    """
+
+    def __init__(self, interval=None, max_age=None):
+        self.interval = interval or settings.SYSTEM_STATS_REFRESH_INTERVAL
+        self.max_age = max_age or settings.SYSTEM_STATS_MAX_AGE
+        self._snapshot = None
+        self._collected_at = 0
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            psutil.cpu_percent(interval=None)  # prime the CPU counters
+            self._thread = threading.Thread(target=self._run, name='system-stats', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            self.refresh()
+
+    def refresh(self):
+        try:
+            snapshot = collect_system_stats()
+        except Exception as e:
+            logger.error(f"System stats collection failed: {e}")
+            return
+        self._snapshot, self._collected_at = snapshot, time.time()
+        metrics_store.record(host_key(), {
+            'cpu': snapshot['cpu']['percent'],
+            'memory': snapshot['memory']['percent'],
+            'disk': snapshot['disk']['percent']
+        }, ts=self._collected_at)
+
+    def snapshot(self, max_age=None):
+        """Returns the latest snapshot with its age in seconds"""
+        self.start()
+        if self._snapshot is None or time.time() - self._collected_at > (max_age or self.max_age):
+            self.refresh()
+        if self._snapshot is None:
+            return None
+        return dict(self._snapshot, age=round(time.time() - self._collected_at, 1))
+
+collector = SystemStatsCollector()
+
+def get_system_stats(max_age=None):
+    """Get system-wide hardware statistics from the background snapshot"""
+    return collector.snapshot(max_age)
+
 def get_gpu_stats():
-    try:
-        result = subprocess.run([
-            'nvidia-smi',
-            '--query-gpu=utilization.gpu,memory.total,memory.used,memory.free,temperature.gpu,name',
-            '--format=csv,noheader,nounits'
-        ], capture_output=True, text=True)
-        
-        if result.returncode == 0:
-            gpu_data = result.stdout.strip().split(', ')
-            memory_total = int(gpu_data[1])
-            memory_used = int(gpu_data[2])
-            return {
-                'utilization': float(gpu_data[0]),
-                'memory_total': memory_total,
-                'memory_used': memory_used,
-                'memory_free': int(gpu_data[3]),
-                'memory_percent': (memory_used / memory_total) * 100 if memory_total > 0 else 0,
-                'temperature': int(gpu_data[4]),
-                'name': gpu_data[5]
-            }
-    except (FileNotFoundError, subprocess.SubprocessError, ValueError):
-        pass
-    return None
+    """All GPUs summed up for the dashboards, each one under 'devices'"""
+    devices = gpu_inventory.snapshot()
+    if not devices:
+        return None
+    names = Counter(device['name'] for device in devices)
+    utilization = [device['utilization'] for device in devices if device['utilization'] is not None]
+    temperatures = [device['temperature'] for device in devices if device['temperature'] is not None]
+    memory_total = sum(device['memory_total'] for device in devices)
+    memory_used = sum(device['memory_used'] for device in devices)
+    return {
+        'name': ', '.join(f"{count} x {name}" if count > 1 else name for name, count in names.items()),
+        'utilization': round(sum(utilization) / len(utilization), 1) if utilization else 0,
+        'memory_total': memory_total,
+        'memory_used': memory_used,
+        'memory_free': sum(device['memory_free'] for device in devices),
+        'memory_percent': (memory_used / memory_total) * 100 if memory_total > 0 else 0,
+        'temperature': max(temperatures) if temperatures else None,
+        'devices': devices
+    }
 
 def get_user_container_stats(user):
-    """Get stats for a user's Docker container"""
-    if not docker_client:
+    """
+    Stats of a user's container from the stats engine's latest sample;
+    the page never waits on a Docker daemon
+    """
+    container = DockerContainer.objects.filter(user=user, container_type='regular').first()
+    if container is None:
         return None
-    
-    try:
-        container = DockerContainer.objects.get(user=user)
-        docker_container = docker_client.containers.get(container.container_id)
-        
-        stats = docker_container.stats(stream=False)
-        cpu_stats = stats['cpu_stats']
-        precpu_stats = stats['precpu_stats']
-        
-        # Calculate CPU percentage
-        cpu_delta = cpu_stats['cpu_usage']['total_usage'] - precpu_stats['cpu_usage']['total_usage']
-        system_delta = cpu_stats['system_cpu_usage'] - precpu_stats['system_cpu_usage']
-        cpu_percent = (cpu_delta / system_delta) * 100 if system_delta > 0 else 0
-        
-        return {
-            'cpu_percent': round(cpu_percent, 2),
-            'memory_usage': stats['memory_stats'].get('usage', 0),
-            'memory_limit': stats['memory_stats'].get('limit', 0),
-            'network': stats.get('networks', {}),
-            'status': container.status
-        }
-    except (DockerContainer.DoesNotExist, docker.errors.NotFound):
-        return None
\ No newline at end of file
+    sample = stats_engine.latest(container.container_id) if container.status == 'running' else None
+    if sample is None:
+        return {'status': container.status}
+    return dict(sample, cpu_percent=sample['cpu'], status=container.status)
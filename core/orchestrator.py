@@ -0,0 +1,602 @@
+import asyncio
+import logging
+import os
+import shutil
+import time
+from collections import defaultdict
+from urllib.parse import parse_qs, urlencode, urlparse
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.utils import timezone
+from . import proxy
+from .docker_api import DockerAPI, DockerAPIError
+from .docker_utils import get_user_workspace, generate_jupyter_token
+from .models import AIModel, DockerContainer, Job
+from .jobs import update_job, job_audience, enqueue_pool_refill, enqueue_model_conversion
+from .image_cache import record_pull
+from .model_runtime import ModelRuntimeError, convert_model, run_isolated
+from .model_validation import begin_validation, inspect_model, record_validation
+from .model_variants import begin_conversion, conversion_kinds, fail_conversion, record_conversion
+from .gpu import assign_gpu
+from .scheduler import container_node, place, reclaim
+from .jupyter_pool import (
+    SLOT_MOUNTS,
+    attach_workspace,
+    claim_slot,
+    create_slot,
+    discard_slot,
+    mark_ready,
+    pool_plan,
+    release_user_slots,
+    slot_binds
+)
+
+logger = logging.getLogger(__name__)
+
+JUPYTER_IMAGE = 'jupyter/tensorflow-notebook:latest'
+PROGRESS_INTERVAL = 1  # seconds between pull progress messages
+CHECKPOINT_NAME = 'idle'  # checkpoint an idle container is suspended to
+
+
+def operations_group(user_id):
+    return f'operations_{user_id}'
+
+def container_name(user, container_type='regular'):
+    prefix = 'jupyter' if container_type == 'jupyter' else 'app'
+    return f"{prefix}_{user.id}_{user.username}"
+
+def container_config(user, image, binds, ports, environment=None, labels=None, network=None, gpu_devices=None):
+    """
+    Builds an Engine API create body; `user` limits are omitted for pool containers.
+    On a `network` the ports are reached there and not published on the host.
+    The nvidia runtime exposes `gpu_devices` only, or every GPU when none were assigned.
+    """
+    host_config = {
+        'Binds': [f"{host}:{bind['bind']}:{bind['mode']}" for host, bind in binds.items()],
+    }
+    if network:
+        host_config['NetworkMode'] = network
+    else:
+        host_config['PortBindings'] = {port: [{'HostPort': str(host_port)}] for port, host_port in ports.items()}
+    if user:
+        host_config.update(resource_limits(user))
+        if user.gpu_access:
+            host_config['Runtime'] = 'nvidia'
+    if gpu_devices:
+        environment = dict(environment or {}, NVIDIA_VISIBLE_DEVICES=','.join(gpu_devices))
+    return {
+        'Image': image,
+        'Env': [f"{key}={value}" for key, value in (environment or {}).items()],
+        'ExposedPorts': {port: {} for port in ports},
+        'Labels': labels or {},
+        'HostConfig': host_config,
+    }
+
+def resource_limits(user):
+    return {
+        'Memory': user.ram_limit * 1024 * 1024,
+        'CpuShares': int(user.cpu_limit * 1024),
+    }
+
+def published_port(inspect, port):
+    bindings = (inspect.get('NetworkSettings', {}).get('Ports') or {}).get(port) or []
+    return int(bindings[0]['HostPort']) if bindings else None
+
+def jupyter_url(base, token):
+    return f"{base}?{urlencode({'token': token})}" if base and token else base
+
+def access_token(url):
+    """Notebook token of a recorded Jupyter access URL"""
+    return parse_qs(urlparse(url).query).get('token', [''])[0]
+
+def prepare_workspace(user):
+    user_dir = get_user_workspace(user)
+    for sub in ('jupyter', 'models', 'data'):
+        os.makedirs(os.path.join(user_dir, sub), exist_ok=True)
+    return user_dir
+
+
+def queue_conversion(model_id):
+    model = AIModel.objects.select_related('user').get(pk=model_id)
+    enqueue_model_conversion(model, conversion_kinds(model))
+
+@database_sync_to_async
+def get_container(user, container_type):
+    return DockerContainer.objects.select_related('node').filter(user=user, container_type=container_type).first()
+
+@database_sync_to_async
+def job_age(job_id):
+    created = Job.objects.filter(pk=job_id).values_list('created_at', flat=True).first()
+    return (timezone.now() - created).total_seconds() if created else None
+
+@database_sync_to_async
+def save_container(user, container_type, **fields):
+    DockerContainer.objects.update_or_create(user=user, container_type=container_type, defaults=fields)
+
+@database_sync_to_async
+def set_container_status(user, container_type, status, **fields):
+    DockerContainer.objects.filter(user=user, container_type=container_type).update(status=status, **fields)
+
+@database_sync_to_async
+def forget_container(user, container_type):
+    DockerContainer.objects.filter(user=user, container_type=container_type).delete()
+
+
+class Operation:
+    """One job being executed, with progress reporting to its audience"""
+
+    def __init__(self, job_id, user, action, params):
+        self.id = job_id
+        self.user = user
+        self.action = action
+        self.params = params
+
+    async def report(self, status, message='', **detail):
+        try:
+            await database_sync_to_async(update_job)(self.id, status, message, detail.get('result'))
+            channel_layer = get_channel_layer()
+            for user_id in await database_sync_to_async(job_audience)(self.id):
+                await channel_layer.group_send(operations_group(user_id), {
+                    'type': 'operation.progress',
+                    'operation': str(self.id),
+                    'action': self.action,
+                    'status': status,
+                    'message': message,
+                    **detail
+                })
+        except Exception as e:
+            logger.error(f"Progress report for {self.action} failed: {e}")
+
+
+class Orchestrator:
+    """
+    Executes queued jobs against the Docker Engine API.
+
+    Runs inside the `run_jobs` worker loop and talks to the daemons through
+    pooled async clients, pushing progress to every user waiting on a job.
+    `api` is the default DOCKER_HOST_URL daemon; registered DockerNodes get a
+    client each from `api_factory`, which tests can point at a fake engine.
+    """
+
+    def __init__(self, api=None, api_factory=DockerAPI):
+        self.api = api or api_factory()
+        self.api_factory = api_factory
+        self.node_apis = {}
+        self.container_locks = defaultdict(asyncio.Lock)  # (user id, container type) -> suspend/resume lock
+
+    def node_api(self, node):
+        """Client for a DockerNode, or the default daemon for None"""
+        if node is None or node.url == self.api.base_url:
+            return self.api
+        if node.url not in self.node_apis:
+            self.node_apis[node.url] = self.api_factory(node.url)
+        return self.node_apis[node.url]
+
+    async def container_api(self, user, container_type):
+        return self.node_api(await database_sync_to_async(container_node)(user, container_type))
+
+    async def gpu_devices(self, api, user, container_type):
+        """
+        Assigns a GPU to a GPU user's container. The inventory samples the
+        local nvidia-smi, so containers on other nodes keep getting every GPU.
+        """
+        if not user.gpu_access or api is not self.api:
+            return []
+        # The first inventory sample runs nvidia-smi inline
+        return await asyncio.to_thread(assign_gpu, user, container_type)
+
+    def network(self, api):
+        """CONTAINER_NETWORK for containers on the default daemon behind the proxy, where nginx reaches them by name"""
+        return settings.CONTAINER_NETWORK if proxy.enabled() and api is self.api else None
+
+    def upstream(self, node, user, container_type, host_port):
+        _, port = proxy.ROUTED_PORTS[container_type]
+        if self.network(self.node_api(node)):
+            return f"{container_name(user, container_type)}:{port.split('/')[0]}"
+        # Other nodes are not on the proxy's network, so nginx goes to the port published on the node
+        return f"{node.public_host}:{host_port}" if host_port else None
+
+    async def expose(self, api, node, user, container_type, container):
+        """
+        Makes a started container reachable; returns (host port, base URL).
+        Behind the proxy the URL is /u/<username>/<app|jupyter>/, otherwise the
+        daemon-assigned host port on the node.
+        """
+        _, port = proxy.ROUTED_PORTS[container_type]
+        host_port = published_port(await api.container_inspect(container), port)
+        if not proxy.enabled():
+            return host_port, f"http://{node.public_host if node else 'localhost'}:{host_port}/" if host_port else ''
+        upstream = self.upstream(node, user, container_type, host_port)
+        if upstream is None:
+            return host_port, ''
+        if await asyncio.to_thread(proxy.write_route, user, container_type, upstream):
+            await self.reload_proxy()
+        return host_port, proxy.route_path(user, container_type)
+
+    async def unroute(self, user, container_type):
+        if proxy.enabled() and await asyncio.to_thread(proxy.remove_route, user, container_type):
+            await self.reload_proxy()
+
+    async def reload_proxy(self):
+        """SIGHUP makes nginx start workers on the new routes while the old ones finish their connections"""
+        if not settings.PROXY_CONTAINER:
+            return
+        try:
+            await self.api.container_kill(settings.PROXY_CONTAINER, signal='HUP')
+        except DockerAPIError as e:
+            logger.error(f"Reloading {settings.PROXY_CONTAINER} failed: {e}")
+
+    async def sync_routes(self):
+        """Rebuilds every route from the container table, dropping those of containers that are gone"""
+        if not proxy.enabled():
+            return
+        rows = await database_sync_to_async(list)(
+            DockerContainer.objects.select_related('user', 'node').filter(
+                container_type__in=proxy.ROUTED_PORTS
+            ).exclude(status='removed')
+        )
+        routes = {}
+        for row in rows:
+            _, port = proxy.ROUTED_PORTS[row.container_type]
+            if row.suspended_at:
+                # Its next request has to reach the web app, which resumes it
+                upstream = proxy.WAKE_UPSTREAM
+            else:
+                upstream = self.upstream(row.node, row.user, row.container_type, row.port_bindings.get(port.replace('/', '_')))
+            if upstream:
+                routes[(row.user, row.container_type)] = upstream
+        if await asyncio.to_thread(proxy.sync_routes, routes):
+            await self.reload_proxy()
+
+    async def run(self, operation):
+        await operation.report('running', f"{operation.action} started")
+        try:
+            handler = getattr(self, f"do_{operation.action}")
+            result = await handler(operation, **operation.params)
+        except Exception as e:
+            logger.error(f"Container {operation.action} failed: {e}")
+            await operation.report('failed', str(e))
+            return None
+        await operation.report('done', f"{operation.action} finished", result=result)
+        return result
+
+    async def pull_image(self, operation, image_name, api=None):
+        layers = {}
+        last_report = 0
+        async for event in (api or self.api).image_pull(image_name):
+            if 'error' in event:
+                raise DockerAPIError(500, event['error'])
+            detail = event.get('progressDetail') or {}
+            if event.get('id') and detail.get('total'):
+                layers[event['id']] = (detail.get('current', 0), detail['total'])
+            now = asyncio.get_running_loop().time()
+            if now - last_report >= PROGRESS_INTERVAL:
+                last_report = now
+                await operation.report(
+                    'progress', event.get('status', ''),
+                    current=sum(current for current, _ in layers.values()),
+                    total=sum(total for _, total in layers.values())
+                )
+
+    async def ensure_image(self, operation, image_name, api=None):
+        api = api or self.api
+        try:
+            await api.image_inspect(image_name)
+        except DockerAPIError as e:
+            if e.status != 404:
+                raise
+            if api is self.api:
+                await self.do_pull(operation, image_name)
+            else:
+                await self.pull_image(operation, image_name, api)  # the image index covers the default daemon only
+
+    async def remove_if_exists(self, name, api=None):
+        try:
+            await (api or self.api).container_remove(name, force=True)
+        except DockerAPIError as e:
+            if e.status != 404:
+                raise
+
+    async def do_pull(self, operation, image_name):
+        await self.pull_image(operation, image_name)
+        image = await self.api.image_inspect(image_name)
+        await database_sync_to_async(record_pull)(
+            image_name, (image.get('RepoDigests') or [image['Id']])[0], image.get('Size', 0)
+        )
+
+    async def do_create(self, operation, image_name, container_type='regular'):
+        # The image was pulled by the pull job this one depends on
+        user = operation.user
+        user_dir = await asyncio.to_thread(prepare_workspace, user)
+
+        name = container_name(user)
+        await self.remove_if_exists(name, await self.container_api(user, 'regular'))
+        node = await database_sync_to_async(place)(user, 'regular')
+        try:
+            return await self.create_container(operation, user, user_dir, node, image_name)
+        except Exception:
+            # The old container is gone; a row left behind would keep reserving the node
+            await forget_container(user, 'regular')
+            raise
+
+    async def create_container(self, operation, user, user_dir, node, image_name):
+        api = self.node_api(node)
+        name = container_name(user)
+        await self.ensure_image(operation, image_name, api)
+        gpu_devices = await self.gpu_devices(api, user, 'regular')
+        # Off the proxy network the daemon picks a free host port; it is read back on start
+        created = await api.container_create(name, container_config(
+            user, image_name,
+            binds={user_dir: {'bind': '/workspace', 'mode': 'rw'}},
+            ports={'80/tcp': ''},
+            network=self.network(api),
+            gpu_devices=gpu_devices
+        ))
+        await save_container(
+            user, 'regular',
+            container_id=created['Id'],
+            image_name=image_name,
+            status='created',
+            port_bindings={},
+            access_url='',
+            gpu_devices=gpu_devices
+        )
+        return created['Id']
+
+    async def do_start(self, operation, container_type='regular'):
+        user = operation.user
+        row = await get_container(user, container_type)
+        if row and row.suspended_at:
+            return (await self.do_resume(operation, container_type) or {}).get('url')
+        node = row.node if row else None
+        api = self.node_api(node)
+        name = container_name(user, container_type)
+        await api.container_start(name)
+        if container_type not in proxy.ROUTED_PORTS:
+            await set_container_status(user, container_type, 'running')
+            return None
+        # Ports are not pinned, so every start is exposed again on the port the daemon picked
+        port, url = await self.expose(api, node, user, container_type, name)
+        if container_type == 'jupyter':
+            url = jupyter_url(url, access_token(row.access_url if row else ''))
+        _, exposed = proxy.ROUTED_PORTS[container_type]
+        await save_container(
+            user, container_type,
+            status='running',
+            port_bindings={exposed.replace('/', '_'): port},
+            access_url=url,
+            last_active_at=timezone.now()
+        )
+        return url
+
+    async def do_stop(self, operation, container_type='regular'):
+        api = await self.container_api(operation.user, container_type)
+        # A paused container is stopped as well; a checkpointed one has exited already
+        await api.container_stop(container_name(operation.user, container_type))
+        await set_container_status(operation.user, container_type, 'stopped', suspended_at=None, suspend_mode='')
+
+    async def do_suspend(self, operation, container_type='regular'):
+        """
+        Pauses or checkpoints an idle container (IDLE_SUSPEND_MODE) and points
+        its route at the web app, which resumes it on the next request.
+        """
+        if not proxy.enabled():
+            # Only the proxy sends a suspended container's next request to the web app
+            raise RuntimeError("Suspending needs the proxy (PROXY_ROUTES_DIR and CONTAINER_NETWORK), nothing would resume it")
+        user = operation.user
+        async with self.container_locks[(user.id, container_type)]:
+            row = await get_container(user, container_type)
+            if row is None or row.suspended_at or row.status != 'running':
+                return None
+            api = self.node_api(row.node)
+            name = container_name(user, container_type)
+            # Marked first, so a request that reaches the web app finds something to resume
+            await save_container(user, container_type, suspended_at=timezone.now(), suspend_mode=settings.IDLE_SUSPEND_MODE)
+            try:
+                if await asyncio.to_thread(proxy.write_route, user, container_type, proxy.WAKE_UPSTREAM):
+                    await self.reload_proxy()
+                if settings.IDLE_SUSPEND_MODE == 'checkpoint':
+                    await self.remove_checkpoint(api, name)
+                    await api.checkpoint_create(name, CHECKPOINT_NAME)
+                else:
+                    await api.container_pause(name)
+            except Exception:
+                # Route back to the container, which is still running
+                await self.expose(api, row.node, user, container_type, name)
+                await set_container_status(user, container_type, 'running', suspended_at=None, suspend_mode='')
+                raise
+        logger.info(f"Suspended idle container {name} ({settings.IDLE_SUSPEND_MODE})")
+        return {'mode': settings.IDLE_SUSPEND_MODE}
+
+    async def do_resume(self, operation, container_type='regular'):
+        async with self.container_locks[(operation.user.id, container_type)]:
+            row = await get_container(operation.user, container_type)
+            if row is None or row.suspended_at is None:
+                return None
+            return await self.resume(operation, row)
+
+    async def resume(self, operation, row):
+        """
+        Unpauses or restores a suspended container and routes it again.
+        The recorded latency runs from when the job was queued, which is when
+        the first request for the container arrived.
+        """
+        user, container_type = operation.user, row.container_type
+        api = self.node_api(row.node)
+        name = container_name(user, container_type)
+        started = time.monotonic()
+        state = (await api.container_inspect(name)).get('State', {})
+        if state.get('Paused'):
+            await api.container_unpause(name)
+        elif not state.get('Running'):
+            await database_sync_to_async(reclaim)(user, container_type)
+            await api.container_start(name, checkpoint=CHECKPOINT_NAME)
+            await self.remove_checkpoint(api, name)
+        port, url = await self.expose(api, row.node, user, container_type, name)
+        elapsed = time.monotonic() - started
+        latency = await job_age(operation.id) or elapsed
+        _, exposed = proxy.ROUTED_PORTS[container_type]
+        await save_container(
+            user, container_type,
+            status='running',
+            port_bindings={exposed.replace('/', '_'): port},
+            suspended_at=None,
+            suspend_mode='',
+            last_active_at=timezone.now(),
+            resume_seconds=latency
+        )
+        logger.info(f"Resumed {name} in {elapsed:.3f}s, {latency:.3f}s after it was requested")
+        return {'url': row.access_url or url, 'resume_seconds': latency}
+
+    async def remove_checkpoint(self, api, name):
+        try:
+            await api.checkpoint_delete(name, CHECKPOINT_NAME)
+        except DockerAPIError as e:
+            if e.status != 404:
+                raise
+
+    async def do_delete(self, operation, container_type='regular'):
+        api = await self.container_api(operation.user, container_type)
+        await api.container_remove(container_name(operation.user, container_type), force=True)
+        await forget_container(operation.user, container_type)
+        await self.unroute(operation.user, container_type)
+
+    async def do_jupyter_start(self, operation, image_name=JUPYTER_IMAGE, container_type='jupyter'):
+        user = operation.user
+        user_dir = await asyncio.to_thread(prepare_workspace, user)
+        name = container_name(user, 'jupyter')
+        await self.remove_if_exists(name, await self.container_api(user, 'jupyter'))
+        for container_id in await database_sync_to_async(release_user_slots)(user):
+            await self.remove_if_exists(container_id)
+        node = await database_sync_to_async(place)(user, 'jupyter')
+        try:
+            return await self.launch_jupyter(operation, user, user_dir, node, image_name)
+        except Exception:
+            # The old container is gone; a row left behind would keep reserving the node
+            await forget_container(user, 'jupyter')
+            raise
+
+    async def launch_jupyter(self, operation, user, user_dir, node, image_name):
+        api = self.node_api(node)
+        name = container_name(user, 'jupyter')
+        token = generate_jupyter_token()
+
+        # GPU users need the nvidia runtime, which cannot be added to a pool container.
+        # The warm pool lives on the default daemon.
+        warm = None
+        if not user.gpu_access and api is self.api:
+            warm = await database_sync_to_async(claim_slot)(user, image_name)
+
+        base_url = proxy.route_path(user, 'jupyter') if proxy.enabled() else None
+        gpu_devices = []
+        if warm:
+            await asyncio.to_thread(attach_workspace, warm.slot, user_dir, token, base_url)
+            await api.container_update(warm.container_id, resource_limits(user))
+            await api.container_rename(warm.container_id, name)
+            container_id = warm.container_id
+            await database_sync_to_async(enqueue_pool_refill)()
+        else:
+            await self.ensure_image(operation, image_name, api)
+            gpu_devices = await self.gpu_devices(api, user, 'jupyter')
+            environment = {'JUPYTER_TOKEN': token, 'GRANT_SUDO': 'yes'}
+            if base_url:
+                environment['NOTEBOOK_ARGS'] = f"--ServerApp.base_url={base_url}"
+            created = await api.container_create(name, container_config(
+                user, image_name,
+                binds={
+                    os.path.join(user_dir, subdir): {'bind': bind, 'mode': mode}
+                    for subdir, bind, mode in SLOT_MOUNTS.values()
+                },
+                ports={'8888/tcp': ''},
+                environment=environment,
+                network=self.network(api),
+                gpu_devices=gpu_devices
+            ))
+            container_id = created['Id']
+        # Pool containers are created, not booted: their mounts and token take effect here
+        await api.container_start(container_id)
+
+        port, base = await self.expose(api, node, user, 'jupyter', container_id)
+        url = jupyter_url(base, token)
+        await save_container(
+            user, 'jupyter',
+            container_id=container_id,
+            image_name=image_name,
+            status='running',
+            port_bindings={'8888_tcp': port},
+            access_url=url,
+            last_active_at=timezone.now(),
+            suspended_at=None,
+            suspend_mode='',
+            gpu_devices=gpu_devices
+        )
+        return url
+
+    async def do_pool_refill(self, operation, image_name=JUPYTER_IMAGE):
+        """Creates or drops idle pool containers to match recent demand"""
+        missing, surplus = await database_sync_to_async(pool_plan)(image_name)
+        for slot, container_id in surplus:
+            await self.remove_if_exists(container_id)
+            await database_sync_to_async(discard_slot)(slot)
+        if missing:
+            await self.ensure_image(operation, image_name)
+        for _ in range(missing):
+            slot = await database_sync_to_async(create_slot)(image_name)
+            try:
+                created = await self.api.container_create(f"jupyter_pool_{slot}", container_config(
+                    None, image_name,
+                    binds=slot_binds(slot),
+                    ports={'8888/tcp': ''},
+                    environment={'GRANT_SUDO': 'yes'},
+                    labels={'webui.pool': 'jupyter'},
+                    network=self.network(self.api)
+                ))
+            except Exception:
+                await database_sync_to_async(discard_slot)(slot)
+                raise
+            await database_sync_to_async(mark_ready)(slot, created['Id'])
+        return {'created': missing, 'removed': len(surplus)}
+
+    async def do_validate_model(self, operation, model_id):
+        """Checks that an uploaded model loads and runs as its framework, recording its signature"""
+        target = await database_sync_to_async(begin_validation)(model_id)
+        if target is None:
+            return None
+        try:
+            info = await asyncio.to_thread(inspect_model, *target, settings.MODEL_VALIDATION_TIMEOUT)
+        except Exception as e:
+            error = str(e) if isinstance(e, ModelRuntimeError) else f"{type(e).__name__}: {e}"
+            await database_sync_to_async(record_validation)(model_id, error=error)
+            raise
+        await database_sync_to_async(record_validation)(model_id, info)
+        if settings.MODEL_AUTO_CONVERT:
+            await database_sync_to_async(queue_conversion)(model_id)
+        return {'model_id': model_id, 'parameters': info['parameters']}
+
+    async def do_convert_model(self, operation, model_id, kinds):
+        """Builds ONNX, int8 and fp16 variants of a model and benchmarks them against the source"""
+        target = await database_sync_to_async(begin_conversion)(model_id, kinds)
+        if target is None:
+            return None
+        path, framework, workdir = target
+        try:
+            result = await asyncio.to_thread(
+                run_isolated, convert_model,
+                (
+                    path, framework, kinds, workdir,
+                    settings.SERVING_WORKER_THREADS, settings.MODEL_BENCHMARK_RUNS, settings.MODEL_VARIANT_TOLERANCE
+                ),
+                settings.MODEL_CONVERSION_TIMEOUT
+            )
+            await database_sync_to_async(record_conversion)(model_id, result)
+        except Exception as e:
+            await database_sync_to_async(fail_conversion)(model_id, kinds, str(e))
+            raise
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+        return {
+            'model_id': model_id,
+            'latency': result['latency'],
+            'variants': {kind: outcome.get('latency') for kind, outcome in result['variants'].items()}
+        }
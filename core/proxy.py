@@ -0,0 +1,128 @@
+import logging
+import os
+import re
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+ROUTE_PREFIX = '/u'
+# Container type -> path segment under /u/<username>/ and the port served inside the container
+ROUTED_PORTS = {
+    'regular': ('app', '80/tcp'),
+    'jupyter': ('jupyter', '8888/tcp'),
+}
+WAKE_UPSTREAM = 'django'  # nginx upstream of the web app, which resumes suspended containers
+ACCESS_DIR = 'access'  # subdirectory of PROXY_ROUTES_DIR with one request log per route
+NGINX_ROUTES_DIR = '/etc/nginx/routes'  # where nginx sees PROXY_ROUTES_DIR (docker-compose.yml)
+ROUTE_TEMPLATE = """# Managed by WebUI, rewritten when the container starts or is suspended
+location {path} {{
+    access_log {access_log} route_access;
+    set $container_upstream {upstream};
+{rewrite}    proxy_pass http://$container_upstream;
+    proxy_http_version 1.1;
+    proxy_set_header Upgrade $http_upgrade;
+    proxy_set_header Connection "upgrade";
+    proxy_set_header Host $host;
+    proxy_set_header X-Real-IP $remote_addr;
+    proxy_set_header X-Forwarded-For $proxy_add_x_forwarded_for;
+    proxy_set_header X-Forwarded-Proto $scheme;
+    proxy_redirect off;
+    proxy_buffering off;
+    proxy_read_timeout 1d;
+}}
+"""
+
+
+def enabled():
+    return bool(settings.PROXY_ROUTES_DIR and settings.CONTAINER_NETWORK)
+
+def route_path(user, container_type):
+    segment, _ = ROUTED_PORTS[container_type]
+    return f"{ROUTE_PREFIX}/{user.username}/{segment}/"
+
+def route_file(user, container_type):
+    return os.path.join(settings.PROXY_ROUTES_DIR, f"{user.id}_{container_type}.conf")
+
+def access_log(user, container_type):
+    return os.path.join(settings.PROXY_ROUTES_DIR, ACCESS_DIR, f"{user.id}_{container_type}.log")
+
+def render_route(user, container_type, upstream):
+    """
+    nginx location for one container. The upstream is a variable, so nginx
+    resolves it per request and a stopped container cannot fail a reload.
+    Jupyter is told its base_url and keeps the prefix; other apps get it
+    stripped. A WAKE_UPSTREAM route sends the whole path to the web app.
+    """
+    path = route_path(user, container_type)
+    rewrite = ''
+    if container_type != 'jupyter' and upstream != WAKE_UPSTREAM:
+        rewrite = f"    rewrite ^{re.escape(path)}(.*)$ /$1 break;\n"
+    return ROUTE_TEMPLATE.format(
+        path=path,
+        access_log=f"{NGINX_ROUTES_DIR}/{ACCESS_DIR}/{user.id}_{container_type}.log",
+        upstream=upstream,
+        rewrite=rewrite
+    )
+
+def write_route(user, container_type, upstream):
+    """Writes the route atomically; returns whether nginx needs a reload"""
+    text = render_route(user, container_type, upstream)
+    path = route_file(user, container_type)
+    try:
+        with open(path) as f:
+            if f.read() == text:
+                return False
+    except FileNotFoundError:
+        pass
+    # nginx refuses a config whose log directory is missing
+    os.makedirs(os.path.join(settings.PROXY_ROUTES_DIR, ACCESS_DIR), exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, 'w') as f:
+        f.write(text)
+    os.replace(tmp, path)  # nginx never reads a half-written file
+    return True
+
+def remove_route(user, container_type):
+    try:
+        os.remove(route_file(user, container_type))
+    except FileNotFoundError:
+        return False
+    return True
+
+def last_request(user, container_type):
+    """
+    Time of the last request proxied to a container since the previous call,
+    or None. The log holds one $msec line per request and is emptied as it is
+    read; nginx appends, so it keeps writing at the new end.
+    """
+    try:
+        with open(access_log(user, container_type), 'rb+') as f:
+            size = f.seek(0, os.SEEK_END)
+            if not size:
+                return None
+            f.seek(max(0, size - 64))
+            lines = f.read().split()
+            f.truncate(0)
+    except FileNotFoundError:
+        return None
+    try:
+        return float(lines[-1])
+    except (IndexError, ValueError):
+        return None
+
+def sync_routes(routes):
+    """
+    Rewrites the routes directory to exactly {(user, container type): upstream};
+    returns whether anything changed.
+    """
+    wanted = set()
+    changed = False
+    for (user, container_type), upstream in routes.items():
+        wanted.add(os.path.basename(route_file(user, container_type)))
+        changed |= write_route(user, container_type, upstream)
+    if os.path.isdir(settings.PROXY_ROUTES_DIR):
+        for name in os.listdir(settings.PROXY_ROUTES_DIR):
+            if name.endswith('.conf') and name not in wanted:
+                os.remove(os.path.join(settings.PROXY_ROUTES_DIR, name))
+                changed = True
+    return changed
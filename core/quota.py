@@ -0,0 +1,177 @@
+import asyncio
+import json
+import logging
+import os
+from importlib import import_module
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.contrib.auth import SESSION_KEY
+from django.core.files.uploadhandler import FileUploadHandler, StopUpload
+from django.db.models import F
+from django.http.cookie import parse_cookie
+from users.models import CustomUser
+from .file_utils import get_user_workspace
+from .models import UserFile, AIModel
+
+logger = logging.getLogger(__name__)
+
+
+class QuotaExceeded(Exception):
+    pass
+
+
+def remaining(user):
+    """Bytes the user may still store, read from the ledger in O(1)"""
+    return user.storage_limit_bytes - user.storage_used
+
+def check_quota(user, incoming):
+    if incoming > remaining(user):
+        raise QuotaExceeded(
+            f"Upload of {incoming} bytes exceeds your storage quota "
+            f"({user.storage_used} of {user.storage_limit_bytes} bytes used)"
+        )
+
+def charge(user_id, delta):
+    """Applies a usage delta to the ledger without reading it first"""
+    if delta:
+        CustomUser.objects.filter(pk=user_id).update(storage_used=F('storage_used') + delta)
+
+
+class QuotaUploadHandler(FileUploadHandler):
+    """
+    First upload handler: rejects a multipart upload from its Content-Length
+    before any file body is read, so over-quota uploads never reach disk.
+    Views check `request.quota_exceeded` to report the rejection.
+    """
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        user = getattr(self.request, 'user', None)
+        self.exceeded = False
+        if user is not None and user.is_authenticated:
+            self.exceeded = content_length > remaining(user)
+            self.request.quota_exceeded = self.exceeded
+
+    def new_file(self, *args, **kwargs):
+        if self.exceeded:
+            raise StopUpload(connection_reset=True)
+
+    def receive_data_chunk(self, raw_data, start):
+        return raw_data
+
+    def file_complete(self, file_size):
+        return None
+
+
+@database_sync_to_async
+def session_remaining(session_key):
+    """Remaining quota of the session's user, or None for anonymous sessions"""
+    session = import_module(settings.SESSION_ENGINE).SessionStore(session_key)
+    user = CustomUser.objects.filter(pk=session.get(SESSION_KEY)).first()
+    return remaining(user) if user else None
+
+
+class QuotaMiddleware:
+    """
+    ASGI middleware answering 413 to an over-quota upload from its
+    Content-Length, before Django spools the body to disk. Bodies up to
+    FILE_UPLOAD_MAX_MEMORY_SIZE skip the session lookup; QuotaUploadHandler
+    covers those once the request reaches Django.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http' and scope['method'] in ('POST', 'PUT'):
+            headers = dict(scope['headers'])
+            try:
+                length = int(headers.get(b'content-length', b'0'))
+            except ValueError:
+                length = 0
+            if length > settings.FILE_UPLOAD_MAX_MEMORY_SIZE:
+                cookies = parse_cookie(headers.get(b'cookie', b'').decode('latin-1'))
+                session_key = cookies.get(settings.SESSION_COOKIE_NAME)
+                left = await session_remaining(session_key) if session_key else None
+                if left is not None and length > left:
+                    await self.reject(send)
+                    return
+        await self.app(scope, receive, send)
+
+    async def reject(self, send):
+        body = json.dumps({'error': 'Upload exceeds your storage quota'}).encode()
+        await send({
+            'type': 'http.response.start',
+            'status': 413,
+            'headers': [
+                (b'content-type', b'application/json'),
+                (b'content-length', str(len(body)).encode()),
+                (b'connection', b'close'),
+            ]
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+
+def user_roots(user):
+    """Directories holding a user's data; uploads live in the container workspace"""
+    return [get_user_workspace(user)]
+
+def scan_usage(user):
+    """Bytes under the user's directories, counting hard-linked files once"""
+    total = 0
+    seen = set()
+    stack = [root for root in user_roots(user) if os.path.isdir(root)]
+    while stack:
+        try:
+            entries = os.scandir(stack.pop())
+        except OSError:
+            continue
+        with entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        st = entry.stat(follow_symlinks=False)
+                        if (st.st_dev, st.st_ino) not in seen:
+                            seen.add((st.st_dev, st.st_ino))
+                            total += st.st_size
+                except OSError:
+                    continue
+    return total
+
+def backfill_sizes(user):
+    """Records sizes of files saved before the ledger existed"""
+    for model, field in ((UserFile, 'file'), (AIModel, 'model_file')):
+        for instance in model.objects.filter(user=user, size=0):
+            try:
+                size = getattr(instance, field).size
+            except OSError:
+                continue
+            model.objects.filter(pk=instance.pk).update(size=size)
+
+def reconcile_user(user):
+    """
+    Corrects the ledger from a filesystem scan, which also sees files written
+    from inside containers. Only the drift measured against the ledger value
+    at scan start is applied, so concurrent uploads are not lost.
+    """
+    backfill_sizes(user)
+    before = CustomUser.objects.filter(pk=user.pk).values_list('storage_used', flat=True).get()
+    drift = scan_usage(user) - before
+    charge(user.pk, drift)
+    return drift
+
+def reconcile_all():
+    for user in CustomUser.objects.all().iterator():
+        try:
+            drift = reconcile_user(user)
+            if drift:
+                logger.info(f"Storage ledger of {user.username} corrected by {drift} bytes")
+        except Exception as e:
+            logger.error(f"Storage reconcile for {user.username} failed: {e}")
+
+
+async def storage_reconcile_loop():
+    while True:
+        await database_sync_to_async(reconcile_all)()
+        await asyncio.sleep(settings.STORAGE_RECONCILE_INTERVAL)
@@ -0,0 +1,133 @@
+import asyncio
+import logging
+from collections import defaultdict
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from .models import DockerContainer
+
+logger = logging.getLogger(__name__)
+
+RETRY_DELAY = 5  # seconds before resubscribing after the events stream broke
+UNSET_CONTAINER_ID = 'default_container_id'  # DockerContainer.container_id before a create finished
+# Docker container state -> DockerContainer.status
+STATE_STATUS = {
+    'created': 'created',
+    'running': 'running',
+    'restarting': 'running',
+    'paused': 'paused',
+    'removing': 'stopped',
+    'exited': 'stopped',
+    'dead': 'stopped',
+}
+# Container event action -> DockerContainer.status
+EVENT_STATUS = {
+    'create': 'created',
+    'start': 'running',
+    'restart': 'running',
+    'unpause': 'running',
+    'pause': 'paused',
+    'die': 'stopped',
+    'destroy': 'removed',
+}
+
+
+def apply_statuses(statuses, node_id=None, before=None):
+    """
+    Writes {container id: status} with one UPDATE per distinct status.
+    With `before`, rows saved since then are left alone, so a full resync
+    cannot overwrite a container created while the daemon was being listed.
+    """
+    by_status = defaultdict(list)
+    for container_id, status in statuses.items():
+        by_status[status].append(container_id)
+    changed = 0
+    with transaction.atomic():
+        for status, ids in by_status.items():
+            rows = DockerContainer.objects.filter(node_id=node_id, container_id__in=ids).exclude(status=status)
+            if before is not None:
+                rows = rows.filter(updated_at__lt=before)
+            changed += rows.update(status=status)
+    return changed
+
+def resync(states, node_id, before):
+    """Full reconcile of one node's rows against {container id: state} of every container on its daemon"""
+    known = DockerContainer.objects.filter(node_id=node_id).exclude(
+        container_id=UNSET_CONTAINER_ID
+    ).values_list('container_id', flat=True)
+    return apply_statuses({
+        container_id: STATE_STATUS.get(states[container_id], 'stopped') if container_id in states else 'removed'
+        for container_id in known
+    }, node_id, before)
+
+
+class ContainerReconciler:
+    """
+    Keeps DockerContainer.status of one node's rows in step with its daemon,
+    so views never ask it.
+
+    Container events are folded into a pending map (last event per container
+    wins) and written in bulk every CONTAINER_EVENT_FLUSH_INTERVAL. Every
+    CONTAINER_RESYNC_INTERVAL, and whenever the events stream is reopened, the
+    whole table is reconciled against a container listing; the stream is
+    opened with `since` set to before that listing so no event falls in the gap.
+    """
+
+    def __init__(self, api, node_id=None):
+        self.api = api
+        self.node_id = node_id  # None: rows on the default DOCKER_HOST_URL daemon
+        self.pending = {}
+
+    async def resync(self):
+        """Reconciles every row; returns the timestamp the listing was taken at"""
+        started = timezone.now()
+        containers = await self.api.containers_list(all=True)
+        states = {c['Id']: c['State'] for c in containers}
+        changed = await database_sync_to_async(resync)(states, self.node_id, started)
+        if changed:
+            logger.info(f"Container resync corrected {changed} rows")
+        return started.timestamp()
+
+    async def watch(self):
+        since = await self.resync()
+        filters = {'type': ['container'], 'event': list(EVENT_STATUS)}
+        async for event in self.api.events(filters=filters, since=int(since)):
+            status = EVENT_STATUS.get(event.get('Action') or event.get('status'))
+            container_id = event.get('Actor', {}).get('ID') or event.get('id')
+            if status and container_id:
+                self.pending[container_id] = status
+
+    async def flush(self):
+        if not self.pending:
+            return
+        pending, self.pending = self.pending, {}
+        try:
+            await database_sync_to_async(apply_statuses)(pending, self.node_id)
+        except Exception as e:
+            logger.error(f"Writing container events failed: {e}")
+            self.pending = {**pending, **self.pending}
+
+    async def watch_loop(self):
+        while True:
+            try:
+                await self.watch()
+            except Exception as e:
+                logger.error(f"Docker events stream failed: {e}")
+            await asyncio.sleep(RETRY_DELAY)
+
+    async def flush_loop(self):
+        while True:
+            await asyncio.sleep(settings.CONTAINER_EVENT_FLUSH_INTERVAL)
+            await self.flush()
+
+    async def resync_loop(self):
+        while True:
+            await asyncio.sleep(settings.CONTAINER_RESYNC_INTERVAL)
+            try:
+                await self.resync()
+            except Exception as e:
+                logger.error(f"Container resync failed: {e}")
+
+    async def run(self):
+        await asyncio.gather(self.watch_loop(), self.flush_loop(), self.resync_loop())
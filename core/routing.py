@@ -4,4 +4,5 @@ from . import consumers
 websocket_urlpatterns = [
     re_path(r'ws/monitoring/$', consumers.MonitoringConsumer.as_asgi()),
     re_path(r'ws/container/(?P<container_id>\w+)/$', consumers.ContainerConsumer.as_asgi()),
+    re_path(r'ws/operations/$', consumers.OperationConsumer.as_asgi()),
 ]
\ No newline at end of file
@@ -0,0 +1,117 @@
+import asyncio
+import logging
+import socket
+import uuid
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
+from .models import DockerContainer
+from .docker_utils import client
+from .monitoring import get_system_stats
+
+logger = logging.getLogger(__name__)
+
+MONITORING_GROUP = 'monitoring'
+
+
+def host_group():
+    """Group of this host's dashboards; every host samples and publishes its own stats"""
+    return f"{MONITORING_GROUP}.{socket.gethostname()}"
+
+
+def collect_system_stats():
+    """Collects one system-wide sample for the monitoring dashboards, None when psutil failed"""
+    system = get_system_stats()
+    if system is None:
+        return None
+    return {
+        'cpu': system['cpu']['percent'],
+        'memory': system['memory']['percent'],
+        'disk': system['disk']['percent'],
+        'age': system['age'],
+        'containers': len(client.containers.list()) if client else 0,
+        'active_users': DockerContainer.objects.filter(status='running').count()
+    }
+
+
+class StatsSampler:
+    """
+    Samples system stats once per tick and broadcasts them to this host's group.
+
+    Consumers only subscribe, so the sampling cost does not grow with the
+    number of open dashboards. When the channel layer is Redis backed, a
+    short lease keeps a single publishing sampler per host even if several
+    ASGI processes have subscribers; the group is per host too, so
+    dashboards never get samples of different hosts interleaved.
+    """
+
+    def __init__(self, group=None, interval=None):
+        self.group = group or host_group()
+        self.interval = interval or settings.MONITORING_SAMPLE_INTERVAL
+        self.subscribers = 0
+        self.latest = None
+        self._task = None
+        self._redis = None
+        self._lease_key = f"monitoring:sampler:{socket.gethostname()}"
+        self._lease_token = uuid.uuid4().hex
+
+    def subscribe(self):
+        self.subscribers += 1
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+
+    def unsubscribe(self):
+        self.subscribers = max(0, self.subscribers - 1)
+
+    def _get_redis(self):
+        if self._redis is None:
+            layer = settings.CHANNEL_LAYERS.get('default', {})
+            if not layer.get('BACKEND', '').startswith('channels_redis'):
+                return None
+            import redis.asyncio as aioredis
+            host = layer.get('CONFIG', {}).get('hosts', [('127.0.0.1', 6379)])[0]
+            if isinstance(host, str):
+                self._redis = aioredis.Redis.from_url(host)
+            elif isinstance(host, dict):
+                self._redis = aioredis.Redis.from_url(host['address'])
+            else:
+                self._redis = aioredis.Redis(host=host[0], port=host[1])
+        return self._redis
+
+    async def _acquire_lease(self):
+        """Returns True if this process should publish on this tick"""
+        redis = self._get_redis()
+        if redis is None:
+            return True
+        ttl = int(self.interval * 2000)
+        try:
+            if await redis.set(self._lease_key, self._lease_token, nx=True, px=ttl):
+                return True
+            if (await redis.get(self._lease_key) or b'').decode() == self._lease_token:
+                await redis.pexpire(self._lease_key, ttl)
+                return True
+            return False
+        except Exception as e:
+            logger.error(f"Sampler lease check failed: {e}")
+            return True
+
+    async def _run(self):
+        channel_layer = get_channel_layer()
+        while self.subscribers > 0:
+            try:
+                if await self._acquire_lease():
+                    stats = await database_sync_to_async(collect_system_stats)()
+                    # Without a snapshot the dashboards keep the last one; the collector logged why
+                    if stats is not None:
+                        self.latest = stats
+                        await channel_layer.group_send(self.group, {
+                            'type': 'monitoring.stats',
+                            'stats': self.latest
+                        })
+            except Exception as e:
+                logger.error(f"Stats sampling failed: {e}")
+            await asyncio.sleep(self.interval)
+        self._task = None
+
+
+sampler = StatsSampler()
@@ -0,0 +1,151 @@
+import asyncio
+import logging
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.utils import timezone
+from .models import DockerContainer, DockerNode
+from .reconciler import ContainerReconciler
+
+logger = logging.getLogger(__name__)
+
+POLICIES = ('spread', 'binpack')
+
+
+class SchedulingError(Exception):
+    pass
+
+
+class NodeLoad:
+    """Capacity and reservations of one node at placement time"""
+
+    def __init__(self, node, cpu_reserved=0, memory_reserved=0, containers=0):
+        self.node = node
+        self.cpu_capacity = node.cpu_total * settings.NODE_CPU_OVERCOMMIT
+        self.memory_capacity = node.memory_total * settings.NODE_MEMORY_OVERCOMMIT
+        self.cpu_free = self.cpu_capacity - cpu_reserved
+        self.memory_free = self.memory_capacity - memory_reserved
+        self.containers = containers
+
+    def fits(self, cpu, memory):
+        # Nodes whose capacity was never read cannot take anything
+        return self.cpu_capacity > 0 and self.memory_capacity > 0 and cpu <= self.cpu_free and memory <= self.memory_free
+
+    def headroom(self, cpu, memory):
+        """Share of the scarcer resource left once the container is placed"""
+        return min((self.cpu_free - cpu) / self.cpu_capacity, (self.memory_free - memory) / self.memory_capacity)
+
+
+def demand(user):
+    """(cores, bytes) a user's container reserves: its cgroup limits"""
+    return float(user.cpu_limit), user.ram_limit * 1024 * 1024
+
+def choose_node(loads, cpu, memory, policy='spread'):
+    """
+    Picks the node for a container from NodeLoads, or None when none fits.
+    'spread' keeps the most headroom on every node; 'binpack' fills the
+    fullest node that still fits, leaving whole nodes free for big requests.
+    """
+    if policy not in POLICIES:
+        raise SchedulingError(f"Unknown scheduling policy: {policy}")
+    candidates = [load for load in loads if load.fits(cpu, memory)]
+    if not candidates:
+        return None
+    if policy == 'binpack':
+        best = min(candidates, key=lambda load: (load.headroom(cpu, memory), -load.containers, load.node.name))
+    else:
+        best = max(candidates, key=lambda load: (load.headroom(cpu, memory), -load.containers, load.node.name))
+    return best.node
+
+def node_loads(nodes, exclude=None):
+    """
+    Reservations per node. Every container that still exists holds its
+    owner's limits, so starting a stopped container can never overcommit.
+    Checkpointed containers hold nothing until they are restored (reclaim()).
+    """
+    reserved = DockerContainer.objects.filter(node__in=nodes).exclude(status='removed').exclude(suspend_mode='checkpoint')
+    if exclude is not None:
+        reserved = reserved.exclude(pk=exclude)
+    totals = {
+        row['node']: row for row in reserved.values('node').annotate(
+            cpu=Sum('user__cpu_limit'), memory=Sum('user__ram_limit'), containers=Count('pk')
+        )
+    }
+    loads = []
+    for node in nodes:
+        row = totals.get(node.pk, {})
+        loads.append(NodeLoad(
+            node,
+            cpu_reserved=row.get('cpu') or 0,
+            memory_reserved=(row.get('memory') or 0) * 1024 * 1024,
+            containers=row.get('containers', 0)
+        ))
+    return loads
+
+def place(user, container_type):
+    """
+    Chooses a node for the user's container and records it on the
+    DockerContainer row in the same transaction, so concurrent placements
+    see each other's reservations. Returns None when no nodes are
+    registered, meaning the single DOCKER_HOST_URL daemon.
+    """
+    with transaction.atomic():
+        nodes = list(DockerNode.objects.select_for_update().filter(enabled=True))
+        if not nodes:
+            if DockerNode.objects.exists():
+                raise SchedulingError("Every Docker node is disabled")
+            return None
+        row = DockerContainer.objects.filter(user=user, container_type=container_type).first()
+        cpu, memory = demand(user)
+        node = choose_node(node_loads(nodes, exclude=row.pk if row else None), cpu, memory, settings.SCHEDULER_POLICY)
+        if node is None:
+            raise SchedulingError(f"No Docker node has {cpu:g} CPUs and {memory // 2**20}MB unreserved")
+        DockerContainer.objects.update_or_create(user=user, container_type=container_type, defaults={'node': node})
+        return node
+
+def reclaim(user, container_type):
+    """
+    Reserves a checkpointed container's limits again before it is restored.
+    A checkpoint can only be restored where it was taken, so this raises
+    SchedulingError when its node filled up in the meantime.
+    """
+    with transaction.atomic():
+        row = DockerContainer.objects.filter(user=user, container_type=container_type).first()
+        if row is None or row.suspend_mode != 'checkpoint':
+            return
+        if row.node_id is not None:
+            node = DockerNode.objects.select_for_update().get(pk=row.node_id)
+            cpu, memory = demand(user)
+            if not node_loads([node], exclude=row.pk)[0].fits(cpu, memory):
+                raise SchedulingError(f"Docker node {node.name} no longer has {cpu:g} CPUs and {memory // 2**20}MB free")
+        DockerContainer.objects.filter(pk=row.pk).update(suspend_mode='')
+
+def container_node(user, container_type):
+    """Node currently holding the user's container, None for the default daemon"""
+    row = DockerContainer.objects.select_related('node').filter(user=user, container_type=container_type).first()
+    return row.node if row else None
+
+def record_capacity(node_id, info):
+    DockerNode.objects.filter(pk=node_id).update(
+        cpu_total=info.get('NCPU', 0),
+        memory_total=info.get('MemTotal', 0),
+        last_seen=timezone.now()
+    )
+
+async def node_refresh_loop(orchestrator):
+    """Refreshes node capacity from /info and starts a reconciler for every new node"""
+    watched = {}
+    while True:
+        nodes = await database_sync_to_async(list)(DockerNode.objects.all())
+        for node_id in set(watched) - {node.pk for node in nodes}:
+            watched.pop(node_id).cancel()
+        for node in nodes:
+            api = orchestrator.node_api(node)
+            try:
+                await database_sync_to_async(record_capacity)(node.pk, await api.info())
+            except Exception as e:
+                logger.error(f"Docker node {node.name} unreachable: {e}")
+            if node.pk not in watched:
+                watched[node.pk] = asyncio.ensure_future(ContainerReconciler(api, node.pk).run())
+        await asyncio.sleep(settings.NODE_REFRESH_INTERVAL)
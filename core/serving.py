@@ -0,0 +1,342 @@
+import asyncio
+import logging
+import time
+from collections import Counter, OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import psutil
+from django.conf import settings
+from .model_runtime import ModelRuntimeError, start_worker
+
+logger = logging.getLogger(__name__)
+
+
+class ServingError(Exception):
+    pass
+
+
+class Request:
+    """One predict call waiting in a server queue"""
+
+    def __init__(self, feed, rows, future):
+        self.feed = feed
+        self.rows = rows
+        self.future = future
+
+    def batch_key(self):
+        # Requests can only be concatenated when every non-batch dimension matches
+        return tuple((name, a.shape[1:], a.dtype.str) for name, a in sorted(self.feed.items()))
+
+
+class ModelServer:
+    """
+    Serves one model from a dedicated worker process.
+
+    Requests are queued and gathered into a batch until SERVING_MAX_BATCH_SIZE
+    rows are waiting or SERVING_MAX_BATCH_WAIT has passed since the first one,
+    then run as a single forward pass and split back per request. While a batch
+    runs the next one keeps filling, so under load the wait costs nothing.
+    """
+
+    def __init__(self, model_id, user_id, path, framework):
+        self.model_id = model_id
+        self.user_id = user_id
+        self.path = path
+        self.framework = framework
+        self.max_batch = settings.SERVING_MAX_BATCH_SIZE
+        self.max_wait = settings.SERVING_MAX_BATCH_WAIT
+        self.queue = asyncio.Queue()
+        self.executor = ThreadPoolExecutor(max_workers=1)  # the pipe is used by one thread at a time
+        self.process = self.conn = self.task = None
+        self.signature = None
+        self.memory = 0
+        self.pending = 0
+
+    async def start(self):
+        self.process, self.conn = start_worker(self.path, self.framework, settings.SERVING_WORKER_THREADS)
+        loop = asyncio.get_running_loop()
+        try:
+            status, payload = await asyncio.wait_for(
+                loop.run_in_executor(self.executor, self.conn.recv), settings.SERVING_LOAD_TIMEOUT
+            )
+        except (asyncio.TimeoutError, EOFError):
+            await self.stop()
+            raise ModelRuntimeError("Model worker did not start")
+        if status != 'ready':
+            await self.stop()
+            raise ModelRuntimeError(payload)
+        self.signature = payload
+        self.task = asyncio.create_task(self._batch_loop())
+        logger.info(f"Serving model {self.model_id} from worker {self.process.pid}")
+
+    def alive(self):
+        return self.process is not None and self.process.is_alive()
+
+    def busy(self):
+        return self.pending > 0
+
+    def measure(self):
+        """
+        Anonymous resident memory of the worker. File-backed pages, such as
+        memory-mapped weights and shared libraries, can be dropped by the
+        kernel at any time and are not charged.
+        """
+        try:
+            info = psutil.Process(self.process.pid).memory_info()
+            self.memory = info.rss - info.shared
+        except (psutil.Error, AttributeError):
+            self.memory = 0
+        return self.memory
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+        while not self.queue.empty():
+            request = self.queue.get_nowait()
+            if not request.future.done():
+                request.future.set_exception(ModelRuntimeError("Model was unloaded"))
+        process, conn = self.process, self.conn
+        self.process = self.conn = self.task = None
+        if process:
+            process.terminate()
+            # A worker stuck in a forward pass can take seconds to exit; wait off the event loop
+            await asyncio.to_thread(process.join, 5)
+        if conn:
+            conn.close()
+        self.executor.shutdown(wait=False)
+
+    def prepare(self, inputs):
+        """Converts request JSON to arrays matching the model signature; returns (feed, rows)"""
+        specs = self.signature['inputs']
+        if not isinstance(inputs, dict):
+            if len(specs) != 1:
+                raise ServingError("inputs must be an object keyed by input name")
+            inputs = {specs[0]['name']: inputs}
+        missing = [spec['name'] for spec in specs if spec['name'] not in inputs]
+        if missing:
+            raise ServingError(f"Missing inputs: {', '.join(missing)}")
+        feed, rows = {}, None
+        for spec in specs:
+            try:
+                array = np.asarray(inputs[spec['name']], dtype=spec['dtype'])
+            except (ValueError, TypeError) as e:
+                raise ServingError(f"Input {spec['name']}: {e}")
+            shape = spec['shape']
+            if array.ndim == 0 or (shape and array.ndim != len(shape)):
+                raise ServingError(f"Input {spec['name']} must have {len(shape) or 'at least 1'} dimensions")
+            for dim, expected in zip(array.shape, shape):
+                if expected is not None and dim != expected:
+                    raise ServingError(f"Input {spec['name']} has shape {list(array.shape)}, expected {shape}")
+            if rows is not None and array.shape[0] != rows:
+                raise ServingError("All inputs must have the same batch size")
+            rows = array.shape[0]
+            feed[spec['name']] = array
+        return feed, rows
+
+    async def predict(self, inputs):
+        feed, rows = self.prepare(inputs)
+        future = asyncio.get_running_loop().create_future()
+        self.pending += 1
+        try:
+            await self.queue.put(Request(feed, rows, future))
+            return await asyncio.wait_for(future, settings.SERVING_REQUEST_TIMEOUT)
+        finally:
+            self.pending -= 1
+
+    def batchable(self):
+        # A fixed leading dimension (e.g. an export with batch size 1) cannot take more rows
+        return all(not spec['shape'] or spec['shape'][0] is None for spec in self.signature['inputs'])
+
+    async def _batch_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            rows = batch[0].rows
+            deadline = loop.time() + self.max_wait
+            while self.batchable() and rows < self.max_batch:
+                try:
+                    request = self.queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        request = await asyncio.wait_for(self.queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                batch.append(request)
+                rows += request.rows
+            groups = defaultdict(list)
+            for request in batch:
+                if not request.future.done():  # timed out or client went away
+                    groups[request.batch_key()].append(request)
+            for requests in groups.values():
+                await self._run_batch(requests)
+
+    def _call(self, feed):
+        self.conn.send(feed)
+        return self.conn.recv()
+
+    async def _run_batch(self, requests):
+        names = list(requests[0].feed)
+        if len(requests) == 1:
+            feed = requests[0].feed
+        else:
+            feed = {name: np.concatenate([r.feed[name] for r in requests]) for name in names}
+        total = sum(r.rows for r in requests)
+        try:
+            status, payload = await asyncio.get_running_loop().run_in_executor(self.executor, self._call, feed)
+        except (EOFError, OSError) as e:
+            logger.error(f"Worker for model {self.model_id} died: {e}")
+            for request in requests:
+                if not request.future.done():
+                    request.future.set_exception(ModelRuntimeError("Model worker died"))
+            return
+        if status != 'ok':
+            for request in requests:
+                if not request.future.done():
+                    request.future.set_exception(ServingError(payload))
+            return
+        offset = 0
+        for request in requests:
+            end = offset + request.rows
+            if not request.future.done():
+                request.future.set_result({
+                    # Outputs without a batch dimension are shared by the whole batch
+                    name: value[offset:end] if value.ndim and value.shape[0] == total else value
+                    for name, value in payload.items()
+                })
+            offset = end
+
+
+class ServingEngine:
+    """
+    Process-wide registry of model servers, keeping hot models resident.
+
+    Models are loaded on first predict and kept in least-recently-used order.
+    Before and after each load, idle models are evicted oldest-first until the
+    resident set fits SERVING_MEMORY_BUDGET and the owner's share fits their
+    ram_limit; a model that cannot fit on its own is refused. Loads are
+    serialized so concurrent cold starts cannot overshoot the budget together.
+    """
+
+    def __init__(self):
+        self.servers = OrderedDict()  # model id -> ModelServer, least recently used first
+        self.load_lock = asyncio.Lock()
+        self.stats = defaultdict(Counter)  # model id -> hits, misses, evictions, load_seconds
+
+    def usage(self, user_id):
+        """Resident bytes in total and for one user"""
+        total = user = 0
+        for server in self.servers.values():
+            total += server.memory
+            if server.user_id == user_id:
+                user += server.memory
+        return total, user
+
+    def over_budget(self, user, needed):
+        total, used = self.usage(user.id)
+        return (
+            total + needed > settings.SERVING_MEMORY_BUDGET,
+            used + needed > user.ram_limit * 1024 * 1024
+        )
+
+    async def make_room(self, user, needed, keep=None):
+        """Evicts idle models, oldest first, until `needed` more bytes fit both budgets"""
+        for server in self.servers.values():
+            server.measure()
+        for server in list(self.servers.values()):
+            total_over, user_over = self.over_budget(user, needed)
+            if not (total_over or user_over):
+                return True
+            if server is keep or server.busy():
+                continue
+            if not total_over and server.user_id != user.id:
+                continue  # only the user's own models make way under their budget
+            await self.evict(server.model_id)
+        return not any(self.over_budget(user, needed))
+
+    async def evict(self, model_id):
+        server = self.servers.pop(model_id, None)
+        if server is not None:
+            await server.stop()
+            self.stats[model_id]['evictions'] += 1
+            logger.info(f"Evicted model {model_id} ({server.memory} bytes resident)")
+
+    def resident(self, model, path):
+        server = self.servers.get(model.id)
+        if server is not None and server.path == path and server.alive():
+            return server
+        return None
+
+    async def get(self, model, user, artifact=None):
+        """
+        Running server for one of `user`'s models, loading it on a miss.
+        `artifact` is the file to serve (a ModelVariant), the model itself by default.
+        """
+        artifact = artifact or model
+        path = artifact.model_file.path
+        server = self.resident(model, path)
+        if server is not None:
+            self.servers.move_to_end(model.id)
+            self.stats[model.id]['hits'] += 1
+            return server
+        async with self.load_lock:
+            server = self.resident(model, path)
+            if server is not None:
+                self.servers.move_to_end(model.id)
+                self.stats[model.id]['hits'] += 1
+                return server
+            self.stats[model.id]['misses'] += 1
+            if model.id in self.servers:
+                await self.evict(model.id)  # file replaced or worker died
+            # The file size is the best estimate until the worker can be measured
+            if not await self.make_room(user, artifact.size):
+                raise ModelRuntimeError("Not enough serving memory, try again when other models are idle")
+            server = ModelServer(model.id, user.id, path, artifact.framework)
+            started = time.monotonic()
+            await server.start()
+            elapsed = time.monotonic() - started
+            self.stats[model.id]['loads'] += 1
+            self.stats[model.id]['load_seconds'] += elapsed
+            self.servers[model.id] = server
+            if not await self.make_room(user, 0, keep=server):
+                self.servers.pop(model.id)
+                await server.stop()
+                raise ModelRuntimeError(f"Model needs {server.memory} bytes, more than the serving memory budget")
+            logger.info(f"Loaded model {model.id} in {elapsed:.2f}s ({server.memory} bytes resident)")
+        return server
+
+    async def predict(self, model, user, inputs, artifact=None):
+        server = await self.get(model, user, artifact)
+        return await server.predict(inputs)
+
+    def model_stats(self, model_id):
+        stats = self.stats.get(model_id, Counter())
+        server = self.servers.get(model_id)
+        return {
+            'resident': server is not None,
+            'memory': server.memory if server else 0,
+            'hits': stats['hits'],
+            'misses': stats['misses'],
+            'evictions': stats['evictions'],
+            'loads': stats['loads'],
+            'avg_load_seconds': stats['load_seconds'] / stats['loads'] if stats['loads'] else None,
+        }
+
+    def summary(self):
+        totals = sum(self.stats.values(), Counter())
+        lookups = totals['hits'] + totals['misses']
+        return {
+            'resident_models': len(self.servers),
+            'memory': sum(server.memory for server in self.servers.values()),
+            'memory_budget': settings.SERVING_MEMORY_BUDGET,
+            'hits': totals['hits'],
+            'misses': totals['misses'],
+            'hit_rate': totals['hits'] / lookups if lookups else None,
+            'evictions': totals['evictions'],
+            'avg_load_seconds': totals['load_seconds'] / totals['loads'] if totals['loads'] else None,
+        }
+
+
+serving_engine = ServingEngine()
@@ -0,0 +1,54 @@
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.db import transaction
+from django.dispatch import receiver
+from .models import UserFile, AIModel, ModelVariant
+from .jobs import enqueue_model_validation
+from .quota import charge
+
+
+def stored_field(instance):
+    return instance.file if isinstance(instance, UserFile) else instance.model_file
+
+
+@receiver(pre_save, sender=UserFile)
+@receiver(pre_save, sender=AIModel)
+@receiver(pre_save, sender=ModelVariant)
+def measure_file(sender, instance, **kwargs):
+    """Records the file size and the size the ledger currently holds for this row"""
+    instance._charged_size = 0
+    if instance.pk:
+        instance._charged_size = sender.objects.filter(pk=instance.pk).values_list('size', flat=True).first() or 0
+    field = stored_field(instance)
+    if field:
+        try:
+            instance.size = field.size
+        except OSError:
+            pass
+
+@receiver(post_save, sender=UserFile)
+@receiver(post_save, sender=AIModel)
+@receiver(post_save, sender=ModelVariant)
+def charge_file(sender, instance, **kwargs):
+    charge(instance.user_id, instance.size - getattr(instance, '_charged_size', 0))
+
+@receiver(post_save, sender=AIModel)
+def validate_new_model(sender, instance, created, **kwargs):
+    """Checks new uploads in the background so the upload request returns at once"""
+    if created:
+        transaction.on_commit(lambda: enqueue_model_validation(instance))
+
+@receiver(post_delete, sender=UserFile)
+@receiver(post_delete, sender=AIModel)
+@receiver(post_delete, sender=ModelVariant)
+def refund_file(sender, instance, **kwargs):
+    charge(instance.user_id, -instance.size)
+
+@receiver(post_delete, sender=UserFile)
+@receiver(post_delete, sender=AIModel)
+@receiver(post_delete, sender=ModelVariant)
+def delete_stored_file(sender, instance, **kwargs):
+    """Removes the file of rows deleted without their view, e.g. with their user"""
+    field = stored_field(instance)
+    if field:
+        storage, name = field.storage, field.name
+        transaction.on_commit(lambda: storage.delete(name))
@@ -0,0 +1,237 @@
+import asyncio
+import fcntl
+import hashlib
+import logging
+import os
+import tempfile
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.core.files.uploadhandler import MemoryFileUploadHandler, TemporaryFileUploadHandler
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from .models import AIModel, Blob, BlobLink, ModelVariant, UserFile
+
+logger = logging.getLogger(__name__)
+
+BLOB_DIR = '.blobs'
+FICLONE = 0x40049409  # ioctl number from linux/fs.h
+READ_SIZE = 1024 * 1024
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while chunk := f.read(READ_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def reflink(src, dst):
+    """Copy-on-write clone of `src`, supported on btrfs, XFS and similar"""
+    with open(src, 'rb') as s, open(dst, 'xb') as d:
+        try:
+            fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+        except OSError:
+            d.close()
+            os.remove(dst)
+            raise
+
+
+class DedupStorage(FileSystemStorage):
+    """
+    Filesystem storage that indexes every stored file by its SHA-256.
+
+    Where the filesystem can clone (btrfs, XFS), each distinct content is
+    also kept as a read-only blob under MEDIA_ROOT/.blobs and every file
+    with that content becomes a reflink of it, so duplicates share their
+    extents. Elsewhere the user's file stays the only copy and is just
+    indexed. Never a hardlink: user directories are mounted read-write into
+    containers, and writing a shared inode would change every other user's
+    copy. Blobs are reference counted and removed with their last link;
+    collect_garbage() catches links whose files disappeared behind our back.
+    """
+
+    def blob_path(self, sha256):
+        return self.path(os.path.join(BLOB_DIR, sha256[:2], sha256[2:4], sha256))
+
+    def _save(self, name, content):
+        sha256 = getattr(content, 'sha256', None)
+        blob_dir = self.path(BLOB_DIR)
+        os.makedirs(blob_dir, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=blob_dir, prefix='.incoming-')
+        try:
+            moved = False
+            if sha256 and hasattr(content, 'temporary_file_path'):
+                # Already on disk and hashed by the upload handler
+                try:
+                    os.replace(content.temporary_file_path(), tmp)
+                    moved = True
+                except OSError:
+                    pass  # temporary upload dir on another filesystem
+            with os.fdopen(fd, 'ab') as f:
+                if not moved:
+                    digest = hashlib.sha256()
+                    for chunk in content.chunks():
+                        digest.update(chunk)
+                        f.write(chunk)
+                    sha256 = digest.hexdigest()
+            return self.adopt(tmp, name, sha256)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    def adopt(self, path, name, sha256=None):
+        """
+        Moves the file at `path`, on the same filesystem, into storage as
+        `name` without copying it. Without a known hash the file is indexed
+        later by collect_garbage(), so callers never wait for a full read.
+        """
+        while True:
+            name = self.get_available_name(name)
+            target = self.path(name)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            try:
+                os.link(path, target)  # fails instead of replacing a concurrent upload of the same name
+                break
+            except FileExistsError:
+                continue
+        os.remove(path)
+        os.chmod(target, self.file_permissions_mode or 0o644)
+        if sha256:
+            self.index(name, sha256)
+        return name
+
+    def index(self, name, sha256=None):
+        """Records a stored file under its content hash and shares its extents where possible"""
+        path = self.path(name)
+        sha256 = sha256 or file_sha256(path)
+        with transaction.atomic():
+            if not Blob.objects.filter(pk=sha256).update(refcount=F('refcount') + 1):
+                try:
+                    with transaction.atomic():
+                        Blob.objects.create(sha256=sha256, size=os.path.getsize(path), refcount=1)
+                except IntegrityError:
+                    Blob.objects.filter(pk=sha256).update(refcount=F('refcount') + 1)
+            BlobLink.objects.create(name=name, blob_id=sha256)
+        self.share(path, sha256)
+
+    def share(self, path, sha256):
+        """
+        Turns the file into a reflink of its blob, or makes it the blob's
+        source when the content is new. Without FICLONE nothing is copied.
+        """
+        blob = self.blob_path(sha256)
+        try:
+            if os.path.exists(blob):
+                tmp = f"{path}.reflink"
+                reflink(blob, tmp)
+                os.chmod(tmp, self.file_permissions_mode or 0o644)
+                os.replace(tmp, path)  # the file's own extents are freed
+            else:
+                os.makedirs(os.path.dirname(blob), exist_ok=True)
+                reflink(path, blob)
+                os.chmod(blob, 0o444)
+        except OSError:
+            pass  # ext4, overlayfs, or a concurrent clone of the same blob: the file stays as it is
+
+    def delete(self, name):
+        super().delete(name)
+        self.release(name)
+
+    def release(self, name):
+        """Drops the link of `name`, and its blob with the last link"""
+        link = BlobLink.objects.filter(name=name).first()
+        if link is None:
+            return
+        sha256 = link.blob_id
+        with transaction.atomic():
+            link.delete()
+            Blob.objects.filter(pk=sha256).update(refcount=F('refcount') - 1)
+            freed = Blob.objects.filter(pk=sha256, refcount=0).delete()[0]
+        if freed:
+            self.remove_blob(sha256)
+
+    def remove_blob(self, sha256):
+        try:
+            os.remove(self.blob_path(sha256))
+        except FileNotFoundError:
+            pass
+
+    def collect_garbage(self, names):
+        """
+        Indexes the stored `names` that have no link yet, drops the links of
+        files removed outside Django, e.g. from inside a container, and
+        removes blobs nothing references. Returns (indexed, dropped).
+        """
+        indexed = dropped = 0
+        linked = set(BlobLink.objects.values_list('name', flat=True))
+        for name in names:
+            if name and name not in linked and self.exists(name):
+                try:
+                    self.index(name)
+                    indexed += 1
+                except (OSError, IntegrityError) as e:
+                    logger.error(f"Indexing {name} failed: {e}")
+        for name in linked:
+            if not self.exists(name):
+                self.release(name)
+                dropped += 1
+        for sha256 in Blob.objects.filter(refcount__lte=0).values_list('pk', flat=True):
+            if Blob.objects.filter(pk=sha256, refcount__lte=0, links__isnull=True).delete()[0]:
+                self.remove_blob(sha256)
+        known = set(Blob.objects.values_list('pk', flat=True))
+        for root, _, files in os.walk(self.path(BLOB_DIR)):
+            for filename in files:
+                if not filename.startswith('.') and filename not in known:
+                    os.remove(os.path.join(root, filename))
+        return indexed, dropped
+
+
+def stored_names():
+    """Storage names of every uploaded file, model and model variant"""
+    for model, field in ((UserFile, 'file'), (AIModel, 'model_file'), (ModelVariant, 'model_file')):
+        yield from model.objects.exclude(**{field: ''}).values_list(field, flat=True).iterator()
+
+def collect_garbage():
+    if not hasattr(default_storage, 'collect_garbage'):
+        return 0, 0
+    return default_storage.collect_garbage(stored_names())
+
+async def blob_gc_loop():
+    while True:
+        try:
+            indexed, dropped = await database_sync_to_async(collect_garbage)()
+            if indexed or dropped:
+                logger.info(f"Blob index: {indexed} files indexed, {dropped} stale links dropped")
+        except Exception as e:
+            logger.error(f"Blob garbage collection failed: {e}")
+        await asyncio.sleep(settings.BLOB_GC_INTERVAL)
+
+
+class HashingMixin:
+    """Hashes an upload while it is received, so DedupStorage need not read it again"""
+
+    def new_file(self, *args, **kwargs):
+        self.digest = hashlib.sha256()
+        super().new_file(*args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        remaining = super().receive_data_chunk(raw_data, start)
+        if remaining is None:
+            # Only the handler that keeps the data hashes it
+            self.digest.update(raw_data)
+        return remaining
+
+    def file_complete(self, file_size):
+        uploaded = super().file_complete(file_size)
+        if uploaded is not None:
+            uploaded.sha256 = self.digest.hexdigest()
+        return uploaded
+
+
+class HashingMemoryFileUploadHandler(HashingMixin, MemoryFileUploadHandler):
+    pass
+
+
+class HashingTemporaryFileUploadHandler(HashingMixin, TemporaryFileUploadHandler):
+    pass
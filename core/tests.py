@@ -1,3 +1,1154 @@
-from django.test import TestCase
+import asyncio
+import base64
+import io
+import importlib.util
+import json
+import os
+import shutil
+import tarfile
+import tempfile
+import zipfile
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from unittest import mock, skipUnless
+import numpy as np
+from channels.db import database_sync_to_async
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth import SESSION_KEY, get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.files.base import ContentFile
+from django.core.files.uploadhandler import StopUpload
+from django.db import IntegrityError
+from django.test import SimpleTestCase, TestCase, override_settings
+from .docker_api import DockerAPIError
+from .api_tokens import issue_token
+from .listing import ListingError, decode_cursor, encode_cursor
+from . import archive, bulk, gpu, idle, jobs, jupyter_pool, proxy, quota, reconciler, sampler, storage, uploads
+from .model_runtime import ModelRuntimeError
+from .models import AIModel, Blob, BlobLink, DockerContainer, DockerNode, Job, UserFile, WarmContainer
+from .orchestrator import Operation, Orchestrator, container_name
+from .routing import websocket_urlpatterns
+from .scheduler import NodeLoad, SchedulingError, choose_node, place
+from .serving import ModelServer, ServingEngine
 
-# Create your tests here.
+HAS_ONNX = all(importlib.util.find_spec(name) for name in ('onnx', 'onnxruntime'))
+MB = 1024 * 1024
+GB = 1024 * MB
+IN_MEMORY_CHANNELS = {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}
+
+
+def write_onnx_model(path, features=4):
+    """y = 2x over a dynamic batch dimension"""
+    import onnx
+    from onnx import TensorProto, helper, numpy_helper
+    graph = helper.make_graph(
+        [helper.make_node('Mul', ['x', 'two'], ['y'])], 'double',
+        [helper.make_tensor_value_info('x', TensorProto.FLOAT, ['batch', features])],
+        [helper.make_tensor_value_info('y', TensorProto.FLOAT, ['batch', features])],
+        [numpy_helper.from_array(np.array(2, dtype=np.float32), 'two')]
+    )
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid('', 17)])
+    model.ir_version = 8
+    onnx.save(model, path)
+
+
+class OnnxModelMixin:
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.workdir, ignore_errors=True)
+
+    def model_path(self, name='model'):
+        path = os.path.join(self.workdir, f"{name}.onnx")
+        if not os.path.exists(path):
+            write_onnx_model(path)
+        return path
+
+
+class MediaRootMixin:
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root))
+
+
+@skipUnless(HAS_ONNX, "onnx and onnxruntime are needed")
+@override_settings(SERVING_MAX_BATCH_SIZE=32, SERVING_MAX_BATCH_WAIT=0.2)
+class ModelServerTests(OnnxModelMixin, SimpleTestCase):
+    async def test_concurrent_requests_share_a_forward_pass(self):
+        server = ModelServer(1, 1, self.model_path(), 'onnx')
+        await server.start()
+        try:
+            calls = []
+            call = server._call
+            server._call = lambda feed: calls.append(len(feed['x'])) or call(feed)
+            inputs = [[[i, i, i, i]] for i in range(8)]
+            outputs = await asyncio.gather(*(server.predict(rows) for rows in inputs))
+        finally:
+            await server.stop()
+        for rows, output in zip(inputs, outputs):
+            np.testing.assert_allclose(output['y'], np.array(rows) * 2)
+        self.assertEqual(sum(calls), 8)
+        self.assertLess(len(calls), 8)
+
+    async def test_stop_fails_queued_requests(self):
+        server = ModelServer(1, 1, self.model_path(), 'onnx')
+        await server.start()
+        server.task.cancel()  # nothing takes requests off the queue any more
+        prediction = asyncio.ensure_future(server.predict([[1, 2, 3, 4]]))
+        await asyncio.sleep(0.05)
+        await server.stop()
+        with self.assertRaises(ModelRuntimeError):
+            await prediction
+        self.assertFalse(server.alive())
+
+
+def fixed_memory(server):
+    server.memory = MB
+    return server.memory
+
+
+@skipUnless(HAS_ONNX, "onnx and onnxruntime are needed")
+@mock.patch.object(ModelServer, 'measure', fixed_memory)
+class ServingEngineTests(OnnxModelMixin, SimpleTestCase):
+    """Every worker is charged exactly 1MB, so budgets count models"""
+
+    def model(self, model_id):
+        path = self.model_path(f"model{model_id}")
+        return SimpleNamespace(id=model_id, model_file=SimpleNamespace(path=path), size=0, framework='onnx')
+
+    async def load(self, engine, user, *model_ids):
+        for model_id in model_ids:
+            await engine.get(self.model(model_id), user)
+
+    async def test_least_recently_used_model_is_evicted(self):
+        engine = ServingEngine()
+        user = SimpleNamespace(id=1, ram_limit=100)
+        try:
+            with override_settings(SERVING_MEMORY_BUDGET=2 * MB):
+                await self.load(engine, user, 1, 2, 1, 3)
+            self.assertEqual(list(engine.servers), [1, 3])
+            self.assertEqual(engine.model_stats(2)['evictions'], 1)
+            self.assertEqual(engine.model_stats(1)['hits'], 1)
+        finally:
+            for model_id in list(engine.servers):
+                await engine.evict(model_id)
+
+    async def test_user_budget_evicts_only_their_own_models(self):
+        engine = ServingEngine()
+        alice, bob = SimpleNamespace(id=1, ram_limit=2), SimpleNamespace(id=2, ram_limit=2)
+        try:
+            with override_settings(SERVING_MEMORY_BUDGET=10 * MB):
+                await self.load(engine, bob, 1)
+                await self.load(engine, alice, 2, 3, 4)
+            self.assertEqual(list(engine.servers), [1, 3, 4])
+        finally:
+            for model_id in list(engine.servers):
+                await engine.evict(model_id)
+
+    async def test_busy_models_are_not_evicted(self):
+        engine = ServingEngine()
+        user = SimpleNamespace(id=1, ram_limit=100)
+        try:
+            with override_settings(SERVING_MEMORY_BUDGET=MB):
+                await self.load(engine, user, 1)
+                engine.servers[1].pending = 1
+                self.assertFalse(await engine.make_room(user, MB))
+                with self.assertRaises(ModelRuntimeError):
+                    await self.load(engine, user, 2)
+            self.assertEqual(list(engine.servers), [1])
+        finally:
+            engine.servers[1].pending = 0
+            for model_id in list(engine.servers):
+                await engine.evict(model_id)
+
+
+def node(name, cpu=8, memory=16 * GB, **fields):
+    return DockerNode(name=name, url=f"tcp://{name}:2375", public_host=name, cpu_total=cpu, memory_total=memory, **fields)
+
+
+class ChooseNodeTests(SimpleTestCase):
+    def setUp(self):
+        self.idle = NodeLoad(node('idle'))
+        self.busy = NodeLoad(node('busy'), cpu_reserved=6, memory_reserved=12 * GB, containers=3)
+        self.full = NodeLoad(node('full'), cpu_reserved=8, memory_reserved=16 * GB, containers=4)
+
+    def test_spread_picks_the_emptiest_node(self):
+        chosen = choose_node([self.busy, self.idle, self.full], 2, 4 * GB, 'spread')
+        self.assertEqual(chosen.name, 'idle')
+
+    def test_binpack_picks_the_fullest_node_that_fits(self):
+        chosen = choose_node([self.idle, self.busy, self.full], 2, 4 * GB, 'binpack')
+        self.assertEqual(chosen.name, 'busy')
+
+    def test_scarcer_resource_decides(self):
+        # Plenty of CPU left on 'busy' does not help when its memory is nearly gone
+        tight = NodeLoad(node('tight'), cpu_reserved=0, memory_reserved=14 * GB)
+        self.assertEqual(choose_node([tight, self.busy], 1, GB, 'spread').name, 'busy')
+
+    def test_nothing_fits(self):
+        self.assertIsNone(choose_node([self.busy, self.full], 4, GB, 'spread'))
+        self.assertIsNone(choose_node([NodeLoad(node('unread', cpu=0, memory=0))], 1, GB, 'binpack'))
+
+    def test_unknown_policy(self):
+        with self.assertRaises(SchedulingError):
+            choose_node([self.idle], 1, GB, 'random')
+
+
+class SchedulerTestCase(TestCase):
+    def setUp(self):
+        self.users = [
+            get_user_model().objects.create_user(f"user{i}", password='x', cpu_limit=4, ram_limit=8192)
+            for i in range(3)
+        ]
+
+
+class PlaceTests(SchedulerTestCase):
+    def test_no_nodes_means_the_default_daemon(self):
+        self.assertIsNone(place(self.users[0], 'regular'))
+        self.assertFalse(DockerContainer.objects.exists())
+
+    def test_every_node_disabled(self):
+        node('a', enabled=False).save()
+        with self.assertRaises(SchedulingError):
+            place(self.users[0], 'regular')
+
+    def test_placements_reserve_the_users_limits(self):
+        node('a', cpu=4, memory=8 * GB).save()
+        node('b', cpu=4, memory=8 * GB).save()
+        first = place(self.users[0], 'regular')
+        second = place(self.users[1], 'regular')
+        self.assertNotEqual(first, second)
+        self.assertEqual(DockerContainer.objects.get(user=self.users[0]).node, first)
+        # Each node is fully reserved by one container now
+        with self.assertRaises(SchedulingError):
+            place(self.users[2], 'regular')
+
+    def test_binpack_fills_one_node_first(self):
+        node('a').save()
+        node('b').save()
+        with override_settings(SCHEDULER_POLICY='binpack'):
+            placed = {place(user, 'regular') for user in self.users[:2]}
+        self.assertEqual(len(placed), 1)
+
+    def test_replacing_a_container_releases_its_own_reservation(self):
+        node('a', cpu=4, memory=8 * GB).save()
+        chosen = place(self.users[0], 'regular')
+        self.assertEqual(place(self.users[0], 'regular'), chosen)
+        self.assertEqual(DockerContainer.objects.count(), 1)
+
+    def test_removed_and_checkpointed_containers_hold_nothing(self):
+        a = node('a', cpu=4, memory=8 * GB)
+        a.save()
+        DockerContainer.objects.create(user=self.users[0], container_type='regular', node=a, status='removed')
+        DockerContainer.objects.create(user=self.users[1], container_type='regular', node=a, suspend_mode='checkpoint')
+        self.assertEqual(place(self.users[2], 'regular'), a)
+
+
+class FakeEngine:
+    """Engine API stand-in keeping containers in a dict"""
+
+    def __init__(self, base_url='unix:///var/run/docker.sock'):
+        self.base_url = base_url
+        self.containers = {}
+        self.next_port = 32768
+
+    async def image_inspect(self, name):
+        return {'Id': f"sha256:{name}", 'Size': 0}
+
+    async def container_remove(self, container, force=False):
+        if self.containers.pop(container, None) is None:
+            raise DockerAPIError(404, f"No such container: {container}")
+
+    async def container_create(self, name, config):
+        self.containers[name] = {'Id': f"id-{name}", 'Config': config, 'State': 'created', 'Ports': {}}
+        return {'Id': f"id-{name}"}
+
+    async def container_start(self, container, checkpoint=None):
+        if container not in self.containers:
+            raise DockerAPIError(404, f"No such container: {container}")
+        # Like the daemon with an empty HostPort, a new host port on every start
+        self.next_port += 1
+        state = self.containers[container]
+        ports = {port: [{'HostPort': str(self.next_port)}] for port in state['Config'].get('ExposedPorts', {})}
+        state.update(State='running', Ports=ports)
+
+    async def container_pause(self, container):
+        self.containers[container]['State'] = 'paused'
+
+    async def container_unpause(self, container):
+        self.containers[container]['State'] = 'running'
+
+    async def container_inspect(self, container):
+        state = self.containers[container]
+        return {
+            'Id': state['Id'],
+            'State': {'Running': state['State'] in ('running', 'paused'), 'Paused': state['State'] == 'paused'},
+            'NetworkSettings': {'Ports': state['Ports']}
+        }
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNELS, PROXY_ROUTES_DIR='', CONTAINER_NETWORK='')
+class OrchestratorTests(MediaRootMixin, SchedulerTestCase):
+    def setUp(self):
+        super().setUp()
+        self.engines = {}
+        self.orchestrator = Orchestrator(api=FakeEngine(), api_factory=self.engine)
+
+    def engine(self, base_url):
+        return self.engines.setdefault(base_url, FakeEngine(base_url))
+
+    def operation(self, user, action):
+        return Operation(None, user, action, {})
+
+    async def test_create_and_start_on_the_default_daemon(self):
+        user = self.users[0]
+        container_id = await self.orchestrator.do_create(self.operation(user, 'create'), 'nginx:latest')
+        config = self.orchestrator.api.containers[container_name(user)]['Config']
+        self.assertEqual(config['HostConfig']['Memory'], 8192 * MB)
+        self.assertTrue(config['HostConfig']['Binds'][0].endswith(':/workspace:rw'))
+
+        url = await self.orchestrator.do_start(self.operation(user, 'start'))
+        row = await DockerContainer.objects.aget(user=user, container_type='regular')
+        self.assertEqual((row.container_id, row.status, row.node_id), (container_id, 'running', None))
+        self.assertEqual(url, f"http://localhost:{row.port_bindings['80_tcp']}/")
+        self.assertEqual(self.engines, {})
+
+    async def test_containers_go_to_the_node_they_were_placed_on(self):
+        a, b = node('a'), node('b')
+        await a.asave()
+        await b.asave()
+        for user in self.users[:2]:
+            await self.orchestrator.do_create(self.operation(user, 'create'), 'nginx:latest')
+            await self.orchestrator.do_start(self.operation(user, 'start'))
+
+        placed = {}
+        async for row in DockerContainer.objects.select_related('node', 'user'):
+            placed[row.user.username] = row.node.name
+            engine = self.engines[row.node.url]
+            self.assertEqual(engine.containers[container_name(row.user)]['State'], 'running')
+            self.assertTrue(row.access_url.startswith(f"http://{row.node.public_host}:"))
+        self.assertEqual(sorted(placed.values()), ['a', 'b'])
+        self.assertEqual(self.orchestrator.api.containers, {})
+
+    async def test_failed_create_releases_the_placement(self):
+        await node('a').asave()
+        user = self.users[0]
+        engine = self.engine('tcp://a:2375')
+        with mock.patch.object(engine, 'container_create', side_effect=DockerAPIError(500, 'no space left')):
+            with self.assertRaises(DockerAPIError):
+                await self.orchestrator.do_create(self.operation(user, 'create'), 'nginx:latest')
+        self.assertFalse(await DockerContainer.objects.filter(user=user).aexists())
+
+    async def test_jupyter_restart_records_the_new_port(self):
+        user = self.users[0]
+        name = container_name(user, 'jupyter')
+        await self.orchestrator.api.container_create(name, {'ExposedPorts': {'8888/tcp': {}}})
+        await DockerContainer.objects.acreate(
+            user=user, container_type='jupyter', container_id=f"id-{name}", status='exited',
+            port_bindings={'8888_tcp': 1}, access_url='http://localhost:1/?token=secret'
+        )
+        for _ in range(2):
+            url = await self.orchestrator.do_start(self.operation(user, 'start'), container_type='jupyter')
+            row = await DockerContainer.objects.aget(user=user, container_type='jupyter')
+            port = self.orchestrator.api.next_port
+            self.assertEqual((row.status, row.port_bindings), ('running', {'8888_tcp': port}))
+            self.assertEqual(row.access_url, f"http://localhost:{port}/?token=secret")
+            self.assertEqual(url, row.access_url)
+
+    async def test_recreate_removes_the_old_container_from_its_node(self):
+        await node('a').asave()
+        user = self.users[0]
+        await self.orchestrator.do_create(self.operation(user, 'create'), 'nginx:latest')
+        engine = self.engines['tcp://a:2375']
+        engine.containers[container_name(user)]['State'] = 'running'
+        await self.orchestrator.do_create(self.operation(user, 'create'), 'nginx:1.27')
+        self.assertEqual(engine.containers[container_name(user)]['State'], 'created')
+        self.assertEqual(engine.containers[container_name(user)]['Config']['Image'], 'nginx:1.27')
+
+
+NVIDIA_SMI_OUTPUT = """\
+0, GPU-aaaa, 35, 24576, 20480, 4096, 61, NVIDIA GeForce RTX 4090
+1, GPU-bbbb, 0, 24576, 512, 24064, 40, NVIDIA GeForce RTX 4090
+2, GPU-cccc, [N/A], 16384, 0, 16384, [N/A], Tesla T4, PCIe, 70W
+"""
+
+
+@override_settings(GPU_CONTAINER_MEMORY=8192)
+class GPUTests(SchedulerTestCase):
+    def setUp(self):
+        super().setUp()
+        workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, workdir, ignore_errors=True)
+        self.smi = os.path.join(workdir, 'nvidia-smi')
+        self.set_output(NVIDIA_SMI_OUTPUT)
+        os.chmod(self.smi, 0o755)
+        self.enterContext(override_settings(NVIDIA_SMI_PATH=self.smi))
+        # A fresh inventory per test, sampled inline only
+        self.enterContext(mock.patch.object(gpu, 'gpu_inventory', gpu.GPUInventory()))
+        self.enterContext(mock.patch.object(gpu.GPUInventory, 'start'))
+
+    def set_output(self, output):
+        with open(self.smi, 'w') as f:
+            f.write(f"#!/bin/sh\ncat <<'EOF'\n{output}EOF\n")
+
+    def test_parse_devices(self):
+        devices = gpu.sample_devices()
+        self.assertEqual([device['uuid'] for device in devices], ['GPU-aaaa', 'GPU-bbbb', 'GPU-cccc'])
+        self.assertEqual(devices[0]['utilization'], 35)
+        self.assertEqual(devices[1]['memory_free'], 24064)
+        # [N/A] fields are unknown, commas in the name are kept
+        self.assertIsNone(devices[2]['utilization'])
+        self.assertIsNone(devices[2]['temperature'])
+        self.assertEqual(devices[2]['name'], 'Tesla T4, PCIe, 70W')
+
+    def test_parse_devices_skips_malformed_lines(self):
+        self.assertEqual(gpu.parse_devices("No devices were found\n\n"), [])
+
+    def test_missing_nvidia_smi_means_no_gpus(self):
+        with override_settings(NVIDIA_SMI_PATH=self.smi + '-missing'):
+            self.assertEqual(gpu.gpu_inventory.snapshot(), [])
+        self.assertFalse(gpu.gpu_inventory.available)
+        self.assertEqual(gpu.assign_gpu(self.users[0], 'regular'), [])
+
+    def test_choose_device_keeps_the_most_headroom(self):
+        devices = gpu.parse_devices(NVIDIA_SMI_OUTPUT)
+        reservations = Counter()
+        self.assertEqual(gpu.choose_device(devices, reservations, 8192)['uuid'], 'GPU-bbbb')
+        # Two reservations on the idle card leave it less headroom than the T4
+        reservations['GPU-bbbb'] = 2
+        self.assertEqual(gpu.choose_device(devices, reservations, 8192)['uuid'], 'GPU-cccc')
+        # Measured free memory rules the busy card out whatever is reserved
+        self.assertIsNone(gpu.choose_device(devices[:1], Counter(), 8192))
+
+    def test_assign_gpu_spreads_containers(self):
+        assigned = []
+        for user in self.users:
+            assigned.append(gpu.assign_gpu(user, 'regular'))
+            DockerContainer.objects.filter(user=user).update(status='created')  # as do_create records it
+        self.assertEqual(assigned, [['GPU-bbbb'], ['GPU-cccc'], ['GPU-bbbb']])
+        row = DockerContainer.objects.get(user=self.users[0], container_type='regular')
+        self.assertEqual(row.gpu_devices, ['GPU-bbbb'])
+
+    def test_reassigning_ignores_the_containers_own_reservation(self):
+        first = gpu.assign_gpu(self.users[0], 'regular')
+        self.assertEqual(gpu.assign_gpu(self.users[0], 'regular'), first)
+
+    def test_stopped_and_checkpointed_containers_hold_no_gpu(self):
+        DockerContainer.objects.create(
+            user=self.users[0], container_type='regular', status='exited', gpu_devices=['GPU-bbbb']
+        )
+        DockerContainer.objects.create(
+            user=self.users[1], container_type='regular', status='paused', suspend_mode='checkpoint',
+            gpu_devices=['GPU-bbbb']
+        )
+        self.assertEqual(gpu.device_reservations(), Counter())
+        self.assertEqual(gpu.assign_gpu(self.users[2], 'regular'), ['GPU-bbbb'])
+
+    def test_full_cards_are_shared_instead_of_failing(self):
+        self.set_output("0, GPU-aaaa, 90, 8192, 8000, 192, 80, A\n1, GPU-bbbb, 90, 8192, 7000, 1192, 80, B\n")
+        self.assertEqual(gpu.assign_gpu(self.users[0], 'regular'), ['GPU-bbbb'])
+        DockerContainer.objects.filter(user=self.users[0]).update(status='running')
+        # GPU-bbbb holds a container now, the other card is the least loaded
+        self.assertEqual(gpu.assign_gpu(self.users[1], 'regular'), ['GPU-aaaa'])
+
+
+@override_settings(JUPYTER_POOL_MIN=1, JUPYTER_POOL_MAX=10, JUPYTER_POOL_DEMAND_WINDOW=900)
+class JupyterPoolTests(MediaRootMixin, SchedulerTestCase):
+    def ready_slot(self, image='jupyter'):
+        slot = jupyter_pool.create_slot(image)
+        jupyter_pool.mark_ready(slot, f"id-{slot}")
+        return slot
+
+    def test_relaunches_still_count_as_demand(self):
+        self.ready_slot()
+        self.ready_slot()
+        user = self.users[0]
+        first = jupyter_pool.claim_slot(user, 'jupyter')
+        self.assertEqual(jupyter_pool.release_user_slots(user), [first.container_id])
+        self.assertFalse(os.path.exists(jupyter_pool.slot_path(first.slot)))
+        jupyter_pool.claim_slot(user, 'jupyter')
+        self.assertEqual(jupyter_pool.target_size(), 2)
+
+    def test_launches_that_find_the_pool_empty_count_as_demand(self):
+        for user in self.users:
+            self.assertIsNone(jupyter_pool.claim_slot(user, 'jupyter'))
+        self.assertEqual(jupyter_pool.pool_plan('jupyter'), (3, []))
+
+    def test_claims_outside_the_window_are_forgotten(self):
+        jupyter_pool.claim_slot(self.users[0], 'jupyter')
+        WarmContainer.objects.update(claimed_at=jupyter_pool.demand_since() - timedelta(seconds=1))
+        self.ready_slot()
+        self.ready_slot()
+        self.assertEqual(jupyter_pool.pool_plan('jupyter'), (0, list(
+            WarmContainer.objects.filter(status='ready').values_list('slot', 'container_id')[:1]
+        )))
+        self.assertFalse(WarmContainer.objects.filter(status='missed').exists())
+
+
+class StatsSamplerTests(TestCase):
+    async def test_a_failed_snapshot_is_not_published(self):
+        stats_sampler = sampler.StatsSampler(group='monitoring.test', interval=0.01)
+        layer = mock.AsyncMock()
+        with mock.patch.object(sampler, 'get_system_stats', return_value=None), \
+                mock.patch.object(sampler, 'get_channel_layer', return_value=layer):
+            self.assertIsNone(await asyncio.to_thread(sampler.collect_system_stats))
+            stats_sampler.subscribe()
+            await asyncio.sleep(0.05)
+            stats_sampler.unsubscribe()
+            await asyncio.sleep(0.05)
+        layer.group_send.assert_not_called()
+        self.assertIsNone(stats_sampler.latest)
+
+
+class CursorTests(SimpleTestCase):
+    def crafted(self, value, pk=1):
+        return base64.urlsafe_b64encode(json.dumps([value, pk]).encode()).decode()
+
+    def test_round_trip(self):
+        uploaded_at = UserFile._meta.get_field('uploaded_at')
+        moment = datetime(2026, 10, 18, 12, 30, tzinfo=timezone.utc)
+        self.assertEqual(decode_cursor(encode_cursor(moment, 7), uploaded_at), (moment, 7))
+        self.assertEqual(decode_cursor(encode_cursor(1024, 7), UserFile._meta.get_field('size')), (1024, 7))
+
+    def test_crafted_cursors_are_rejected(self):
+        uploaded_at = UserFile._meta.get_field('uploaded_at')
+        size = UserFile._meta.get_field('size')
+        for cursor, field in [
+            ('not base64!', size),
+            (base64.urlsafe_b64encode(b'[1, 2, 3]').decode(), size),
+            (self.crafted(1700000000), uploaded_at),
+            (self.crafted('yesterday'), uploaded_at),
+            (self.crafted('2026-13-45T00:00:00'), uploaded_at),
+            (self.crafted(None), uploaded_at),
+            (self.crafted('big'), size),
+            (self.crafted(None), size),
+            (self.crafted(10, pk='one'), size),
+            (self.crafted(10, pk=None), size),
+        ]:
+            with self.subTest(cursor=cursor, field=field.name), self.assertRaises(ListingError):
+                decode_cursor(cursor, field)
+
+
+def copy_clone(src, dst):
+    """reflink() stand-in for filesystems without FICLONE: same result, separate extents"""
+    with open(src, 'rb') as s, open(dst, 'xb') as d:
+        shutil.copyfileobj(s, d)
+
+def no_clone(src, dst):
+    raise OSError(95, 'Operation not supported')
+
+
+class DedupStorageTests(MediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.storage = storage.DedupStorage()
+
+    def save(self, name, data=b'same content'):
+        return self.storage.save(name, ContentFile(data))
+
+    def blob_files(self):
+        return [name for _, _, names in os.walk(self.storage.path(storage.BLOB_DIR)) for name in names if name[0] != '.']
+
+    @mock.patch.object(storage, 'reflink', no_clone)
+    def test_without_reflinks_the_users_file_is_the_only_copy(self):
+        a, b = self.save('u/a.txt'), self.save('u/b.txt')
+        self.assertEqual(Blob.objects.get().refcount, 2)
+        self.assertEqual(set(BlobLink.objects.values_list('name', flat=True)), {a, b})
+        self.assertEqual(self.blob_files(), [])
+        with self.storage.open(b) as f:
+            self.assertEqual(f.read(), b'same content')
+
+    @mock.patch.object(storage, 'reflink', copy_clone)
+    def test_blob_is_removed_with_its_last_link(self):
+        a, b = self.save('u/a.txt'), self.save('u/b.txt')
+        self.save('u/c.txt', b'other content')
+        self.assertEqual(len(self.blob_files()), 2)
+        self.storage.delete(a)
+        self.assertEqual(Blob.objects.get(pk=BlobLink.objects.get(name=b).blob_id).refcount, 1)
+        self.storage.delete(b)
+        self.assertEqual(Blob.objects.count(), 1)
+        self.assertEqual(len(self.blob_files()), 1)
+        self.assertFalse(self.storage.exists(a) or self.storage.exists(b))
+
+    def test_same_name_gets_a_new_name(self):
+        self.assertNotEqual(self.save('u/a.txt'), self.save('u/a.txt'))
+
+    @mock.patch.object(storage, 'reflink', copy_clone)
+    def test_garbage_collection(self):
+        a, b = self.save('u/a.txt'), self.save('u/b.txt', b'removed in a container')
+        os.remove(self.storage.path(b))
+        # Adopted without a hash, as finished chunked uploads are
+        part = self.storage.path('u/.part')
+        with open(part, 'wb') as f:
+            f.write(b'same content')
+        c = self.storage.adopt(part, 'u/c.txt')
+        self.assertFalse(BlobLink.objects.filter(name=c).exists())
+        orphan = self.storage.blob_path('f' * 64)
+        os.makedirs(os.path.dirname(orphan))
+        open(orphan, 'w').close()
+
+        self.assertEqual(self.storage.collect_garbage([a, b, c]), (1, 1))
+        self.assertEqual(Blob.objects.get().refcount, 2)
+        self.assertEqual(BlobLink.objects.get(name=c).blob_id, BlobLink.objects.get(name=a).blob_id)
+        self.assertEqual(len(self.blob_files()), 1)
+        self.assertEqual(self.storage.collect_garbage([a, b, c]), (0, 0))
+
+    def test_deleting_a_user_deletes_their_files(self):
+        user = get_user_model().objects.create_user('owner', password='x')
+        with self.captureOnCommitCallbacks(execute=True):
+            upload = UserFile.objects.create(user=user, file=ContentFile(b'data', name='a.txt'))
+        path = upload.file.path
+        self.assertTrue(os.path.exists(path))
+        with self.captureOnCommitCallbacks(execute=True):
+            user.delete()
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(BlobLink.objects.exists())
+
+
+class ChunkedUploadTests(MediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        # 10MB quota
+        self.user = get_user_model().objects.create_user('uploader', password='x', storage_limit=10)
+
+    def upload(self, data, kind='file', name='', chunk_size=4):
+        session = uploads.start_upload(self.user, kind, 'weights.onnx', len(data), chunk_size, name=name, framework='onnx')
+        for index in range(session.chunk_count):
+            uploads.write_chunk(session, index, io.BytesIO(data[index * chunk_size:(index + 1) * chunk_size]))
+        return session
+
+    def test_chunks_are_assembled_in_place(self):
+        session = self.upload(b'0123456789')
+        inode = os.stat(uploads.part_path(session)).st_ino
+        instance = uploads.finish_upload(session)
+        with instance.file.open('rb') as f:
+            self.assertEqual(f.read(), b'0123456789')
+        self.assertEqual(os.stat(instance.file.path).st_ino, inode)
+        self.assertEqual(instance.size, 10)
+
+    def test_incomplete_upload(self):
+        session = uploads.start_upload(self.user, 'file', 'a.bin', 10, 4)
+        uploads.write_chunk(session, 0, io.BytesIO(b'0123'))
+        with self.assertRaises(uploads.UploadError):
+            uploads.finish_upload(session)
+
+    def test_open_sessions_reserve_quota(self):
+        uploads.start_upload(self.user, 'file', 'a.bin', 6 * MB, MB)
+        with self.assertRaises(uploads.UploadError):
+            uploads.start_upload(self.user, 'file', 'b.bin', 6 * MB, MB)
+
+    def test_quota_is_checked_again_at_finish(self):
+        session = self.upload(b'0123456789')
+        get_user_model().objects.filter(pk=self.user.pk).update(storage_used=10 * MB - 5)
+        with self.assertRaises(uploads.UploadError):
+            uploads.finish_upload(session)
+        self.assertTrue(os.path.exists(uploads.part_path(session)))
+
+    def test_model_name_taken_after_start(self):
+        session = self.upload(b'0123456789', kind='model', name='net')
+        AIModel.objects.create(user=self.user, name='net', framework='onnx')
+        with self.assertRaises(uploads.UploadError):
+            uploads.finish_upload(session)
+
+    def test_model_name_taken_during_finish_keeps_the_session(self):
+        session = self.upload(b'0123456789', kind='model', name='net')
+        # The name check passes, the insert loses the race
+        with mock.patch.object(AIModel.objects, 'filter', return_value=AIModel.objects.none()), \
+                mock.patch.object(AIModel, 'save', side_effect=IntegrityError):
+            with self.assertRaises(uploads.UploadError):
+                uploads.finish_upload(session)
+        with open(uploads.part_path(session), 'rb') as f:
+            self.assertEqual(f.read(), b'0123456789')
+        self.assertTrue(type(session).objects.filter(pk=session.pk).exists())
+
+
+class ProxyRoutesMixin:
+    """Routes written to a temporary PROXY_ROUTES_DIR, with no nginx to reload"""
+
+    def setUp(self):
+        super().setUp()
+        routes_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, routes_dir, ignore_errors=True)
+        self.enterContext(override_settings(PROXY_ROUTES_DIR=routes_dir, CONTAINER_NETWORK='webui_containers', PROXY_CONTAINER=''))
+
+    def route(self, user, container_type):
+        with open(proxy.route_file(user, container_type)) as f:
+            return f.read()
+
+
+class ProxyRouteTests(ProxyRoutesMixin, SchedulerTestCase):
+    def test_routes_strip_the_prefix_except_for_jupyter(self):
+        user = self.users[0]
+        app = proxy.render_route(user, 'regular', 'webui-user:80')
+        self.assertIn(f"location /u/{user.username}/app/ {{", app)
+        self.assertIn(f"rewrite ^/u/{user.username}/app/(.*)$ /$1 break;", app)
+        self.assertNotIn('rewrite', proxy.render_route(user, 'jupyter', 'webui-user:8888'))
+        self.assertNotIn('rewrite', proxy.render_route(user, 'regular', proxy.WAKE_UPSTREAM))
+
+    def test_write_route_reports_changes_only(self):
+        user = self.users[0]
+        self.assertTrue(proxy.write_route(user, 'regular', 'webui-user:80'))
+        self.assertFalse(proxy.write_route(user, 'regular', 'webui-user:80'))
+        self.assertTrue(proxy.write_route(user, 'regular', proxy.WAKE_UPSTREAM))
+        self.assertIn(f"set $container_upstream {proxy.WAKE_UPSTREAM};", self.route(user, 'regular'))
+        self.assertTrue(proxy.remove_route(user, 'regular'))
+        self.assertFalse(proxy.remove_route(user, 'regular'))
+
+    def test_sync_routes_drops_stale_files(self):
+        a, b = self.users[:2]
+        proxy.write_route(b, 'jupyter', 'webui-b:8888')
+        self.assertTrue(proxy.sync_routes({(a, 'regular'): 'webui-a:80'}))
+        self.assertFalse(proxy.sync_routes({(a, 'regular'): 'webui-a:80'}))
+        self.assertTrue(os.path.exists(proxy.route_file(a, 'regular')))
+        self.assertFalse(os.path.exists(proxy.route_file(b, 'jupyter')))
+
+    def test_last_request_empties_the_access_log(self):
+        user = self.users[0]
+        self.assertIsNone(proxy.last_request(user, 'regular'))
+        proxy.write_route(user, 'regular', 'webui-user:80')
+        with open(proxy.access_log(user, 'regular'), 'w') as f:
+            f.write("1700000000.125\n1700000001.500\n")
+        self.assertEqual(proxy.last_request(user, 'regular'), 1700000001.5)
+        self.assertIsNone(proxy.last_request(user, 'regular'))
+
+
+class SyncRoutesTests(ProxyRoutesMixin, SchedulerTestCase):
+    async def test_suspended_containers_are_routed_to_the_web_app(self):
+        running, suspended, removed = self.users
+        now = datetime.now(timezone.utc)
+        await DockerContainer.objects.acreate(user=running, container_type='regular', status='running')
+        await DockerContainer.objects.acreate(user=suspended, container_type='jupyter', status='paused', suspended_at=now)
+        await DockerContainer.objects.acreate(user=removed, container_type='regular', status='removed')
+
+        await Orchestrator(api=FakeEngine()).sync_routes()
+        self.assertIn(f"set $container_upstream {container_name(running)}:80;", self.route(running, 'regular'))
+        self.assertIn(f"set $container_upstream {proxy.WAKE_UPSTREAM};", self.route(suspended, 'jupyter'))
+        self.assertFalse(os.path.exists(proxy.route_file(removed, 'regular')))
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNELS)
+class ContainerConsumerTests(SchedulerTestCase):
+    async def connect(self, user, container_id):
+        communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), f"/ws/container/{container_id}/")
+        communicator.scope['user'] = user or AnonymousUser()
+        connected, _ = await communicator.connect()
+        return communicator, connected
+
+    @mock.patch('core.consumers.stats_engine')
+    async def test_only_the_owner_gets_stats(self, engine):
+        engine.subscribe.return_value = None
+        owner, other = self.users[:2]
+        await DockerContainer.objects.acreate(user=owner, container_type='regular', container_id='abc123')
+
+        for user in (other, None):
+            communicator, connected = await self.connect(user, 'abc123')
+            self.assertFalse(connected)
+        engine.subscribe.assert_not_called()
+
+        communicator, connected = await self.connect(owner, 'abc123')
+        self.assertTrue(connected)
+        self.assertEqual((await communicator.receive_json_from())['type'], 'history')
+        engine.subscribe.assert_called_once()
+        await communicator.disconnect()
+
+
+class PredictTests(SchedulerTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = self.client_class(enforce_csrf_checks=True, HTTP_HOST='localhost')
+        self.owner = self.users[0]
+        self.model = AIModel.objects.create(user=self.owner, name='net', framework='onnx', status='ready')
+        _, self.key = issue_token(self.owner, 'ci')
+
+    def predict(self, key=None):
+        headers = {'Authorization': f"Bearer {key}"} if key else {}
+        return self.client.post(
+            f"/ai/models/{self.model.pk}/predict/", {'inputs': [[1, 2]]},
+            content_type='application/json', secure=True, headers=headers
+        )
+
+    @mock.patch('core.views.serving_engine')
+    def test_token_clients_need_no_csrf_token(self, engine):
+        engine.predict = mock.AsyncMock(return_value={'y': np.array([[2, 4]])})
+        response = self.predict(self.key)
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.json(), {'outputs': {'y': [[2, 4]]}})
+        self.assertIsNotNone(self.owner.api_tokens.get().last_used_at)
+
+    def test_missing_or_unknown_token(self):
+        self.assertEqual(self.predict().status_code, 401)
+        self.assertEqual(self.predict('not-a-token').status_code, 401)
+        # A session is not enough either, the endpoint is for token clients
+        self.client.force_login(self.owner)
+        self.assertEqual(self.predict().status_code, 401)
+
+    def test_other_users_models_are_not_found(self):
+        _, key = issue_token(self.users[1], 'other')
+        self.assertEqual(self.predict(key).status_code, 404)
+
+    def test_revoked_token(self):
+        self.client.force_login(self.owner)
+        token = self.owner.api_tokens.get()
+        response = self.client.delete(f"/api/tokens/{token.pk}/", secure=True, headers={'X-CSRFToken': 'x'})
+        self.assertEqual(response.status_code, 403)  # managing tokens is a browser action, CSRF applies
+        self.client.handler.enforce_csrf_checks = False
+        self.assertEqual(self.client.delete(f"/api/tokens/{token.pk}/", secure=True).status_code, 204)
+        self.assertEqual(self.predict(self.key).status_code, 401)
+
+
+class QuotaTests(MediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = get_user_model().objects.create_user('quota', password='x', storage_limit=1)  # 1MB
+
+    def used(self):
+        return get_user_model().objects.values_list('storage_used', flat=True).get(pk=self.user.pk)
+
+    def test_ledger_charges_and_refunds_stored_files(self):
+        upload = UserFile.objects.create(user=self.user, file=ContentFile(b'x' * 1000, name='a.bin'))
+        model = AIModel.objects.create(user=self.user, name='m', framework='onnx', model_file=ContentFile(b'y' * 500, name='m.onnx'))
+        self.assertEqual(self.used(), 1500)
+        upload.file.delete(save=False)
+        upload.file.save('b.bin', ContentFile(b'x' * 200))  # resaving charges the difference only
+        self.assertEqual(self.used(), 700)
+        upload.delete()
+        model.delete()
+        self.assertEqual(self.used(), 0)
+
+    def test_check_quota(self):
+        quota.check_quota(self.user, MB)
+        with self.assertRaises(quota.QuotaExceeded):
+            quota.check_quota(self.user, MB + 1)
+
+    def test_upload_handler_stops_over_quota_uploads(self):
+        request = SimpleNamespace(user=self.user)
+        handler = quota.QuotaUploadHandler(request)
+        handler.handle_raw_input(None, {}, MB + 1, b'boundary')
+        self.assertTrue(request.quota_exceeded)
+        with self.assertRaises(StopUpload):
+            handler.new_file('file', 'a.bin', 'application/octet-stream', MB + 1)
+        handler.handle_raw_input(None, {}, MB, b'boundary')
+        self.assertFalse(request.quota_exceeded)
+        handler.new_file('file', 'a.bin', 'application/octet-stream', MB)
+
+    async def call_middleware(self, length, session_key):
+        app = mock.AsyncMock()
+        sent = []
+
+        async def send(message):
+            sent.append(message)
+
+        headers = [(b'content-length', str(length).encode()), (b'cookie', f"sessionid={session_key}".encode())]
+        await quota.QuotaMiddleware(app)({'type': 'http', 'method': 'POST', 'headers': headers}, None, send)
+        return app, sent
+
+    @override_settings(FILE_UPLOAD_MAX_MEMORY_SIZE=1024)
+    async def test_middleware_answers_413_before_reading_the_body(self):
+        from django.contrib.sessions.backends.db import SessionStore
+        session = SessionStore()
+        session[SESSION_KEY] = str(self.user.pk)
+        await session.asave()
+
+        app, sent = await self.call_middleware(MB + 1, session.session_key)
+        app.assert_not_called()
+        self.assertEqual(sent[0]['status'], 413)
+
+        app, sent = await self.call_middleware(MB, session.session_key)
+        app.assert_called_once()
+        # Anonymous requests are left to the views
+        app, sent = await self.call_middleware(MB + 1, 'unknown')
+        app.assert_called_once()
+
+    def test_reconcile_applies_the_drift_once(self):
+        workspace = quota.get_user_workspace(self.user)
+        os.makedirs(os.path.join(workspace, 'data'))
+        with open(os.path.join(workspace, 'data', 'a.bin'), 'wb') as f:
+            f.write(b'x' * 3000)
+        os.link(os.path.join(workspace, 'data', 'a.bin'), os.path.join(workspace, 'b.bin'))
+        get_user_model().objects.filter(pk=self.user.pk).update(storage_used=1000)
+        self.assertEqual(quota.reconcile_user(self.user), 2000)
+        self.assertEqual(self.used(), 3000)
+        self.assertEqual(quota.reconcile_user(self.user), 0)
+
+
+class JobQueueTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user('jobs', password='x')
+
+    def claim(self, kind='lifecycle'):
+        job = jobs.claim_next(kind, 'test')
+        return job and job.action
+
+    def test_container_jobs_run_in_queue_order(self):
+        with mock.patch.object(jobs, 'needs_pull', return_value=True):
+            create = jobs.enqueue_with_image('create', self.user, 'lab:latest')
+        start = jobs.enqueue_lifecycle('start', self.user)
+        other = jobs.enqueue_lifecycle('start', self.user, container_type='jupyter')
+        self.assertEqual(create.depends_on.action, 'pull')
+
+        # Only the other container's job is runnable: the start may not overtake the create waiting on its pull
+        self.assertEqual(jobs.claim_next('lifecycle', 'test'), other)
+        jobs.update_job(other.pk, 'done')
+        self.assertIsNone(self.claim())
+        self.assertEqual(self.claim('pull'), 'pull')
+        jobs.update_job(create.depends_on_id, 'done')
+        self.assertEqual(self.claim(), 'create')
+        self.assertIsNone(self.claim())
+        jobs.update_job(create.pk, 'done')
+        self.assertEqual(jobs.claim_next('lifecycle', 'test'), start)
+
+    def test_dedup_key_returns_the_active_job(self):
+        first = jobs.enqueue_lifecycle('stop', self.user)
+        self.assertEqual(jobs.enqueue_lifecycle('stop', self.user), first)
+        self.assertNotEqual(jobs.enqueue_lifecycle('stop', self.user, container_type='jupyter'), first)
+        with mock.patch.object(jobs, 'needs_pull', return_value=True):
+            pull = jobs.enqueue_with_image('create', self.user, 'lab:latest').depends_on
+            self.assertEqual(jobs.enqueue_with_image('jupyter_start', self.user, 'lab:latest', 'jupyter').depends_on, pull)
+        jobs.update_job(first.pk, 'done')
+        self.assertNotEqual(jobs.enqueue_lifecycle('stop', self.user), first)
+        self.assertEqual(Job.objects.filter(action='pull').count(), 1)
+
+    def test_maintain_requeues_stale_jobs_and_fails_orphans(self):
+        with mock.patch.object(jobs, 'needs_pull', return_value=True):
+            create = jobs.enqueue_with_image('create', self.user, 'lab:latest')
+        stop = jobs.enqueue_lifecycle('stop', self.user, container_type='jupyter')
+        pull = jobs.claim_next('pull', 'dead')
+        jobs.claim_next('lifecycle', 'alive')
+        stale = datetime.now(timezone.utc) - timedelta(days=1)
+        Job.objects.filter(pk__in=[pull.pk, stop.pk]).update(heartbeat_at=stale)
+
+        jobs.maintain('alive', [stop.pk])
+        pull.refresh_from_db()
+        stop.refresh_from_db()
+        self.assertEqual((pull.status, pull.worker), ('queued', ''))
+        self.assertEqual(stop.status, 'running')
+        self.assertGreater(stop.heartbeat_at, stale)
+
+        jobs.update_job(pull.pk, 'failed', 'Pull failed')
+        jobs.maintain('alive', [stop.pk])
+        create.refresh_from_db()
+        self.assertEqual((create.status, create.message), ('failed', 'Dependency failed'))
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNELS, IDLE_SUSPEND_MODE='pause', IDLE_SUSPEND_AFTER=1800)
+class IdleSuspendTests(MediaRootMixin, ProxyRoutesMixin, SchedulerTestCase):
+    async def test_suspend_routes_to_the_web_app_until_resumed(self):
+        user = self.users[0]
+        orchestrator = Orchestrator(api=FakeEngine())
+        await orchestrator.do_create(Operation(None, user, 'create', {}), 'nginx:latest')
+        await orchestrator.do_start(Operation(None, user, 'start', {}))
+        upstream = f"set $container_upstream {container_name(user)}:80;"
+
+        self.assertEqual(await orchestrator.do_suspend(Operation(None, user, 'suspend', {})), {'mode': 'pause'})
+        self.assertEqual(orchestrator.api.containers[container_name(user)]['State'], 'paused')
+        self.assertIn(f"set $container_upstream {proxy.WAKE_UPSTREAM};", self.route(user, 'regular'))
+        row = await DockerContainer.objects.aget(user=user, container_type='regular')
+        self.assertIsNotNone(row.suspended_at)
+        self.assertIsNone(await orchestrator.do_suspend(Operation(None, user, 'suspend', {})))
+
+        # A start of a suspended container resumes it
+        self.assertEqual(await orchestrator.do_start(Operation(None, user, 'start', {})), proxy.route_path(user, 'regular'))
+        self.assertEqual(orchestrator.api.containers[container_name(user)]['State'], 'running')
+        self.assertIn(upstream, self.route(user, 'regular'))
+        row = await DockerContainer.objects.aget(user=user, container_type='regular')
+        self.assertEqual((row.status, row.suspended_at, row.suspend_mode), ('running', None, ''))
+
+    @override_settings(PROXY_ROUTES_DIR='')
+    async def test_suspend_needs_the_proxy(self):
+        with self.assertRaises(RuntimeError):
+            await Orchestrator(api=FakeEngine()).do_suspend(Operation(None, self.users[0], 'suspend', {}))
+
+    @mock.patch('core.idle.calculate_container_stats')
+    async def test_idle_containers_are_suspended(self, stats):
+        busy, quiet, requested = self.users
+        now = datetime.now(timezone.utc)
+        long_ago = now - timedelta(hours=1)
+        for user in self.users:
+            await DockerContainer.objects.acreate(
+                user=user, container_type='regular', container_id=f"id-{user.username}",
+                status='running', last_active_at=long_ago
+            )
+        loads = {f"id-{busy.username}": 50.0, f"id-{quiet.username}": 0.0, f"id-{requested.username}": 0.0}
+        engine = FakeEngine()
+        engine.container_stats = mock.AsyncMock(side_effect=lambda container_id: container_id)
+        stats.side_effect = lambda container_id: {'cpu': loads[container_id], 'network_rx': 0, 'network_tx': 0}
+        os.makedirs(os.path.dirname(proxy.access_log(requested, 'regular')))
+        with open(proxy.access_log(requested, 'regular'), 'w') as f:
+            f.write(f"{now.timestamp() - 60:.3f}\n")
+
+        monitor = idle.IdleMonitor(Orchestrator(api=engine))
+        monitor.traffic = dict.fromkeys(loads, 0)
+        await monitor.check()
+        jobs_queued = [job async for job in Job.objects.filter(action='suspend').select_related('user')]
+        self.assertEqual([job.user for job in jobs_queued], [quiet])
+        busy_row = await DockerContainer.objects.aget(user=busy)
+        self.assertGreater(busy_row.last_active_at, long_ago)
+        requested_row = await DockerContainer.objects.aget(user=requested)
+        self.assertAlmostEqual(requested_row.last_active_at.timestamp(), now.timestamp() - 60, places=2)
+
+
+@override_settings(PROXY_ROUTES_DIR='', CONTAINER_NETWORK='')
+class BulkTests(SchedulerTestCase):
+    def setUp(self):
+        super().setUp()
+        remote = node('remote')
+        remote.save()
+        a, b, c = self.users
+        DockerContainer.objects.create(user=a, container_type='regular', status='running', image_name='lab:1')
+        DockerContainer.objects.create(user=b, container_type='regular', status='stopped', image_name='lab:1', node=remote)
+        DockerContainer.objects.create(user=c, container_type='jupyter', status='running', image_name='lab:1')
+        DockerContainer.objects.create(user=c, container_type='regular', status='removed')
+
+    def test_select_containers(self):
+        a, b, c = self.users
+        self.assertEqual(bulk.select_containers().count(), 3)
+        self.assertEqual({row.user for row in bulk.select_containers(node='')}, {a, c})
+        self.assertEqual([row.user for row in bulk.select_containers(node='remote')], [b])
+        self.assertEqual([row.user for row in bulk.select_containers(container_type='regular', status='running')], [a])
+        self.assertEqual([row.user for row in bulk.select_containers(usernames=[c.username])], [c])
+
+    def test_restart_chains_stop_and_start(self):
+        batch = bulk.start_batch('restart', bulk.select_containers(container_type='regular'))
+        stops = batch.jobs.filter(action='stop')
+        self.assertEqual(stops.count(), 2)
+        for stop in stops:
+            start = batch.jobs.get(action='start', depends_on=stop)
+            self.assertEqual((start.kind, start.container), ('bulk', stop.container))
+        # A second batch queues its own jobs instead of joining the first one's
+        again = bulk.start_batch('restart', bulk.select_containers(container_type='regular'))
+        self.assertFalse(set(again.jobs.all()) & set(batch.jobs.all()))
+
+    def test_recreate_shares_one_pull(self):
+        with mock.patch.object(bulk, 'needs_pull', return_value=True):
+            batch = bulk.start_batch('recreate', bulk.select_containers(), image_name='lab:2')
+        pull = batch.jobs.get(action='pull')
+        self.assertEqual(pull.params, {'image_name': 'lab:2'})
+        self.assertEqual(Counter(batch.jobs.values_list('action', flat=True)), {'pull': 1, 'create': 2, 'jupyter_start': 1, 'start': 1})
+        self.assertEqual(batch.jobs.filter(depends_on=pull).count(), 3)
+        # Only the container that was running is started again
+        self.assertEqual(batch.jobs.get(action='start').user, self.users[0])
+
+    def test_refused_batches(self):
+        for action, image_name in (('reboot', None), ('stop', 'lab:2'), ('suspend', None)):
+            with self.assertRaises(bulk.BulkError):
+                bulk.start_batch(action, bulk.select_containers(), image_name=image_name)
+
+    def test_progress(self):
+        batch = bulk.start_batch('stop', bulk.select_containers())
+        first, second, third = batch.jobs.order_by('created_at')
+        jobs.update_job(first.pk, 'done')
+        jobs.update_job(second.pk, 'failed', 'No such container')
+        progress = bulk.batch_progress(batch)
+        self.assertEqual((progress['total'], progress['queued'], progress['done'], progress['failed']), (3, 1, 1, 1))
+        self.assertFalse(progress['finished'])
+        self.assertEqual(progress['errors'], [{
+            'user': second.user.username, 'container_type': second.params['container_type'],
+            'action': 'stop', 'message': 'No such container'
+        }])
+        jobs.update_job(third.pk, 'done')
+        self.assertTrue(bulk.batch_progress(batch)['finished'])
+
+
+class ArchiveTests(MediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = get_user_model().objects.create_user('archive', password='x')
+        self.workspace = quota.get_user_workspace(self.user)
+        os.makedirs(os.path.join(self.workspace, 'data', 'sub'))
+        self.write('data/notes.txt', b'notes ' * 1000)
+        self.write('data/sub/plot.png', b'\x89PNG' + os.urandom(1000))
+        os.symlink('/etc/passwd', os.path.join(self.workspace, 'data', 'passwd'))
+
+    def write(self, name, data):
+        with open(os.path.join(self.workspace, name), 'wb') as f:
+            f.write(data)
+
+    def entries(self):
+        return [('data', os.path.join(self.workspace, 'data')), ('gone.txt', os.path.join(self.workspace, 'gone.txt'))]
+
+    def test_zip_stores_compressed_formats(self):
+        data = b''.join(archive.stream_archive(self.entries(), 'zip'))
+        with zipfile.ZipFile(io.BytesIO(data)) as z:
+            self.assertEqual(z.namelist(), ['data/notes.txt', 'data/sub/plot.png'])
+            self.assertEqual(z.getinfo('data/notes.txt').compress_type, zipfile.ZIP_DEFLATED)
+            self.assertEqual(z.getinfo('data/sub/plot.png').compress_type, zipfile.ZIP_STORED)
+            self.assertEqual(z.read('data/notes.txt'), b'notes ' * 1000)
+            self.assertIsNone(z.testzip())
+
+    def test_tar_formats(self):
+        for fmt, mode in (('tar', 'r:'), ('tar.gz', 'r:gz')):
+            data = b''.join(archive.stream_archive(self.entries(), fmt))
+            with tarfile.open(fileobj=io.BytesIO(data), mode=mode) as tar:
+                self.assertEqual(tar.getnames(), ['data/notes.txt', 'data/sub/plot.png'])
+                self.assertEqual(tar.extractfile('data/notes.txt').read(), b'notes ' * 1000)
+        self.assertEqual(len(b''.join(archive.stream_archive(self.entries(), 'tar'))) % tarfile.RECORDSIZE, 0)
+
+    def test_export_view(self):
+        upload = UserFile.objects.create(user=self.user, name='upload.txt', file=ContentFile(b'upload', name='upload.txt'))
+        self.client.force_login(self.user)
+        response = self.client.get(
+            '/files/export/', {'format': 'tar', 'files': upload.pk, 'paths': 'data/sub'},
+            HTTP_HOST='localhost', secure=True
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/x-tar')
+        with tarfile.open(fileobj=io.BytesIO(b''.join(response.streaming_content))) as tar:
+            self.assertEqual(tar.getnames(), ['files/upload.txt', 'workspace/data/sub/plot.png'])
+
+        for params in ({'format': 'rar', 'paths': 'data'}, {'paths': '../'}, {'paths': 'missing'}):
+            response = self.client.get('/files/export/', params, HTTP_HOST='localhost', secure=True)
+            self.assertEqual(response.status_code, 400)
+
+
+class ReconcilerTests(SchedulerTestCase):
+    def setUp(self):
+        super().setUp()
+        a, b, c = self.users
+        self.rows = {
+            'exited': DockerContainer.objects.create(user=a, container_type='regular', container_id='exited', status='running'),
+            'gone': DockerContainer.objects.create(user=b, container_type='regular', container_id='gone', status='running'),
+            'creating': DockerContainer.objects.create(user=c, container_type='regular', container_id=reconciler.UNSET_CONTAINER_ID, status='stopped'),
+            'paused': DockerContainer.objects.create(user=c, container_type='jupyter', container_id='paused', status='running'),
+        }
+        self.api = mock.Mock()
+        self.api.containers_list = mock.AsyncMock(return_value=[
+            {'Id': 'exited', 'State': 'exited'}, {'Id': 'paused', 'State': 'paused'}, {'Id': 'other', 'State': 'running'}
+        ])
+
+    def statuses(self):
+        return {key: DockerContainer.objects.get(pk=row.pk).status for key, row in self.rows.items()}
+
+    async def test_resync_corrects_every_row(self):
+        await reconciler.ContainerReconciler(self.api).resync()
+        self.assertEqual(await database_sync_to_async(self.statuses)(), {
+            'exited': 'stopped', 'gone': 'removed', 'creating': 'stopped', 'paused': 'paused'
+        })
+
+    def test_resync_leaves_rows_saved_after_the_listing(self):
+        before = datetime.now(timezone.utc)
+        self.rows['gone'].save()
+        self.assertEqual(reconciler.resync({}, None, before), 2)
+        self.assertEqual(self.statuses()['gone'], 'running')
+
+    async def test_events_are_folded_and_flushed(self):
+        async def events(filters, since):
+            for action, container_id in (('die', 'exited'), ('start', 'exited'), ('pause', 'paused'), ('exec_start', 'gone')):
+                yield {'Action': action, 'Actor': {'ID': container_id}}
+
+        self.api.containers_list.return_value = [{'Id': key, 'State': 'running'} for key in self.rows]
+        self.api.events = events
+        watcher = reconciler.ContainerReconciler(self.api)
+        await watcher.watch()
+        self.assertEqual(watcher.pending, {'exited': 'running', 'paused': 'paused'})
+
+        with mock.patch.object(reconciler, 'apply_statuses', side_effect=RuntimeError('database is locked')), \
+                self.assertLogs('core.reconciler', 'ERROR'):
+            await watcher.flush()
+        self.assertEqual(watcher.pending, {'exited': 'running', 'paused': 'paused'})
+        await watcher.flush()
+        self.assertEqual(watcher.pending, {})
+        statuses = await database_sync_to_async(self.statuses)()
+        self.assertEqual((statuses['exited'], statuses['paused'], statuses['gone']), ('running', 'paused', 'running'))
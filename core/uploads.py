@@ -0,0 +1,162 @@
+import hashlib
+import os
+from datetime import timedelta
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, transaction
+from django.db.models import Sum
+from django.utils import timezone
+from django.utils.text import get_valid_filename
+from .quota import QuotaExceeded, check_quota
+from .models import UploadSession, UploadChunk, UserFile, AIModel, user_directory_path, user_file_path
+
+READ_SIZE = 1024 * 1024
+
+
+class UploadError(Exception):
+    pass
+
+
+def part_path(session):
+    """Absolute path the chunks are written to, next to the final file"""
+    directory = os.path.dirname(default_storage.path(target_name(session)))
+    return os.path.join(directory, f".upload-{session.id}.part")
+
+def target_name(session):
+    """Storage name the upload is finalized under"""
+    if session.kind == 'model':
+        return user_file_path(AIModel(user=session.user), session.filename)
+    return user_directory_path(UserFile(user=session.user), session.filename)
+
+def reserved(user, exclude=None):
+    """Bytes held by the user's open upload sessions, which the ledger is only charged for when they finish"""
+    sessions = UploadSession.objects.filter(user=user)
+    if exclude is not None:
+        sessions = sessions.exclude(pk=exclude.pk)
+    return sessions.aggregate(total=Sum('size'))['total'] or 0
+
+def start_upload(user, kind, filename, size, chunk_size=None, name='', framework=''):
+    """Creates a session and a sparse file of the final size to write chunks into"""
+    chunk_size = int(chunk_size or settings.UPLOAD_CHUNK_SIZE)
+    size = int(size)
+    if kind not in dict(UploadSession.KINDS):
+        raise UploadError(f"Unknown upload kind: {kind}")
+    if size < 0 or not 0 < chunk_size <= settings.UPLOAD_CHUNK_SIZE_MAX:
+        raise UploadError("Invalid size or chunk size")
+    expire_sessions(user)
+    try:
+        check_quota(user, size + reserved(user))
+    except QuotaExceeded as e:
+        raise UploadError(str(e))
+    if kind == 'model':
+        if framework not in dict(AIModel.FRAMEWORKS):
+            raise UploadError(f"Unknown framework: {framework}")
+        if not name or AIModel.objects.filter(user=user, name=name).exists():
+            raise UploadError("Model name is missing or already used")
+
+    session = UploadSession.objects.create(
+        user=user, kind=kind,
+        filename=get_valid_filename(os.path.basename(filename)),
+        size=size, chunk_size=chunk_size,
+        name=name, framework=framework
+    )
+    path = part_path(session)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.truncate(size)
+    return session
+
+def write_chunk(session, index, stream, checksum=''):
+    """Streams one chunk straight to its offset, verifying its SHA-256 when given"""
+    if not 0 <= index < session.chunk_count:
+        raise UploadError(f"Chunk {index} out of range")
+    offset = index * session.chunk_size
+    expected = min(session.chunk_size, session.size - offset)
+
+    digest = hashlib.sha256()
+    written = 0
+    fd = os.open(part_path(session), os.O_WRONLY)
+    try:
+        while written < expected:
+            data = stream.read(min(READ_SIZE, expected - written))
+            if not data:
+                break
+            digest.update(data)
+            os.pwrite(fd, data, offset + written)
+            written += len(data)
+    finally:
+        os.close(fd)
+
+    if written != expected or (checksum and checksum.lower() != digest.hexdigest()):
+        # The bytes on disk are no longer what an earlier attempt recorded
+        session.chunks.filter(index=index).delete()
+        if written != expected:
+            raise UploadError(f"Chunk {index} is {written} bytes, expected {expected}")
+        raise UploadError(f"Chunk {index} checksum mismatch")
+    try:
+        with transaction.atomic():
+            UploadChunk.objects.create(session=session, index=index, sha256=digest.hexdigest())
+    except IntegrityError:
+        # Retried chunk, already recorded
+        UploadChunk.objects.filter(session=session, index=index).update(sha256=digest.hexdigest())
+    UploadSession.objects.filter(pk=session.pk).update(updated_at=timezone.now())
+
+def received_chunks(session):
+    return sorted(session.chunks.values_list('index', flat=True))
+
+def store_file(path, name):
+    """Moves a finished local file into storage as `name`; returns the name it got"""
+    if hasattr(default_storage, 'adopt'):
+        return default_storage.adopt(path, name)
+    name = default_storage.get_available_name(name)
+    os.replace(path, default_storage.path(name))
+    os.chmod(default_storage.path(name), settings.FILE_UPLOAD_PERMISSIONS)
+    return name
+
+def finish_upload(session):
+    """
+    Moves the completed part file into storage and creates its UserFile or
+    AIModel row. The quota and the model name are checked again, since
+    other uploads may have finished or used the name in the meantime.
+    """
+    if session.chunks.count() != session.chunk_count:
+        raise UploadError("Upload is incomplete")
+    user = session.user
+    user.refresh_from_db(fields=['storage_used'])
+    try:
+        check_quota(user, session.size + reserved(user, exclude=session))
+    except QuotaExceeded as e:
+        raise UploadError(str(e))
+    if session.kind == 'model' and AIModel.objects.filter(user=user, name=session.name).exists():
+        raise UploadError("Model name is already used")
+
+    # Hashing is left to the blob index, the request never reads the file again
+    name = store_file(part_path(session), target_name(session))
+    if session.kind == 'model':
+        instance = AIModel(user=user, name=session.name, framework=session.framework)
+        instance.model_file.name = name
+    else:
+        instance = UserFile(user=user)
+        instance.file.name = name
+    try:
+        with transaction.atomic():
+            instance.save()
+    except IntegrityError:
+        # A model of that name was created since the check; the session stays finishable
+        os.replace(default_storage.path(name), part_path(session))
+        raise UploadError("Model name is already used")
+    session.delete()
+    return instance
+
+def abort_upload(session):
+    try:
+        os.remove(part_path(session))
+    except FileNotFoundError:
+        pass
+    session.delete()
+
+def expire_sessions(user):
+    """Drops the user's sessions that saw no chunk for UPLOAD_SESSION_EXPIRY seconds"""
+    cutoff = timezone.now() - timedelta(seconds=settings.UPLOAD_SESSION_EXPIRY)
+    for session in UploadSession.objects.filter(user=user, updated_at__lt=cutoff):
+        abort_upload(session)
@@ -1,4 +1,4 @@
-from django.urls import path
+from django.urls import path, re_path
 from . import views
 
 urlpatterns = [
@@ -8,10 +8,30 @@ urlpatterns = [
     path('docker/start/', views.start_container_view, name='start-container'),
     path('docker/stop/', views.stop_container_view, name='stop-container'),
     path('docker/delete/', views.delete_container_view, name='delete-container'),
+    path('jobs/<uuid:job_id>/', views.job_status, name='job-status'),
+    path('jobs/bulk/', views.bulk_operation, name='bulk-operation'),
+    path('jobs/bulk/<uuid:batch_id>/', views.bulk_status, name='bulk-status'),
+    path('files/list/', views.file_list, name='file-list'),
+    path('files/export/', views.export_archive, name='export-archive'),
+    path('files/workspace/', views.workspace_list, name='workspace-list'),
+    path('files/uploads/', views.upload_create, name='upload-create'),
+    path('files/uploads/<uuid:upload_id>/', views.upload_detail, name='upload-detail'),
+    path('files/uploads/<uuid:upload_id>/chunks/<int:index>/', views.upload_chunk, name='upload-chunk'),
+    path('files/uploads/<uuid:upload_id>/complete/', views.upload_complete, name='upload-complete'),
     path('files/download/<int:file_id>/', views.download_file, name='download-file'),
     path('files/delete/<int:file_id>/', views.delete_file, name='delete-file'),
     path('monitoring/', views.public_dashboard, name='public-monitoring'),
     path('monitoring/private/', views.private_dashboard, name='private-monitoring'),
+    path('monitoring/history/', views.metrics_history, name='metrics-history'),
     path('ai/', views.ai_dashboard, name='ai-dashboard'),
+    path('ai/models/', views.model_list, name='model-list'),
+    path('ai/models/<int:model_id>/predict/', views.predict, name='predict'),
+    path('ai/models/<int:model_id>/convert/', views.convert_model, name='convert-model'),
+    path('ai/serving/', views.serving_stats, name='serving-stats'),
+    path('api/tokens/', views.api_tokens, name='api-tokens'),
+    path('api/tokens/<int:token_id>/', views.api_token_detail, name='api-token-detail'),
+    path('ai/download/<int:model_id>/', views.download_model, name='download-model'),
     path('ai/delete/<int:model_id>/', views.delete_model, name='delete-model'),
+    # nginx sends requests for suspended containers here (core/proxy.py)
+    re_path(r'^u/(?P<username>[^/]+)/(?P<segment>app|jupyter)/', views.resume_container, name='resume-container'),
 ]
\ No newline at end of file
@@ -1,34 +1,50 @@
 from django.shortcuts import render, redirect
+from django.urls import reverse
 from django.contrib.auth.decorators import login_required
-from django.http import FileResponse
-from .docker_utils import (  # Update this import line
-    create_container,
-    start_container,
-    stop_container,
-    delete_container,
-    create_jupyter_container
-)
-from .file_utils import ensure_workspace_exists
-from .models import DockerContainer, UserFile, AIModel
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from .jobs import enqueue_lifecycle, enqueue_with_image, enqueue_model_conversion
+from .proxy import ROUTED_PORTS
+from .orchestrator import JUPYTER_IMAGE
+from .archive import FORMATS, stream_archive
+from .bulk import BulkError, batch_progress, select_containers, start_batch
+from .file_utils import ensure_workspace_exists, get_user_workspace, serve_file
+from .models import DockerContainer, UserFile, AIModel, Job, JobBatch, UploadSession, WorkspaceEntry
 from .forms import DockerImageForm, FileUploadForm, AIModelForm
 from .monitoring import get_system_stats, get_user_container_stats
+from .metrics_store import metrics_store, host_key, container_key
+from .listing import ListingError, listing_params, paginate
+from .model_runtime import ModelRuntimeError
+from .model_variants import conversion_kinds
+from .serving import ServingError, serving_engine
+from .api_tokens import SCHEME, issue_token, token_user
+from .uploads import UploadError, start_upload, write_chunk, received_chunks, finish_upload, abort_upload
 from django.contrib import messages
+from django.db.models import Q
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_http_methods
+from asgiref.sync import sync_to_async
+from django.conf import settings
+import asyncio
+import json
 import os
 
+RESUME_POLL_INTERVAL = 0.25  # seconds between checks of a resume job
+
 def home(request):
     """Home page view that shows different content based on authentication status"""
     return render(request, 'core/home.html')
 
 @login_required
 def docker_management(request):
-    user_container = DockerContainer.objects.filter(user=request.user).first()
+    user_container = DockerContainer.objects.filter(user=request.user, container_type='regular').first()
     
     if request.method == 'POST':
         form = DockerImageForm(request.POST)
         if form.is_valid():
             image_name = form.cleaned_data['image_name']
-            if create_container(request.user, image_name):
-                return redirect('docker-management')
+            enqueue_with_image('create', request.user, image_name)
+            messages.info(request, f"Creating container from {image_name}...")
+            return redirect('docker-management')
     else:
         form = DockerImageForm()
     
@@ -40,10 +56,12 @@ def docker_management(request):
 @login_required
 def file_manager(request):
     ensure_workspace_exists(request.user)
-    files = UserFile.objects.filter(user=request.user)
     
     if request.method == 'POST':
         form = FileUploadForm(request.POST, request.FILES)
+        if getattr(request, 'quota_exceeded', False):
+            messages.error(request, "Upload exceeds your storage quota")
+            return redirect('file-manager')
         if form.is_valid():
             new_file = form.save(commit=False)
             new_file.user = request.user
@@ -53,47 +71,266 @@ def file_manager(request):
         form = FileUploadForm()
     
     return render(request, 'core/file_manager.html', {
-        'form': form,
-        'files': files
+        'form': form
+    })
+
+@login_required
+def file_list(request):
+    """Cursor-paginated JSON listing of the user's files"""
+    try:
+        params, prefix = listing_params(request, {'name': 'name', 'size': 'size', 'date': 'uploaded_at'})
+        files = UserFile.objects.filter(user=request.user)
+        if prefix:
+            files = files.filter(name__startswith=prefix)
+        rows, cursor = paginate(files, **params)
+    except ListingError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse({
+        'results': [{
+            'id': f.id,
+            'name': f.name,
+            'size': f.size,
+            'uploaded_at': f.uploaded_at,
+            'download_url': reverse('download-file', args=[f.id]),
+            'delete_url': reverse('delete-file', args=[f.id])
+        } for f in rows],
+        'next': cursor
+    })
+
+@login_required
+def export_archive(request):
+    """Streams a zip or tar archive of selected files, models and workspace paths"""
+    fmt = request.GET.get('format', 'zip')
+    if fmt not in FORMATS:
+        return JsonResponse({'error': f"format must be one of {', '.join(FORMATS)}"}, status=400)
+
+    entries = []
+    for f in UserFile.objects.filter(user=request.user, id__in=request.GET.getlist('files')):
+        entries.append((f"files/{f.name}", f.file.path))
+    for m in AIModel.objects.filter(user=request.user, id__in=request.GET.getlist('models')):
+        entries.append((f"models/{m.name}/{os.path.basename(m.model_file.name)}", m.model_file.path))
+    workspace = os.path.realpath(get_user_workspace(request.user))
+    for path in request.GET.getlist('paths'):
+        full = os.path.realpath(os.path.join(workspace, path.strip('/')))
+        if not full.startswith(workspace + os.sep) and full != workspace:
+            return JsonResponse({'error': f"Invalid path: {path}"}, status=400)
+        if os.path.exists(full):
+            entries.append((os.path.join('workspace', os.path.relpath(full, workspace)), full))
+    if not entries:
+        return JsonResponse({'error': 'Nothing selected'}, status=400)
+
+    content_type, extension = FORMATS[fmt]
+    response = StreamingHttpResponse(
+        stream_archive(entries, fmt, compress=request.GET.get('compress', '1') != '0'),
+        content_type=content_type
+    )
+    response['Content-Disposition'] = f'attachment; filename="export.{extension}"'
+    response['X-Accel-Buffering'] = 'no'  # let nginx pass chunks through as they are made
+    return response
+
+@login_required
+def workspace_list(request):
+    """Cursor-paginated JSON listing of one workspace directory, read from the index"""
+    path = request.GET.get('path', '').strip('/')
+    try:
+        params, prefix = listing_params(request, {'name': 'name', 'size': 'size', 'date': 'mtime'})
+        entries = WorkspaceEntry.objects.filter(user=request.user, parent=path)
+        if prefix:
+            entries = entries.filter(name__startswith=prefix)
+        rows, cursor = paginate(entries, **params)
+    except ListingError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse({
+        'results': [{
+            'name': e.name,
+            'path': e.path,
+            'is_dir': e.is_dir,
+            'size': e.size,
+            'modified_at': e.mtime
+        } for e in rows],
+        'next': cursor
     })
 
+def upload_state(session):
+    return {
+        'id': str(session.pk),
+        'size': session.size,
+        'chunk_size': session.chunk_size,
+        'chunk_count': session.chunk_count,
+        'received': received_chunks(session)
+    }
+
+@login_required
+@require_http_methods(['POST'])
+def upload_create(request):
+    """Starts a resumable upload of a file or model"""
+    try:
+        session = start_upload(
+            request.user,
+            request.POST.get('kind', 'file'),
+            request.POST['filename'],
+            request.POST['size'],
+            request.POST.get('chunk_size'),
+            name=request.POST.get('name', ''),
+            framework=request.POST.get('framework', '')
+        )
+    except (KeyError, ValueError, UploadError) as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse(upload_state(session), status=201)
+
+@login_required
+@require_http_methods(['GET', 'DELETE'])
+def upload_detail(request, upload_id):
+    """Received chunks of an upload, so a client can resume it"""
+    session = UploadSession.objects.filter(pk=upload_id, user=request.user).first()
+    if session is None:
+        return JsonResponse({'error': 'Upload not found'}, status=404)
+    if request.method == 'DELETE':
+        abort_upload(session)
+        return HttpResponse(status=204)
+    return JsonResponse(upload_state(session))
+
+@login_required
+@require_http_methods(['PUT'])
+def upload_chunk(request, upload_id, index):
+    """Writes one chunk, read from the raw request body"""
+    session = UploadSession.objects.filter(pk=upload_id, user=request.user).first()
+    if session is None:
+        return JsonResponse({'error': 'Upload not found'}, status=404)
+    try:
+        write_chunk(session, index, request, request.headers.get('X-Chunk-Sha256', ''))
+    except UploadError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse({'index': index})
+
+@login_required
+@require_http_methods(['POST'])
+def upload_complete(request, upload_id):
+    """Moves a fully received upload into place"""
+    session = UploadSession.objects.filter(pk=upload_id, user=request.user).first()
+    if session is None:
+        return JsonResponse({'error': 'Upload not found'}, status=404)
+    try:
+        instance = finish_upload(session)
+    except UploadError as e:
+        return JsonResponse({'error': str(e), **upload_state(session)}, status=409)
+    return JsonResponse({'id': instance.pk, 'kind': session.kind})
+
 @login_required
 def start_container_view(request):
     """View to start a user's container"""
     if request.method == 'POST':  # Add this check for security
-        if start_container(request.user):
-            messages.success(request, "Container started successfully")
-        else:
-            messages.error(request, "Failed to start container")
+        enqueue_lifecycle('start', request.user)
+        messages.info(request, "Container start queued")
     return redirect('docker-management')
 
 @login_required
 def stop_container_view(request):
     """View to stop a user's container"""
     if request.method == 'POST':
-        if stop_container(request.user):
-            messages.success(request, "Container stopped successfully")
-        else:
-            messages.error(request, "Failed to stop container")
+        enqueue_lifecycle('stop', request.user)
+        messages.info(request, "Container stop queued")
     return redirect('docker-management')
 
 @login_required
 def delete_container_view(request):
     """View to delete a user's container"""
     if request.method == 'POST':
-        if delete_container(request.user):
-            messages.success(request, "Container deleted successfully")
-        else:
-            messages.error(request, "Failed to delete container")
+        enqueue_lifecycle('delete', request.user)
+        messages.info(request, "Container delete queued")
     return redirect('docker-management')
 
+@csrf_exempt
+@login_required
+async def resume_container(request, username, segment):
+    """
+    nginx routes requests for a suspended container here: queues its resume,
+    waits for it and sends the client back to the same URL, method and body.
+    Exempt from CSRF checks, which are the container's business: Jupyter's
+    autosave PUTs and kernel POSTs must wake it too, and all this does is
+    resume the logged-in user's own container.
+    """
+    user = await request.auser()
+    container_type = next(t for t, (s, _) in ROUTED_PORTS.items() if s == segment)
+    container = await DockerContainer.objects.filter(user=user, container_type=container_type).afirst()
+    if username != user.username or container is None:
+        return HttpResponse("Container not found", status=404)
+    if container.suspended_at is not None:
+        job = await sync_to_async(enqueue_lifecycle)('resume', user, container_type=container_type)
+        deadline = asyncio.get_running_loop().time() + settings.IDLE_RESUME_TIMEOUT
+        while job.status in Job.ACTIVE_STATUSES:
+            if asyncio.get_running_loop().time() > deadline:
+                return HttpResponse("Timed out resuming the container, try again shortly", status=504)
+            await asyncio.sleep(RESUME_POLL_INTERVAL)
+            job = await Job.objects.aget(pk=job.pk)
+        if job.status == 'failed':
+            return HttpResponse(f"Resuming the container failed: {job.message}", status=503)
+    elif container.status != 'running':
+        return HttpResponse("Container is not running", status=503)
+    else:
+        await asyncio.sleep(RESUME_POLL_INTERVAL)  # routed back already; nginx is still reloading
+    response = HttpResponse(status=307)
+    response['Location'] = request.get_full_path()
+    return response
+
+@login_required
+def job_status(request, job_id):
+    """JSON status of a job queued by, or awaited by, the user"""
+    jobs = Job.objects.all() if request.user.is_staff else Job.objects.filter(
+        Q(user=request.user) | Q(dependents__user=request.user)
+    )
+    job = jobs.filter(pk=job_id).first()
+    if job is None:
+        return JsonResponse({'error': 'Job not found'}, status=404)
+    return JsonResponse({
+        'id': str(job.pk),
+        'action': job.action,
+        'status': job.status,
+        'message': job.message,
+        'result': job.result,
+        'created_at': job.created_at,
+        'finished_at': job.finished_at
+    })
+
+@login_required
+@require_http_methods(['POST'])
+def bulk_operation(request):
+    """
+    Staff only: fans an action out over the containers matching a selection
+    of container_type, usernames, node and status; returns the batch progress.
+    """
+    if not request.user.is_staff:
+        return JsonResponse({'error': 'Staff only'}, status=403)
+    try:
+        body = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({'error': 'Body must be JSON'}, status=400)
+    selection = {key: body[key] for key in ('container_type', 'usernames', 'node', 'status') if key in body}
+    if not isinstance(selection.get('usernames', []), list):
+        return JsonResponse({'error': 'usernames must be a list'}, status=400)
+    try:
+        batch = start_batch(
+            body.get('action'), select_containers(**selection), request.user, body.get('image_name'), selection
+        )
+    except BulkError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse(batch_progress(batch), status=202)
+
+@login_required
+def bulk_status(request, batch_id):
+    """Staff only: progress and per-container errors of a bulk operation"""
+    if not request.user.is_staff:
+        return JsonResponse({'error': 'Staff only'}, status=403)
+    batch = JobBatch.objects.filter(pk=batch_id).first()
+    if batch is None:
+        return JsonResponse({'error': 'Batch not found'}, status=404)
+    return JsonResponse(batch_progress(batch))
+
 @login_required
 def download_file(request, file_id):
     try:
         file_obj = UserFile.objects.get(id=file_id, user=request.user)
-        response = FileResponse(file_obj.file)
-        response['Content-Disposition'] = f'attachment; filename="{file_obj.filename()}"'
-        return response
+        return serve_file(file_obj.file, file_obj.filename())
     except UserFile.DoesNotExist:
         messages.error(request, "File not found")
         return redirect('file-manager')
@@ -102,9 +339,7 @@ def download_file(request, file_id):
 def delete_file(request, file_id):
     try:
         file_obj = UserFile.objects.get(id=file_id, user=request.user)
-        file_path = file_obj.file.path
-        if os.path.exists(file_path):
-            os.remove(file_path)
+        file_obj.file.delete(save=False)
         file_obj.delete()
         messages.success(request, "File deleted successfully")
     except UserFile.DoesNotExist:
@@ -118,6 +353,25 @@ def public_dashboard(request):
         'stats': stats
     })
 
+def metrics_history(request):
+    """JSON history of the host series, or of one of the user's containers"""
+    series = request.GET.get('series', 'host')
+    if series == 'host':
+        key = host_key()
+    elif request.user.is_authenticated and DockerContainer.objects.filter(user=request.user, container_id=series).exists():
+        key = container_key(series)
+    else:
+        return JsonResponse({'error': 'Series not found'}, status=404)
+
+    try:
+        start = float(request.GET['start']) if 'start' in request.GET else None
+        end = float(request.GET['end']) if 'end' in request.GET else None
+        resolution = float(request.GET['resolution']) if 'resolution' in request.GET else None
+    except ValueError:
+        return JsonResponse({'error': 'start, end and resolution must be numbers'}, status=400)
+
+    return JsonResponse(metrics_store.query(key, start, end, resolution))
+
 @login_required
 def private_dashboard(request):
     """Private user-specific monitoring dashboard"""
@@ -126,51 +380,179 @@ def private_dashboard(request):
     
     return render(request, 'core/private_dashboard.html', {
         'system_stats': system_stats,
+        'container': DockerContainer.objects.filter(user=request.user, container_type='regular').first(),
         'container_stats': container_stats,
         'user': request.user
     })
     
 @login_required
 def ai_dashboard(request):
-    models = AIModel.objects.filter(user=request.user)
-    jupyter_url = None
-    jupyter_running = False
     
     if request.method == 'POST':
         if 'start_jupyter' in request.POST:
-            jupyter_url = create_jupyter_container(request.user)
-            messages.success(request, "Jupyter Notebook started successfully")
+            enqueue_with_image('jupyter_start', request.user, JUPYTER_IMAGE, container_type='jupyter')
+            messages.info(request, "Starting Jupyter Notebook...")
+            return redirect('ai-dashboard')
         elif 'stop_jupyter' in request.POST:
-            if manage_container(request.user, 'stop', container_type='jupyter'):
-                messages.success(request, "Jupyter Notebook stopped successfully")
-            else:
-                messages.error(request, "Failed to stop Jupyter Notebook")
+            enqueue_lifecycle('stop', request.user, container_type='jupyter')
+            messages.info(request, "Stopping Jupyter Notebook...")
+            return redirect('ai-dashboard')
         elif 'upload_model' in request.POST:
+            if getattr(request, 'quota_exceeded', False):
+                messages.error(request, "Upload exceeds your storage quota")
+                return redirect('ai-dashboard')
             form = AIModelForm(request.POST, request.FILES)
             if form.is_valid():
                 model = form.save(commit=False)
                 model.user = request.user
                 model.save()
-                messages.success(request, "Model uploaded successfully")
+                messages.success(request, "Model uploaded, it is being validated")
                 return redirect('ai-dashboard')
     
-    # Check if Jupyter is running
-    try:
-        if client:
-            client.containers.get(f"jupyter_{request.user.id}_{request.user.username}")
-            jupyter_running = True
-    except:
-        pass
+    jupyter = DockerContainer.objects.filter(user=request.user, container_type='jupyter').first()
+    # A suspended notebook counts as running: opening it resumes it
+    jupyter_running = bool(jupyter and (jupyter.status == 'running' or jupyter.suspended_at))
     
     return render(request, 'core/ai_dashboard.html', {
-        'models': models,
-        'jupyter_url': jupyter_url,
+        'jupyter_url': jupyter.access_url if jupyter_running else None,
         'jupyter_running': jupyter_running,
         'form': AIModelForm()
     })
 
 @login_required
-def delete_model(reques, model_id):
+def download_model(request, model_id):
+    try:
+        model = AIModel.objects.get(id=model_id, user=request.user)
+        return serve_file(model.model_file, os.path.basename(model.model_file.name))
+    except AIModel.DoesNotExist:
+        messages.error(request, "Model not found")
+        return redirect('ai-dashboard')
+
+@login_required
+def model_list(request):
+    """Cursor-paginated JSON listing of the user's models"""
+    try:
+        params, prefix = listing_params(request, {'name': 'name', 'size': 'size', 'date': 'created_at'})
+        models = AIModel.objects.filter(user=request.user).prefetch_related('variants')
+        if prefix:
+            models = models.filter(name__startswith=prefix)
+        rows, cursor = paginate(models, **params)
+    except ListingError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse({
+        'results': [{
+            'id': m.id,
+            'name': m.name,
+            'framework': m.get_framework_display(),
+            'size': m.size,
+            'created_at': m.created_at,
+            'status': m.status,
+            'status_message': m.status_message,
+            'inputs': m.inputs,
+            'outputs': m.outputs,
+            'parameter_count': m.parameter_count,
+            'latency_ms': m.latency_ms,
+            'variants': [{
+                'kind': v.kind,
+                'status': v.status,
+                'status_message': v.status_message,
+                'size': v.size,
+                'latency_ms': v.latency_ms
+            } for v in m.variants.all()],
+            'convert_url': reverse('convert-model', args=[m.id]),
+            'download_url': reverse('download-model', args=[m.id]),
+            'delete_url': reverse('delete-model', args=[m.id])
+        } for m in rows],
+        'next': cursor
+    })
+
+@csrf_exempt
+@require_http_methods(['POST'])
+async def predict(request, model_id):
+    """
+    Runs inference on a model; concurrent requests share batched forward passes.
+    An API endpoint: clients send `Authorization: Bearer <token>` from api_tokens,
+    and without a session cookie there is nothing for CSRF to protect.
+    """
+    user = await sync_to_async(token_user)(request)
+    if user is None:
+        return JsonResponse({'error': 'A valid API token is required'}, status=401, headers={'WWW-Authenticate': SCHEME})
+    model = await AIModel.objects.filter(id=model_id, user=user).afirst()
+    if model is None:
+        return JsonResponse({'error': 'Model not found'}, status=404)
+    if model.status == 'failed':
+        return JsonResponse({'error': f"Model failed validation: {model.status_message}"}, status=409)
+    try:
+        inputs = json.loads(request.body)['inputs']
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'error': 'Body must be JSON with an "inputs" field'}, status=400)
+    # Serve the fastest converted variant when it beats the uploaded file
+    variant = None
+    if model.latency_ms is not None:
+        variant = await model.variants.filter(
+            status='ready', latency_ms__lt=model.latency_ms
+        ).order_by('latency_ms').afirst()
+    try:
+        outputs = await serving_engine.predict(model, user, inputs, variant)
+    except ServingError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    except ModelRuntimeError as e:
+        return JsonResponse({'error': str(e)}, status=503)
+    except asyncio.TimeoutError:
+        return JsonResponse({'error': 'Prediction timed out'}, status=504)
+    return JsonResponse({'outputs': {name: value.tolist() for name, value in outputs.items()}})
+
+@login_required
+@require_http_methods(['GET', 'POST'])
+def api_tokens(request):
+    """The user's API tokens; POST creates one and returns its key, which is never shown again"""
+    if request.method == 'POST':
+        name = request.POST.get('name', '').strip()
+        if not name:
+            return JsonResponse({'error': 'A token name is required'}, status=400)
+        token, key = issue_token(request.user, name)
+        return JsonResponse({'id': token.pk, 'name': token.name, 'token': key}, status=201)
+    return JsonResponse({'tokens': [{
+        'id': token.pk,
+        'name': token.name,
+        'created_at': token.created_at.isoformat(),
+        'last_used_at': token.last_used_at.isoformat() if token.last_used_at else None
+    } for token in request.user.api_tokens.all()]})
+
+@login_required
+@require_http_methods(['DELETE'])
+def api_token_detail(request, token_id):
+    """Revokes one of the user's API tokens"""
+    if not request.user.api_tokens.filter(pk=token_id).delete()[0]:
+        return JsonResponse({'error': 'Token not found'}, status=404)
+    return HttpResponse(status=204)
+
+@login_required
+async def serving_stats(request):
+    """Residency and cache metrics for the user's models, plus engine totals for staff"""
+    user = await request.auser()
+    ids = [pk async for pk in AIModel.objects.filter(user=user).values_list('id', flat=True)]
+    data = {'models': {pk: serving_engine.model_stats(pk) for pk in ids}}
+    if user.is_staff:
+        data['engine'] = serving_engine.summary()
+    return JsonResponse(data)
+
+@login_required
+@require_http_methods(['POST'])
+def convert_model(request, model_id):
+    """Queues ONNX export and quantization of a validated model"""
+    model = AIModel.objects.filter(id=model_id, user=request.user).first()
+    if model is None:
+        messages.error(request, "Model not found")
+    elif model.status != 'ready':
+        messages.error(request, "Only models that passed validation can be optimized")
+    else:
+        enqueue_model_conversion(model, conversion_kinds(model))
+        messages.info(request, f"Optimizing {model.name}...")
+    return redirect('ai-dashboard')
+
+@login_required
+def delete_model(request, model_id):
     try:
         model = AIModel.objects.get(id=model_id, user=request.user)
         model.delete()
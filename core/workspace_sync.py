@@ -0,0 +1,292 @@
+import asyncio
+import ctypes
+import errno
+import logging
+import os
+import stat
+import struct
+from collections import defaultdict
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from users.models import CustomUser
+from .file_utils import get_user_workspace
+from .models import WorkspaceEntry
+
+logger = logging.getLogger(__name__)
+
+# inotify constants from linux/inotify.h
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO
+              | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_ONLYDIR)
+EVENT_HEADER = struct.Struct('iIII')  # wd, mask, cookie, len
+
+
+class Inotify:
+    """Minimal ctypes binding to the Linux inotify API"""
+
+    def __init__(self):
+        self.libc = ctypes.CDLL(None, use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+
+    def add_watch(self, path):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err), path)
+        return wd
+
+    def rm_watch(self, wd):
+        self.libc.inotify_rm_watch(self.fd, wd)
+
+    def read_events(self):
+        """Yields (wd, mask, name) for every queued event"""
+        while True:
+            try:
+                data = os.read(self.fd, 65536)
+            except BlockingIOError:
+                return
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+                offset += EVENT_HEADER.size
+                name = data[offset:offset + length].rstrip(b'\0')
+                offset += length
+                yield wd, mask, os.fsdecode(name)
+
+    def close(self):
+        os.close(self.fd)
+
+
+def split_path(rel):
+    parent, _, name = rel.rpartition('/')
+    return parent, name
+
+def stat_entry(user_id, root, rel):
+    """WorkspaceEntry for a path, or None when it is gone (symlinks are not indexed)"""
+    try:
+        st = os.lstat(os.path.join(root, rel))
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+    if stat.S_ISLNK(st.st_mode):
+        return None
+    parent, name = split_path(rel)
+    is_dir = stat.S_ISDIR(st.st_mode)
+    return WorkspaceEntry(
+        user_id=user_id, parent=parent, name=name,
+        is_dir=is_dir, size=0 if is_dir else st.st_size, mtime=st.st_mtime
+    )
+
+def write_entries(upserts, removed):
+    """Applies one batch: upserts entries and deletes removed paths with everything below them"""
+    batch = settings.WORKSPACE_SYNC_BATCH
+    with transaction.atomic():
+        for user_id, rel in removed:
+            parent, name = split_path(rel)
+            WorkspaceEntry.objects.filter(user_id=user_id).filter(
+                Q(parent=parent, name=name) | Q(parent=rel) | Q(parent__startswith=f"{rel}/")
+            ).delete()
+        for i in range(0, len(upserts), batch):
+            WorkspaceEntry.objects.bulk_create(
+                upserts[i:i + batch],
+                update_conflicts=True,
+                unique_fields=['user', 'parent', 'name'],
+                update_fields=['is_dir', 'size', 'mtime']
+            )
+
+def apply_changes(user_id, root, paths):
+    upserts, removed = [], []
+    for rel in paths:
+        entry = stat_entry(user_id, root, rel)
+        if entry is None:
+            removed.append((user_id, rel))
+        else:
+            upserts.append(entry)
+    write_entries(upserts, removed)
+
+def walk(root):
+    """Yields the relative path of every file and directory below `root`"""
+    stack = ['']
+    while stack:
+        rel_dir = stack.pop()
+        try:
+            entries = os.scandir(os.path.join(root, rel_dir))
+        except OSError:
+            continue
+        with entries:
+            for entry in entries:
+                rel = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(rel)
+                yield rel
+
+def scan_workspace(user_id, root):
+    """Full reconcile of one workspace, writing only the rows that differ"""
+    known = {
+        (parent, name): (is_dir, size, mtime)
+        for parent, name, is_dir, size, mtime in WorkspaceEntry.objects.filter(user_id=user_id).values_list(
+            'parent', 'name', 'is_dir', 'size', 'mtime'
+        )
+    }
+    upserts = []
+    for rel in walk(root):
+        entry = stat_entry(user_id, root, rel)
+        if entry is None:
+            continue
+        key = (entry.parent, entry.name)
+        if known.pop(key, None) != (entry.is_dir, entry.size, entry.mtime):
+            upserts.append(entry)
+    removed = [(user_id, f"{parent}/{name}" if parent else name) for parent, name in known]
+    write_entries(upserts, removed)
+    return len(upserts), len(removed)
+
+def workspace_roots():
+    return {user.id: get_user_workspace(user) for user in CustomUser.objects.all()}
+
+
+class WorkspaceSync:
+    """
+    Keeps WorkspaceEntry in step with every user workspace.
+
+    Directories are watched with inotify; changed paths are collected per user
+    and written in one batch once events have been quiet for
+    WORKSPACE_SYNC_DEBOUNCE seconds (or WORKSPACE_SYNC_MAX_DELAY passed), so a
+    burst like a `git clone` costs a few transactions. A periodic full scan
+    repairs anything missed (queue overflows, watch limits), and new
+    workspaces are picked up every WORKSPACE_DISCOVERY_INTERVAL, which is also
+    the scan interval when inotify is unavailable.
+    """
+
+    def __init__(self):
+        try:
+            self.inotify = Inotify()
+        except (OSError, AttributeError) as e:
+            logger.warning(f"inotify unavailable, relying on periodic scans: {e}")
+            self.inotify = None
+        self.watches = {}  # wd -> (user_id, root, relative dir)
+        self.roots = {}  # user_id -> workspace root
+        self.dirty = defaultdict(set)
+        self.rescan = set()
+        self.first_change = self.last_change = None
+
+    def watch_tree(self, user_id, root, rel=''):
+        """Watches `rel` and its subdirectories, returning the paths found below it"""
+        found = []
+        for sub in [rel] + [f"{rel}/{p}" if rel else p for p in walk(os.path.join(root, rel))]:
+            path = os.path.join(root, sub)
+            if sub != rel:
+                found.append(sub)
+            if not os.path.isdir(path) or os.path.islink(path):
+                continue
+            try:
+                self.watches[self.inotify.add_watch(path)] = (user_id, root, sub)
+            except OSError as e:
+                if e.errno == errno.ENOSPC:
+                    logger.error("inotify watch limit reached, raise fs.inotify.max_user_watches")
+                    self.rescan.add(user_id)
+                    break
+        return found
+
+    def unwatch_tree(self, user_id, rel):
+        for wd, (owner, _, sub) in list(self.watches.items()):
+            if owner == user_id and (sub == rel or sub.startswith(f"{rel}/")):
+                self.inotify.rm_watch(wd)
+                del self.watches[wd]
+
+    def mark(self, user_id, rel):
+        now = asyncio.get_running_loop().time()
+        self.first_change = self.first_change or now
+        self.last_change = now
+        self.dirty[user_id].add(rel)
+
+    def handle_events(self):
+        for wd, mask, name in self.inotify.read_events():
+            if mask & IN_Q_OVERFLOW:
+                self.rescan.update(self.roots)
+                continue
+            if mask & IN_IGNORED:
+                self.watches.pop(wd, None)
+                continue
+            if wd not in self.watches or mask & IN_DELETE_SELF:
+                continue
+            user_id, root, rel_dir = self.watches[wd]
+            rel = f"{rel_dir}/{name}" if rel_dir else name
+            self.mark(user_id, rel)
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    # Files may appear before the watch is in place
+                    for sub in self.watch_tree(user_id, root, rel):
+                        self.mark(user_id, sub)
+                elif mask & IN_MOVED_FROM:
+                    self.unwatch_tree(user_id, rel)
+
+    async def flush(self):
+        dirty, self.dirty = self.dirty, defaultdict(set)
+        self.first_change = self.last_change = None
+        for user_id, paths in dirty.items():
+            try:
+                await database_sync_to_async(apply_changes)(user_id, self.roots[user_id], paths)
+            except Exception as e:
+                logger.error(f"Workspace sync for user {user_id} failed: {e}")
+                self.rescan.add(user_id)
+
+    async def scan(self, full):
+        """Watches new workspaces and reconciles them, or every workspace when `full`"""
+        roots = await database_sync_to_async(workspace_roots)()
+        for user_id, root in roots.items():
+            if not os.path.isdir(root):
+                continue
+            if user_id not in self.roots:
+                self.roots[user_id] = root
+                self.rescan.add(user_id)
+                if self.inotify:
+                    self.watch_tree(user_id, root)
+        if full or not self.inotify:
+            self.rescan.update(self.roots)
+        rescan, self.rescan = self.rescan, set()
+        for user_id in rescan:
+            try:
+                await database_sync_to_async(scan_workspace)(user_id, self.roots[user_id])
+            except Exception as e:
+                logger.error(f"Workspace scan for user {user_id} failed: {e}")
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        if self.inotify:
+            loop.add_reader(self.inotify.fd, self.handle_events)
+        last_scan = last_discovery = None
+        try:
+            while True:
+                now = loop.time()
+                if last_scan is None or now - last_scan >= settings.WORKSPACE_SCAN_INTERVAL:
+                    last_scan = last_discovery = now
+                    await self.scan(full=True)
+                elif self.rescan or now - last_discovery >= settings.WORKSPACE_DISCOVERY_INTERVAL:
+                    last_discovery = now
+                    await self.scan(full=False)
+                if self.last_change is not None and (
+                    now - self.last_change >= settings.WORKSPACE_SYNC_DEBOUNCE
+                    or now - self.first_change >= settings.WORKSPACE_SYNC_MAX_DELAY
+                ):
+                    await self.flush()
+                await asyncio.sleep(min(1, settings.WORKSPACE_SYNC_DEBOUNCE))
+        finally:
+            if self.inotify:
+                loop.remove_reader(self.inotify.fd)
+                self.inotify.close()
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-18 19:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='storage_used',
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
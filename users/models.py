@@ -12,6 +12,11 @@ class CustomUser(AbstractUser):
     storage_limit = models.PositiveIntegerField(default=51200)  # 50GB in MB
     cpu_limit = models.PositiveIntegerField(default=4)  # 4 cores
     gpu_access = models.BooleanField(default=False)
+    storage_used = models.BigIntegerField(default=0)  # bytes, maintained by core.quota
+
+    @property
+    def storage_limit_bytes(self):
+        return self.storage_limit * 1024 * 1024
     
     def __str__(self):
         return self.username
\ No newline at end of file